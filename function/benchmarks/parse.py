@@ -0,0 +1,56 @@
+"""Compare the cost of parsing a credential report into Users and UserRecords.
+
+Usage: poetry run python -m benchmarks.parse [SIZE ...]
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic import generate_report
+from src.report import CredentialReport
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+
+def parse_users(report: CredentialReport) -> list:
+    return list(report)
+
+
+def parse_records(report: CredentialReport) -> list:
+    return list(report.records())
+
+
+def measure(parse, report: CredentialReport) -> tuple[float, int]:
+    """Return the time taken to parse the report and the memory retained."""
+    gc.collect()
+    start = time.perf_counter()
+    parsed = parse(report)
+    elapsed = time.perf_counter() - start
+    del parsed
+
+    gc.collect()
+    tracemalloc.start()
+    parsed = parse(report)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del parsed
+
+    return elapsed, retained
+
+
+def main(sizes: list[int]):
+    print(f"{'users':>8} {'model':>10} {'us/user':>10} {'retained MiB':>13}")
+    for size in sizes:
+        report = CredentialReport(generate_report(size))
+        for name, parse in (("User", parse_users), ("UserRecord", parse_records)):
+            elapsed, retained = measure(parse, report)
+            print(
+                f"{size:>8} {name:>10} {elapsed / size * 1e6:>10.1f} "
+                f"{retained / 2**20:>13.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,176 @@
+"""Measure how each stage of a run scales with the number of users.
+
+Every size runs in a fresh process so the peak RSS reported is for that size
+alone. IAM is mocked with moto, except for the credential report which moto
+can't produce at this scale, so the synthetic report is served in its place.
+
+Usage: poetry run python -m benchmarks.suite [--sizes 1000 10000] [--output FILE]
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+from benchmarks.synthetic import generate_report
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_OUTPUT = "benchmark-results.json"
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(results: List[dict], size: int, stage: str, func: Callable):
+    start = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - start
+    results.append(
+        {
+            "users": size,
+            "stage": stage,
+            "seconds": seconds,
+            "users_per_second": size / seconds if seconds else None,
+            "peak_rss_mib": peak_rss_mib(),
+        }
+    )
+    print(f"{size:>8} {stage:<24} {seconds:>9.3f}s {peak_rss_mib():>8.1f} MiB")
+
+    return value
+
+
+def serve_report(iam_client, content: bytes):
+    """Make the mocked client return the synthetic credential report."""
+    response = {
+        "Content": content,
+        "ReportFormat": "text/csv",
+        "GeneratedTime": datetime.datetime.now(datetime.timezone.utc),
+    }
+    iam_client.generate_credential_report = lambda: {"State": "COMPLETE"}
+    iam_client.get_credential_report = lambda: response
+
+
+def run_size(size: int) -> List[dict]:
+    from moto import mock_aws
+
+    from src.account import monitor_account
+    from src.classifier import ReportColumns, classify
+    from src.clients import create_client
+    from src.config import get_settings
+    from src.credential_report import populate_model_from_args
+    from src.helpers import is_inactive
+    from src.models import User
+    from src.remediation import Remediator
+    from src.report import CredentialReport, iter_report_rows
+
+    settings = get_settings()
+    thresholds = (
+        settings.inactivity_threshold_days,
+        settings.grace_period_threshold_days,
+    )
+    results: List[dict] = []
+    content = generate_report(size)
+    report = CredentialReport(content)
+
+    timed(
+        results,
+        size,
+        "parse_populate_model",
+        lambda: [
+            populate_model_from_args(User, row)
+            for row in list(iter_report_rows(content))[1:]
+        ],
+    )
+    users = timed(results, size, "parse_users", lambda: list(report))
+    timed(results, size, "parse_records", lambda: list(report.records()))
+    timed(
+        results,
+        size,
+        "classify_is_inactive",
+        lambda: [is_inactive(user, *thresholds) for user in users],
+    )
+    columns = timed(
+        results, size, "parse_columns", lambda: ReportColumns.from_report(content)
+    )
+    classification = timed(
+        results, size, "classify_columns", lambda: classify(columns, *thresholds)
+    )
+    inactive_users = report.users_at(classification.inactive_indices())
+    del users
+
+    def mocked_iam_client():
+        """A moto IAM client in which the inactive users exist."""
+        iam_client = create_client("iam", region_name="eu-west-2")
+        for user in inactive_users:
+            iam_client.create_user(UserName=user.username)
+            iam_client.create_login_profile(
+                UserName=user.username, Password="benchmark"
+            )
+            if user.access_key_1_active:
+                iam_client.create_access_key(UserName=user.username)
+
+        return iam_client
+
+    with mock_aws():
+        iam_client = mocked_iam_client()
+        timed(
+            results,
+            size,
+            "remediate",
+            lambda: Remediator(iam_client).disable_users(inactive_users),
+        )
+
+    with mock_aws():
+        iam_client = mocked_iam_client()
+        serve_report(iam_client, content)
+        timed(
+            results,
+            size,
+            "end_to_end",
+            lambda: monitor_account(iam_client, report_only=False),
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    # moto needs credentials, even fake ones
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-2")
+    # Keep the per-user log lines out of the results
+    os.environ.setdefault("POWERTOOLS_LOG_LEVEL", "WARNING")
+
+    results: List[dict] = []
+    context = multiprocessing.get_context("spawn")
+    for size in args.sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results += executor.submit(run_size, size).result()
+
+    output: Dict[str, object] = {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
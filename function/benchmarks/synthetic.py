@@ -0,0 +1,70 @@
+import datetime
+import random
+
+HEADER = (
+    "user,arn,user_creation_time,password_enabled,password_last_used,"
+    "password_last_changed,password_next_rotation,mfa_active,access_key_1_active,"
+    "access_key_1_last_rotated,access_key_1_last_used_date,"
+    "access_key_1_last_used_region,access_key_1_last_used_service,"
+    "access_key_2_active,access_key_2_last_rotated,access_key_2_last_used_date,"
+    "access_key_2_last_used_region,access_key_2_last_used_service,cert_1_active,"
+    "cert_1_last_rotated,cert_2_active,cert_2_last_rotated"
+)
+
+
+def timestamp(now: datetime.datetime, rng: random.Random, max_days: int) -> str:
+    """A timestamp up to max_days before now (or after it, if negative)."""
+    seconds = rng.randint(*sorted((0, max_days * 86400)))
+    moment = now - datetime.timedelta(seconds=seconds)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def generate_row(index: int, now: datetime.datetime, rng: random.Random) -> str:
+    """Generate a report row, mixing the states seen in real reports: console
+    users who have or haven't logged in, programmatic only users, and users
+    with zero, one or two access keys (used or never used)."""
+    username = f"user-{index}"
+    created = timestamp(now, rng, 720)
+    if rng.random() < 0.8:
+        password = [
+            "true",
+            rng.choice([timestamp(now, rng, 120), "no_information"]),
+            timestamp(now, rng, 365),
+            rng.choice(["N/A", "not_supported", timestamp(now, rng, -90)]),
+        ]
+    else:
+        password = ["false", "N/A", "N/A", "N/A"]
+
+    row = [username, f"arn:aws:iam::123456789012:user/{username}", created]
+    row += password
+    row.append(rng.choice(["true", "false"]))
+    for _ in range(2):
+        if rng.random() < 0.3:
+            row += ["true", timestamp(now, rng, 365)]
+            if rng.random() < 0.8:
+                row += [timestamp(now, rng, 60), "eu-west-2", "s3"]
+            else:
+                row += ["N/A", "N/A", "N/A"]
+        else:
+            row += ["false", "N/A", "N/A", "N/A", "N/A"]
+    row += ["false", "N/A", "false", "N/A"]
+
+    return ",".join(row)
+
+
+def generate_report(
+    users: int, seed: int = 0, now: datetime.datetime | None = None
+) -> bytes:
+    """Generate a synthetic credential report CSV with the given number of users."""
+    rng = random.Random(seed)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    rows = [HEADER]
+    rows.append(
+        "<root_account>,arn:aws:iam::123456789012:root,"
+        f"{timestamp(now, rng, 720)},not_supported,{timestamp(now, rng, 30)},"
+        "not_supported,not_supported,true,false,N/A,N/A,N/A,N/A,false,N/A,N/A,"
+        "N/A,N/A,false,N/A,false,N/A"
+    )
+    rows += [generate_row(index, now, rng) for index in range(users - 1)]
+
+    return ("\n".join(rows) + "\n").encode("utf8")
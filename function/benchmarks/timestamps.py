@@ -0,0 +1,91 @@
+"""Micro-benchmarks for decoding credential report timestamp columns.
+
+Compares building Users with populate_model_from_args, where pydantic decodes
+every column, against the timestamp decoders in src.timestamps, per row and
+per timestamp cell.
+
+Usage: poetry run python -m benchmarks.timestamps [SIZE]
+"""
+
+import calendar
+import datetime
+import sys
+import timeit
+
+from benchmarks.synthetic import generate_report
+from src.classifier import SENTINELS
+from src.credential_report import populate_model_from_args
+from src.models import TIMESTAMP_FIELDS, User, field_adapter, map_report_header
+from src.report import iter_report_rows
+from src.timestamps import decode_timestamp, epoch_seconds
+
+DEFAULT_SIZE = 10_000
+REPEAT = 5
+
+
+def report_rows(size: int) -> tuple[list[list[str]], list[int]]:
+    """Return the report's rows and the positions of its timestamp columns."""
+    rows = iter_report_rows(generate_report(size))
+    header = next(rows)
+    columns = [
+        index
+        for index, field in map_report_header(header).items()
+        if field in TIMESTAMP_FIELDS
+    ]
+
+    return [row for row in rows if row], columns
+
+
+def pydantic_timestamp(value: str):
+    return field_adapter("password_last_used").validate_python(value)
+
+
+def timegm_epoch(value: str) -> int:
+    if value in SENTINELS:
+        return SENTINELS[value]
+    moment = datetime.datetime.fromisoformat(value)
+    return calendar.timegm(moment.replace(tzinfo=None).timetuple())
+
+
+def fast_epoch(value: str) -> int:
+    sentinel = SENTINELS.get(value)
+    return sentinel if sentinel is not None else epoch_seconds(value)
+
+
+def best_of(function, values) -> float:
+    return min(
+        timeit.repeat(
+            lambda: [function(value) for value in values], number=1, repeat=REPEAT
+        )
+    )
+
+
+def main(size: int):
+    rows, columns = report_rows(size)
+    cells = [row[index] for row in rows for index in columns]
+    print(f"{size} rows, {len(cells)} timestamp cells, best of {REPEAT}")
+
+    row_cases = (
+        ("populate_model_from_args", lambda row: populate_model_from_args(User, row)),
+        (
+            "decode_timestamp per row",
+            lambda row: [decode_timestamp(row[index]) for index in columns],
+        ),
+    )
+    for name, function in row_cases:
+        seconds = best_of(function, rows)
+        print(f"{name:>28} {seconds / len(rows) * 1e6:>8.2f} us/row")
+
+    cell_cases = (
+        ("pydantic datetime", pydantic_timestamp),
+        ("decode_timestamp", decode_timestamp),
+        ("fromisoformat + timegm", timegm_epoch),
+        ("epoch_seconds", fast_epoch),
+    )
+    for name, function in cell_cases:
+        seconds = best_of(function, cells)
+        print(f"{name:>28} {seconds / len(cells) * 1e9:>8.0f} ns/cell")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE)
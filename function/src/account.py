@@ -0,0 +1,683 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+from src.activity import (
+    ACTIVITY_INDEX,
+    CONSOLE_LOGIN,
+    ActivityEvent,
+    ActivityIndex,
+    Thresholds,
+    UserActivity,
+    activities_from_columns,
+    open_activity_index,
+)
+from src.checkpoint import (
+    Checkpoint,
+    CheckpointStore,
+    Deadline,
+    PendingUser,
+    open_checkpoint_store,
+    remediate_in_chunks,
+    resumable,
+)
+from src.classifier import ReportColumns, classify, reference_now, to_epoch
+from src.config import get_settings
+from src.exemptions import Exemptions
+from src.instrumentation import get_instrumentation
+from src.listing import get_first_report
+from src.logger import logger
+from src.remediation import (
+    Outcome,
+    RemediationPlan,
+    RemediationResult,
+    Remediator,
+    is_no_such_entity,
+    plan_remediation,
+)
+from src.report import CREDENTIAL_REPORT, CredentialReport
+from src.results import (
+    ResultSink,
+    UserResult,
+    exempt_result,
+    format_login,
+    service_active_result,
+)
+from src.retry import call_with_retry
+from src.rules import CONSOLE_INACTIVE, Verdict, compile_rules, evaluate
+from src.service_access import ServiceAccessJobs
+from src.state import SqliteStateStore, diff_states
+
+CONSOLE_ONLY = (CONSOLE_INACTIVE,)
+
+
+@dataclass
+class AccountSummary:
+    account: str
+    users: int = 0
+    inactive: int = 0
+    disabled: int = 0
+    already_disabled: int = 0
+    failed: int = 0
+    # Inactive users left alone by exempt_username_patterns or exempt_tags
+    exempt: int = 0
+    # Inactive users who kept their access keys, having recently accessed a
+    # service, and no longer count as inactive when nothing else is disabled
+    service_active: int = 0
+    # Only known when a state store keeps the previous run's classification
+    newly_inactive: Optional[List[str]] = None
+    # Where the users were read from: the credential report, the listed
+    # users or the activity index
+    source: Optional[str] = None
+    # Set when the run stopped before the timeout with users left to disable
+    continuation_token: Optional[str] = None
+    # Users matching each rule, when rules other than console-inactive are enabled
+    rule_matches: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def monitor_account(
+    iam_client,
+    report_only: bool,
+    account: str = "self",
+    max_workers: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
+    sink: Optional[ResultSink] = None,
+    continuation_token: Optional[str] = None,
+) -> AccountSummary:
+    """Find the inactive users in an account and, unless report_only, disable them.
+
+    With a checkpoint store configured, users are disabled in chunks until
+    the deadline, and an unfinished run is resumed before anything else,
+    unless the continuation token given is another run's.
+    With an activity index configured, the users due to be disabled are
+    read from the index, and the credential report is only used to
+    reconcile it periodically. Each inactive user's result is written to the
+    sink, when given.
+    """
+    settings = get_settings()
+    inactivity_threshold = settings.inactivity_threshold_days
+    grace_period_threshold = settings.grace_period_threshold_days
+
+    instrumentation = get_instrumentation()
+
+    store = None if report_only else open_checkpoint_store(settings)
+    if store is not None:
+        checkpoint = store.load(account)
+        if resumable(checkpoint, continuation_token):
+            assert checkpoint is not None
+            logger.info(
+                f"Resuming with {len(checkpoint.pending)} users left to disable.",
+                account=account,
+                continuation_token=checkpoint.token,
+            )
+            summary = AccountSummary(account, inactive=checkpoint.total)
+            finish_checkpoint(
+                Remediator(iam_client, max_workers),
+                store,
+                checkpoint,
+                summary,
+                deadline,
+                sink,
+            )
+            return summary
+        if checkpoint is not None:
+            store.delete(account)
+
+    # The index and the batch classifier cover the default, console only, rule set
+    console_only = tuple(settings.enabled_rules) == CONSOLE_ONLY
+    index = open_activity_index(settings) if console_only else None
+    thresholds = Thresholds.from_settings(settings)
+    if index is not None:
+        now = reference_now()
+        reconciliation = index.reconciliation(account)
+        interval = settings.activity_reconcile_interval_hours * 60 * 60
+        if reconciliation is not None and not reconciliation.is_due(
+            thresholds, interval, now
+        ):
+            return monitor_from_index(
+                iam_client,
+                index,
+                report_only,
+                account,
+                now,
+                thresholds,
+                max_workers,
+                store,
+                deadline,
+                sink,
+            )
+        logger.info("Reconciling the activity index", account=account)
+
+    credential_report = get_first_report(iam_client)
+
+    if not console_only:
+        return apply_rules(
+            iam_client,
+            credential_report,
+            report_only,
+            account,
+            max_workers,
+            store,
+            deadline,
+            sink,
+        )
+
+    # Classify from the report columns
+    with instrumentation.phase("parse"):
+        columns = ReportColumns.from_report(credential_report.content)
+    with instrumentation.phase("classify"):
+        classification = classify(columns, inactivity_threshold, grace_period_threshold)
+
+    newly_inactive: Optional[List[str]] = None
+    if settings.state_store_path:
+        with instrumentation.phase("state"):
+            state_store = SqliteStateStore(settings.state_store_path, account)
+            diff = diff_states(
+                columns,
+                classification,
+                state_store.load(),
+                inactivity_threshold,
+                grace_period_threshold,
+            )
+            state_store.apply(diff)
+        newly_inactive = diff.newly_inactive
+
+    if index is not None:
+        if credential_report.source == CREDENTIAL_REPORT:
+            with instrumentation.phase("index"):
+                index.reconcile(
+                    account, activities_from_columns(columns), thresholds, now
+                )
+        else:
+            # Without password_last_changed no one would become due
+            logger.warning(
+                "Not reconciling the activity index with the listed users",
+                account=account,
+            )
+
+    # Only build Users for the inactive rows
+    with instrumentation.phase("parse"):
+        inactive_console_users = credential_report.users_at(
+            classification.inactive_indices()
+        )
+
+    summary = AccountSummary(
+        account,
+        len(columns),
+        len(inactive_console_users),
+        source=credential_report.source,
+        newly_inactive=newly_inactive,
+    )
+    logger.info(f"Found {summary.users} user accounts.", account=account)
+    if newly_inactive is not None:
+        logger.info(
+            f"Found {len(newly_inactive)} newly inactive user accounts since the last run.",
+            account=account,
+            newly_inactive=newly_inactive,
+        )
+
+    pending = [
+        PendingUser(
+            user.username, plan_remediation(user), CONSOLE_ONLY, format_login(user)
+        )
+        for user in inactive_console_users
+    ]
+    pending = drop_exempt(iam_client, summary, pending, max_workers, sink)
+    arns = {user.username: user.arn for user in inactive_console_users}
+    pending = keep_service_active(iam_client, summary, pending, arns, sink)
+    logger.info(f"Found {summary.inactive} inactive user accounts.", account=account)
+
+    if report_only:
+        report(summary, pending, sink)
+        return summary
+
+    outcomes = remediate(
+        Remediator(iam_client, max_workers), summary, pending, store, deadline, sink
+    )
+    if index is not None:
+        # Users that failed, or are left for the next invocation, stay due
+        index.mark_disabled(account, disabled_usernames(outcomes))
+
+    return summary
+
+
+def monitor_from_index(
+    iam_client,
+    index: ActivityIndex,
+    report_only: bool,
+    account: str,
+    now: int,
+    thresholds: Thresholds,
+    max_workers: Optional[int] = None,
+    store: Optional[CheckpointStore] = None,
+    deadline: Optional[Deadline] = None,
+    sink: Optional[ResultSink] = None,
+) -> AccountSummary:
+    """Disable the users the activity index has becoming inactive by now,
+    without a credential report.
+
+    Events can be missed, so each user due is checked against IAM first. The
+    index doesn't know which users have access keys, so each user's are
+    listed and deactivated, and the number of users isn't known.
+    """
+    with get_instrumentation().phase("classify"):
+        due = index.due(account, now)
+    with get_instrumentation().phase("recheck"):
+        due = recheck_due(iam_client, index, account, due, thresholds, now, max_workers)
+
+    summary = AccountSummary(account, inactive=len(due), source=ACTIVITY_INDEX)
+    pending = [
+        PendingUser(
+            activity.username,
+            RemediationPlan(delete_login_profile=True, deactivate_access_keys=True),
+            CONSOLE_ONLY,
+            activity.last_console_login,
+        )
+        for activity in due
+    ]
+    pending = drop_exempt(iam_client, summary, pending, max_workers, sink)
+    pending = keep_service_active(iam_client, summary, pending, {}, sink)
+    logger.info(
+        f"Found {summary.inactive} inactive user accounts in the activity index.",
+        account=account,
+    )
+
+    if report_only:
+        report(summary, pending, sink)
+        return summary
+
+    outcomes = remediate(
+        Remediator(iam_client, max_workers), summary, pending, store, deadline, sink
+    )
+    # Users that failed, or are left for the next invocation, stay due
+    index.mark_disabled(account, disabled_usernames(outcomes))
+
+    return summary
+
+
+def current_activity(iam_client, activity: UserActivity) -> Optional[UserActivity]:
+    """The user's indexed activity brought up to date from IAM, or None if
+    the user or their password has been deleted."""
+    settings = get_settings()
+
+    def call(operation: str, **kwargs) -> dict:
+        return call_with_retry(
+            getattr(iam_client, operation),
+            settings.remediation_retry_limit,
+            settings.remediation_backoff_base_seconds,
+            settings.remediation_backoff_max_seconds,
+            **kwargs,
+        )
+
+    try:
+        user = call("get_user", UserName=activity.username)["User"]
+        login_profile = call("get_login_profile", UserName=activity.username)
+    except ClientError as e:
+        if is_no_such_entity(e):
+            return None
+        raise
+
+    password_last_used = activity.password_last_used
+    if user.get("PasswordLastUsed") is not None:
+        password_last_used = max(password_last_used, to_epoch(user["PasswordLastUsed"]))
+    # Only moves when the password is removed and added again, not on resets
+    password_created = to_epoch(login_profile["LoginProfile"]["CreateDate"])
+
+    return replace(
+        activity,
+        password_last_used=password_last_used,
+        password_last_changed=max(activity.password_last_changed, password_created),
+    )
+
+
+def recheck_due(
+    iam_client,
+    index: ActivityIndex,
+    account: str,
+    due: List[UserActivity],
+    thresholds: Thresholds,
+    now: int,
+    max_workers: Optional[int] = None,
+) -> List[UserActivity]:
+    """The users still inactive according to IAM, recording the activity of
+    those who aren't in the index. Users who can't be checked are left until
+    the next run."""
+    if not due:
+        return []
+
+    max_workers = max_workers or get_settings().remediation_max_workers
+    still_due = []
+    deleted = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(current_activity, iam_client, activity) for activity in due
+        ]
+        for activity, future in zip(due, futures):
+            error = future.exception()
+            if error is not None:
+                logger.warning(
+                    f"Unable to check {activity.username} is still inactive: {error}",
+                    account=account,
+                )
+                continue
+
+            current = future.result()
+            if current is None:
+                deleted.append(activity.username)
+                continue
+
+            inactive_at = current.inactive_at(thresholds)
+            if inactive_at is not None and inactive_at <= now:
+                still_due.append(current)
+                continue
+
+            logger.info(
+                f"{activity.username} was active since they were indexed",
+                account=account,
+            )
+            if current.password_last_used > activity.password_last_used:
+                index.record(
+                    ActivityEvent(
+                        account,
+                        activity.username,
+                        CONSOLE_LOGIN,
+                        current.password_last_used,
+                    ),
+                    thresholds,
+                )
+            if current.password_last_changed > activity.password_last_changed:
+                index.record(
+                    ActivityEvent(
+                        account,
+                        activity.username,
+                        "CreateLoginProfile",
+                        current.password_last_changed,
+                    ),
+                    thresholds,
+                )
+
+    # Nothing left to disable
+    index.mark_disabled(account, deleted)
+
+    return still_due
+
+
+def apply_rules(
+    iam_client,
+    credential_report: CredentialReport,
+    report_only: bool,
+    account: str,
+    max_workers: Optional[int],
+    store: Optional[CheckpointStore] = None,
+    deadline: Optional[Deadline] = None,
+    sink: Optional[ResultSink] = None,
+) -> AccountSummary:
+    """Evaluate every enabled rule in one pass over the report, then disable
+    the users who matched a rule that remediates."""
+    instrumentation = get_instrumentation()
+    rules = compile_rules(get_settings())
+    remediating = {rule.name for rule in rules if rule.remediate}
+    rule_matches = {rule.name: 0 for rule in rules}
+    summary = AccountSummary(
+        account, rule_matches=rule_matches, source=credential_report.source
+    )
+    candidates: List[Verdict] = []
+
+    with instrumentation.phase("classify"):
+        for verdict in evaluate(credential_report.records(), rules):
+            summary.users += 1
+            if not verdict.matched:
+                continue
+
+            for rule in verdict.matched:
+                rule_matches[rule] += 1
+            logger.info(
+                f"{verdict.user.username} matched rules: {', '.join(verdict.matched)}",
+                account=account,
+                rules=verdict.matched,
+            )
+            if remediating.intersection(verdict.matched):
+                summary.inactive += 1
+                # Written once checked for exemption
+                candidates.append(verdict)
+            elif sink is not None:
+                sink.write(UserResult.from_user(account, verdict.user, verdict.matched))
+
+    logger.info(f"Found {summary.users} user accounts.", account=account)
+
+    # Users whose console access is still in use only lose their unused keys
+    pending = [
+        PendingUser(
+            verdict.user.username,
+            plan_remediation(verdict.user, console=verdict.console_inactive),
+            verdict.matched,
+            format_login(verdict.user),
+        )
+        for verdict in candidates
+    ]
+    pending = drop_exempt(iam_client, summary, pending, max_workers, sink)
+    arns = {verdict.user.username: verdict.user.arn for verdict in candidates}
+    pending = keep_service_active(iam_client, summary, pending, arns, sink)
+    logger.info(f"Found {summary.inactive} inactive user accounts.", account=account)
+
+    if report_only:
+        report(summary, pending, sink)
+        return summary
+
+    remediate(
+        Remediator(iam_client, max_workers), summary, pending, store, deadline, sink
+    )
+
+    return summary
+
+
+def drop_exempt(
+    iam_client,
+    summary: AccountSummary,
+    pending: List[PendingUser],
+    max_workers: Optional[int],
+    sink: Optional[ResultSink],
+) -> List[PendingUser]:
+    """Leave out the exempt users, which no longer count as inactive."""
+    exemptions = Exemptions(iam_client, summary.account, max_workers)
+    if not exemptions.enabled:
+        return pending
+
+    with get_instrumentation().phase("exempt"):
+        exempt = exemptions.exempt(user.username for user in pending)
+    if not exempt:
+        return pending
+
+    for user in pending:
+        if user.username in exempt:
+            logger.info(f"{user.username} is exempt", account=summary.account)
+            if sink is not None:
+                sink.write(
+                    exempt_result(
+                        summary.account,
+                        user.username,
+                        user.rules,
+                        user.last_console_login,
+                    )
+                )
+    summary.exempt = len(exempt)
+    summary.inactive -= len(exempt)
+
+    return [user for user in pending if user.username not in exempt]
+
+
+def keep_service_active(
+    iam_client,
+    summary: AccountSummary,
+    pending: List[PendingUser],
+    arns: Dict[str, str],
+    sink: Optional[ResultSink],
+) -> List[PendingUser]:
+    """Keep the access keys of the users who recently accessed a service, and
+    leave them out if that leaves nothing to disable."""
+    jobs = ServiceAccessJobs(iam_client, summary.account)
+    candidates = [user for user in pending if user.plan.deactivate_access_keys]
+    if not jobs.enabled or not candidates:
+        return pending
+
+    with get_instrumentation().phase("service-access"):
+        accesses = jobs.last_accessed_all(
+            (user.username, arns.get(user.username)) for user in candidates
+        )
+
+    kept = []
+    for user in pending:
+        access = accesses.get(user.username)
+        if access is None or not access.accessed_since(jobs.active_since):
+            kept.append(user)
+            continue
+
+        logger.info(
+            f"{user.username} accessed {access.service} at {access.last_authenticated}, keeping their access keys",
+            account=summary.account,
+        )
+        summary.service_active += 1
+        user = replace(user, plan=replace(user.plan, deactivate_access_keys=False))
+        if not user.plan.is_empty:
+            kept.append(user)
+            continue
+
+        summary.inactive -= 1
+        if sink is not None:
+            sink.write(
+                service_active_result(
+                    summary.account, user.username, user.rules, user.last_console_login
+                )
+            )
+
+    return kept
+
+
+def report(
+    summary: AccountSummary, pending: List[PendingUser], sink: Optional[ResultSink]
+):
+    for user in pending:
+        logger.info(
+            f"{user.username} is inactive, last console login: {user.last_console_login}",
+            account=summary.account,
+        )
+        if sink is not None:
+            sink.write(
+                UserResult.from_remediation(
+                    summary.account, user.username, user.rules, user.last_console_login
+                )
+            )
+
+
+def remediate(
+    remediator: Remediator,
+    summary: AccountSummary,
+    pending: List[PendingUser],
+    store: Optional[CheckpointStore],
+    deadline: Optional[Deadline],
+    sink: Optional[ResultSink],
+) -> Dict[str, Outcome]:
+    """Disable the pending users, returning the outcome of each user
+    remediated, which with a checkpoint may not be all of them."""
+    if store is None:
+        with get_instrumentation().phase("remediate"):
+            result = remediator.remediate_all(
+                [user.username for user in pending], [user.plan for user in pending]
+            )
+        record_remediation(summary, pending, result, sink)
+        return {
+            remediation.username: remediation.outcome for remediation in result.users
+        }
+
+    # Record every user to disable before starting, so none are lost on a timeout
+    checkpoint = Checkpoint(summary.account, pending=pending)
+    store.save(checkpoint)
+    outcomes: Dict[str, Outcome] = {}
+    finish_checkpoint(remediator, store, checkpoint, summary, deadline, sink, outcomes)
+
+    return outcomes
+
+
+def disabled_usernames(outcomes: Dict[str, Outcome]) -> List[str]:
+    return [
+        username
+        for username, outcome in outcomes.items()
+        if outcome in (Outcome.SUCCESS, Outcome.ALREADY_DISABLED)
+    ]
+
+
+def finish_checkpoint(
+    remediator: Remediator,
+    store: CheckpointStore,
+    checkpoint: Checkpoint,
+    summary: AccountSummary,
+    deadline: Optional[Deadline],
+    sink: Optional[ResultSink] = None,
+    outcomes: Optional[Dict[str, Outcome]] = None,
+):
+    with get_instrumentation().phase("remediate"):
+        done = remediate_in_chunks(
+            remediator,
+            store,
+            checkpoint,
+            get_settings().remediation_chunk_size,
+            deadline,
+            sink,
+            outcomes,
+        )
+
+    # The counts cover every invocation since the checkpoint was created
+    summary.disabled = checkpoint.disabled
+    summary.already_disabled = checkpoint.already_disabled
+    summary.failed = checkpoint.failed
+    if not done:
+        summary.continuation_token = checkpoint.token
+    logger.info(
+        f"Disabled {summary.disabled} users, "
+        f"{summary.already_disabled} already disabled, "
+        f"{summary.failed} failed, "
+        f"{len(checkpoint.pending)} left.",
+        account=summary.account,
+    )
+
+
+def record_remediation(
+    summary: AccountSummary,
+    pending: List[PendingUser],
+    result: RemediationResult,
+    sink: Optional[ResultSink] = None,
+):
+    for user, remediation in zip(pending, result.users):
+        logger.info(
+            f"{user.username} remediation {remediation.outcome.value}, last console login: {user.last_console_login}",
+            account=summary.account,
+        )
+        if sink is not None:
+            sink.write(
+                UserResult.from_remediation(
+                    summary.account,
+                    user.username,
+                    user.rules,
+                    user.last_console_login,
+                    remediation,
+                )
+            )
+
+    summary.disabled = result.count(Outcome.SUCCESS)
+    summary.already_disabled = result.count(Outcome.ALREADY_DISABLED)
+    summary.failed = result.count(Outcome.FAILED)
+    logger.info(
+        f"Disabled {summary.disabled} users, "
+        f"{summary.already_disabled} already disabled, "
+        f"{summary.failed} failed.",
+        account=summary.account,
+        latencies=result.latency_summary(),
+    )
@@ -0,0 +1,616 @@
+"""A per-user index of console activity, kept up to date from CloudTrail.
+
+CloudTrail's ConsoleLogin, and CreateLoginProfile, UpdateLoginProfile and
+ChangePassword, events are delivered in batches through EventBridge and SQS
+to lambda_handler.handle_activity_event, which records each user's last
+console login and password change in the index. Every user is indexed by
+when they will become inactive, so the scheduled run only reads the users
+due to be disabled, rather than generating and classifying a credential
+report of every user.
+
+Users created, deleted or changed without one of these events are picked
+up by reconciling the index with a full credential report, which happens
+every activity_reconcile_interval_hours, and whenever the thresholds change.
+Before being disabled, each user due is checked against IAM in case an
+event was missed.
+
+IAM and sign-in events are only delivered to EventBridge in us-east-1, and
+to the account they happened in, so the index is only used by a function
+in us-east-1 monitoring its own account.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import sqlite3
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, Iterator, List, Optional, Protocol
+
+from src.classifier import (
+    NEVER,
+    NO_INFORMATION,
+    NOT_APPLICABLE,
+    PASSWORD_DISABLED,
+    PASSWORD_ENABLED,
+    SENTINELS,
+    ReportColumns,
+    inactive_at,
+)
+from src.logger import logger
+from src.timestamps import epoch_seconds
+
+CONSOLE_LOGIN = "ConsoleLogin"
+PASSWORD_EVENTS = frozenset(
+    ("CreateLoginProfile", "UpdateLoginProfile", "ChangePassword")
+)
+
+SENTINEL_NAMES = {value: name for name, value in SENTINELS.items()}
+
+# Attempts at recording an event while other invocations update the same user
+RECORD_ATTEMPTS = 5
+
+# The source of the users in a run's summary
+ACTIVITY_INDEX = "activity-index"
+
+# The only region IAM and sign-in events are delivered to EventBridge in
+EVENTS_REGION = "us-east-1"
+
+
+@dataclass(frozen=True)
+class Thresholds:
+    inactivity_threshold_days: int
+    grace_period_threshold_days: int
+
+    @classmethod
+    def from_settings(cls, settings) -> "Thresholds":
+        return cls(
+            settings.inactivity_threshold_days, settings.grace_period_threshold_days
+        )
+
+
+@dataclass
+class UserActivity:
+    """A user's credential report columns, as classifier epoch seconds."""
+
+    username: str
+    password_enabled: int = PASSWORD_ENABLED
+    password_last_used: int = NO_INFORMATION
+    # Unknown until reconciled, which keeps the user from becoming inactive
+    password_last_changed: int = NOT_APPLICABLE
+
+    @property
+    def last_console_login(self) -> str:
+        """The last console login, formatted like the report."""
+        sentinel = SENTINEL_NAMES.get(self.password_last_used)
+        if sentinel is not None:
+            return sentinel
+
+        return datetime.datetime.fromtimestamp(
+            self.password_last_used, datetime.timezone.utc
+        ).isoformat()
+
+    def inactive_at(self, thresholds: Thresholds) -> Optional[int]:
+        """When the user becomes inactive, or None if they can't."""
+        moment = inactive_at(
+            self.username,
+            self.password_enabled,
+            self.password_last_used,
+            self.password_last_changed,
+            thresholds.inactivity_threshold_days,
+            thresholds.grace_period_threshold_days,
+        )
+        return None if moment == NEVER else moment
+
+
+@dataclass
+class Reconciliation:
+    reconciled_at: int
+    thresholds: Thresholds
+
+    def is_due(self, thresholds: Thresholds, interval_seconds: int, now: int) -> bool:
+        return (
+            thresholds != self.thresholds
+            or now - self.reconciled_at >= interval_seconds
+        )
+
+
+@dataclass
+class ActivityEvent:
+    account: str
+    username: str
+    name: str
+    # Epoch seconds of the event's wall clock time, like the report columns
+    time: int
+
+    def apply(self, activity: Optional[UserActivity]) -> UserActivity:
+        """The user's activity updated with this event, which may be older
+        than what is already recorded."""
+        activity = activity or UserActivity(self.username)
+        if self.name == CONSOLE_LOGIN:
+            return replace(
+                activity,
+                password_enabled=PASSWORD_ENABLED,
+                password_last_used=max(activity.password_last_used, self.time),
+            )
+
+        return replace(
+            activity,
+            password_enabled=PASSWORD_ENABLED,
+            password_last_changed=max(activity.password_last_changed, self.time),
+        )
+
+
+def merge_reported(
+    reported: UserActivity, indexed: Optional[UserActivity]
+) -> UserActivity:
+    """The reported activity, keeping any more recent activity recorded
+    from events, as the report can be hours old."""
+    if indexed is None:
+        return reported
+
+    return replace(
+        reported,
+        password_last_used=max(reported.password_last_used, indexed.password_last_used),
+        password_last_changed=max(
+            reported.password_last_changed, indexed.password_last_changed
+        ),
+    )
+
+
+def parse_event(event: dict) -> Optional[ActivityEvent]:
+    """The activity in an EventBridge CloudTrail event, or None if it isn't
+    a successful console login or password change of an IAM user."""
+    detail = event.get("detail") or {}
+    name = detail.get("eventName")
+    identity = detail.get("userIdentity") or {}
+    if detail.get("errorCode"):
+        return None
+
+    if name == CONSOLE_LOGIN:
+        response = detail.get("responseElements") or {}
+        if response.get("ConsoleLogin") != "Success":
+            return None
+        username = (
+            identity.get("userName") if identity.get("type") == "IAMUser" else None
+        )
+    elif name == "ChangePassword":
+        username = identity.get("userName")
+    elif name in PASSWORD_EVENTS:
+        username = (detail.get("requestParameters") or {}).get("userName")
+    else:
+        return None
+
+    if not username:
+        return None
+
+    account = event.get("account") or detail.get("recipientAccountId", "")
+    return ActivityEvent(account, username, name, epoch_seconds(detail["eventTime"]))
+
+
+def activities_from_columns(columns: ReportColumns) -> Iterator[UserActivity]:
+    for username, enabled, last_used, last_changed in zip(
+        columns.usernames,
+        columns.password_enabled,
+        columns.password_last_used,
+        columns.password_last_changed,
+    ):
+        yield UserActivity(username, enabled, last_used, last_changed)
+
+
+class ActivityIndex(Protocol):
+    """Each account's users, indexed by when they become inactive."""
+
+    def record(self, event: ActivityEvent, thresholds: Thresholds) -> None: ...
+
+    def due(self, account: str, now: int) -> List[UserActivity]: ...
+
+    def mark_disabled(self, account: str, usernames: Iterable[str]) -> None: ...
+
+    def reconciliation(self, account: str) -> Optional[Reconciliation]: ...
+
+    def reconcile(
+        self,
+        account: str,
+        users: Iterable[UserActivity],
+        thresholds: Thresholds,
+        now: int,
+    ) -> None:
+        """Replace the account's users with those reported, merged with
+        their recorded activity."""
+
+
+class SqliteActivityIndex:
+    """ActivityIndex backed by a local SQLite database.
+
+    The database has to be shared by the scheduled and event driven
+    functions, e.g. on an EFS mount, and suits replaying events locally.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS user_activity ("
+                "account TEXT, username TEXT, password_enabled INTEGER, "
+                "password_last_used INTEGER, password_last_changed INTEGER, "
+                "inactive_at INTEGER, PRIMARY KEY (account, username))"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS user_activity_inactive_at "
+                "ON user_activity (account, inactive_at)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS activity_reconciliation ("
+                "account TEXT PRIMARY KEY, reconciled_at INTEGER, "
+                "inactivity_threshold_days INTEGER, "
+                "grace_period_threshold_days INTEGER)"
+            )
+
+    def record(self, event: ActivityEvent, thresholds: Thresholds) -> None:
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            # Hold the write lock between reading and updating the user
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT username, password_enabled, password_last_used, "
+                "password_last_changed FROM user_activity "
+                "WHERE account = ? AND username = ?",
+                (event.account, event.username),
+            ).fetchone()
+            activity = event.apply(UserActivity(*row) if row else None)
+            connection.execute(
+                "INSERT OR REPLACE INTO user_activity VALUES (?, ?, ?, ?, ?, ?)",
+                self._row(event.account, activity, thresholds),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def due(self, account: str, now: int) -> List[UserActivity]:
+        with sqlite3.connect(self.path) as connection:
+            rows = connection.execute(
+                "SELECT username, password_enabled, password_last_used, "
+                "password_last_changed FROM user_activity "
+                "WHERE account = ? AND inactive_at <= ? ORDER BY username",
+                (account, now),
+            )
+            return [UserActivity(*row) for row in rows]
+
+    def mark_disabled(self, account: str, usernames: Iterable[str]) -> None:
+        with sqlite3.connect(self.path) as connection:
+            connection.executemany(
+                "UPDATE user_activity SET password_enabled = ?, inactive_at = NULL "
+                "WHERE account = ? AND username = ?",
+                ((PASSWORD_DISABLED, account, username) for username in usernames),
+            )
+
+    def reconciliation(self, account: str) -> Optional[Reconciliation]:
+        with sqlite3.connect(self.path) as connection:
+            row = connection.execute(
+                "SELECT reconciled_at, inactivity_threshold_days, "
+                "grace_period_threshold_days FROM activity_reconciliation "
+                "WHERE account = ?",
+                (account,),
+            ).fetchone()
+
+        if row is None:
+            return None
+        return Reconciliation(row[0], Thresholds(row[1], row[2]))
+
+    def reconcile(
+        self,
+        account: str,
+        users: Iterable[UserActivity],
+        thresholds: Thresholds,
+        now: int,
+    ) -> None:
+        with sqlite3.connect(self.path) as connection:
+            indexed = {
+                row[0]: UserActivity(*row)
+                for row in connection.execute(
+                    "SELECT username, password_enabled, password_last_used, "
+                    "password_last_changed FROM user_activity WHERE account = ?",
+                    (account,),
+                )
+            }
+            # Replace the whole account so users removed from the report are dropped
+            connection.execute(
+                "DELETE FROM user_activity WHERE account = ?", (account,)
+            )
+            connection.executemany(
+                "INSERT INTO user_activity VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self._row(
+                        account,
+                        merge_reported(user, indexed.get(user.username)),
+                        thresholds,
+                    )
+                    for user in users
+                ),
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO activity_reconciliation VALUES (?, ?, ?, ?)",
+                (
+                    account,
+                    now,
+                    thresholds.inactivity_threshold_days,
+                    thresholds.grace_period_threshold_days,
+                ),
+            )
+
+    @staticmethod
+    def _row(account: str, activity: UserActivity, thresholds: Thresholds) -> tuple:
+        return (
+            account,
+            activity.username,
+            activity.password_enabled,
+            activity.password_last_used,
+            activity.password_last_changed,
+            activity.inactive_at(thresholds),
+        )
+
+
+class DynamoDbActivityIndex:
+    """ActivityIndex backed by a DynamoDB table, shared by the scheduled and
+    event driven functions.
+
+    The table is keyed by account and username, with an inactive_at global
+    secondary index keyed by account and inactive_at. Users who can't
+    become inactive have no inactive_at, so aren't in the secondary index.
+    Each account's reconciliation is kept in an item of its own.
+    """
+
+    RECONCILIATION = "#reconciliation"
+    INACTIVE_AT_INDEX = "inactive_at"
+
+    def __init__(self, dynamodb_client, table: str):
+        self.dynamodb_client = dynamodb_client
+        self.table = table
+
+    @staticmethod
+    def _key(account: str, username: str) -> dict:
+        return {"account": {"S": account}, "username": {"S": username}}
+
+    @staticmethod
+    def _item(account: str, activity: UserActivity, thresholds: Thresholds) -> dict:
+        item = {
+            "account": {"S": account},
+            "username": {"S": activity.username},
+            "password_enabled": {"N": str(activity.password_enabled)},
+            "password_last_used": {"N": str(activity.password_last_used)},
+            "password_last_changed": {"N": str(activity.password_last_changed)},
+        }
+        moment = activity.inactive_at(thresholds)
+        if moment is not None:
+            item["inactive_at"] = {"N": str(moment)}
+
+        return item
+
+    @staticmethod
+    def _activity(item: dict) -> UserActivity:
+        return UserActivity(
+            item["username"]["S"],
+            int(item["password_enabled"]["N"]),
+            int(item["password_last_used"]["N"]),
+            int(item["password_last_changed"]["N"]),
+        )
+
+    def record(self, event: ActivityEvent, thresholds: Thresholds) -> None:
+        key = self._key(event.account, event.username)
+        for _ in range(RECORD_ATTEMPTS):
+            item = self.dynamodb_client.get_item(
+                TableName=self.table, Key=key, ConsistentRead=True
+            ).get("Item")
+            current = self._activity(item) if item is not None else None
+            activity = event.apply(current)
+
+            # Only write over the activity that was read
+            if current is None:
+                condition = "attribute_not_exists(#username)"
+                names = {"#username": "username"}
+                values = None
+            else:
+                condition = (
+                    "password_enabled = :enabled AND password_last_used = :used "
+                    "AND password_last_changed = :changed"
+                )
+                names = None
+                values = {
+                    ":enabled": item["password_enabled"],
+                    ":used": item["password_last_used"],
+                    ":changed": item["password_last_changed"],
+                }
+
+            arguments = {
+                "TableName": self.table,
+                "Item": self._item(event.account, activity, thresholds),
+                "ConditionExpression": condition,
+            }
+            if names:
+                arguments["ExpressionAttributeNames"] = names
+            if values:
+                arguments["ExpressionAttributeValues"] = values
+
+            try:
+                self.dynamodb_client.put_item(**arguments)
+                return
+            except self.dynamodb_client.exceptions.ConditionalCheckFailedException:
+                logger.debug(
+                    f"{event.username} was updated concurrently, retrying",
+                    account=event.account,
+                )
+
+        raise Exception(
+            f"Unable to record {event.name} for {event.username} "
+            f"after {RECORD_ATTEMPTS} attempts"
+        )
+
+    def _query(self, **arguments) -> Iterator[dict]:
+        paginator = self.dynamodb_client.get_paginator("query")
+        for page in paginator.paginate(TableName=self.table, **arguments):
+            yield from page["Items"]
+
+    def due(self, account: str, now: int) -> List[UserActivity]:
+        items = self._query(
+            IndexName=self.INACTIVE_AT_INDEX,
+            KeyConditionExpression="#account = :account AND inactive_at <= :now",
+            ExpressionAttributeNames={"#account": "account"},
+            ExpressionAttributeValues={
+                ":account": {"S": account},
+                ":now": {"N": str(now)},
+            },
+        )
+        return sorted(
+            (self._activity(item) for item in items),
+            key=lambda activity: activity.username,
+        )
+
+    def mark_disabled(self, account: str, usernames: Iterable[str]) -> None:
+        for username in usernames:
+            try:
+                self.dynamodb_client.update_item(
+                    TableName=self.table,
+                    Key=self._key(account, username),
+                    UpdateExpression="SET password_enabled = :disabled "
+                    "REMOVE inactive_at",
+                    ConditionExpression="attribute_exists(#username)",
+                    ExpressionAttributeNames={"#username": "username"},
+                    ExpressionAttributeValues={
+                        ":disabled": {"N": str(PASSWORD_DISABLED)}
+                    },
+                )
+            except self.dynamodb_client.exceptions.ConditionalCheckFailedException:
+                pass
+
+    def reconciliation(self, account: str) -> Optional[Reconciliation]:
+        item = self.dynamodb_client.get_item(
+            TableName=self.table,
+            Key=self._key(account, self.RECONCILIATION),
+            ConsistentRead=True,
+        ).get("Item")
+        if item is None:
+            return None
+
+        return Reconciliation(
+            int(item["reconciled_at"]["N"]),
+            Thresholds(
+                int(item["inactivity_threshold_days"]["N"]),
+                int(item["grace_period_threshold_days"]["N"]),
+            ),
+        )
+
+    def _write(self, requests: List[dict]):
+        # BatchWriteItem takes at most 25 requests
+        for start in range(0, len(requests), 25):
+            pending: Dict[str, List[dict]] = {self.table: requests[start : start + 25]}
+            while pending:
+                response = self.dynamodb_client.batch_write_item(RequestItems=pending)
+                pending = response.get("UnprocessedItems") or {}
+
+    def reconcile(
+        self,
+        account: str,
+        users: Iterable[UserActivity],
+        thresholds: Thresholds,
+        now: int,
+    ) -> None:
+        indexed = {
+            item["username"]["S"]: self._activity(item)
+            for item in self._query(
+                KeyConditionExpression="#account = :account",
+                ExpressionAttributeNames={"#account": "account"},
+                ExpressionAttributeValues={":account": {"S": account}},
+            )
+            if item["username"]["S"] != self.RECONCILIATION
+        }
+
+        requests = []
+        for user in users:
+            user = merge_reported(user, indexed.pop(user.username, None))
+            requests.append(
+                {"PutRequest": {"Item": self._item(account, user, thresholds)}}
+            )
+        # Users removed from the report are dropped
+        requests += [
+            {"DeleteRequest": {"Key": self._key(account, username)}}
+            for username in indexed
+        ]
+        self._write(requests)
+
+        self.dynamodb_client.put_item(
+            TableName=self.table,
+            Item={
+                **self._key(account, self.RECONCILIATION),
+                "reconciled_at": {"N": str(now)},
+                "inactivity_threshold_days": {
+                    "N": str(thresholds.inactivity_threshold_days)
+                },
+                "grace_period_threshold_days": {
+                    "N": str(thresholds.grace_period_threshold_days)
+                },
+            },
+        )
+
+
+def open_activity_index(settings) -> Optional[ActivityIndex]:
+    """The configured activity index, if any."""
+    if not (settings.activity_index_table or settings.activity_index_path):
+        return None
+
+    region = os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION")
+    if region != EVENTS_REGION:
+        raise ValueError(
+            f"The activity index is only kept up to date in {EVENTS_REGION}, "
+            f"not {region}"
+        )
+
+    if settings.activity_index_table:
+        from src.clients import get_client
+
+        return DynamoDbActivityIndex(
+            get_client("dynamodb"), settings.activity_index_table
+        )
+    return SqliteActivityIndex(settings.activity_index_path)
+
+
+def record_batch(
+    index: ActivityIndex,
+    batch: dict,
+    thresholds: Thresholds,
+    account: Optional[str] = None,
+) -> dict:
+    """Record the activity in a batch of events, under account if given,
+    otherwise under each event's account.
+
+    Returns the SQS partial batch response, so only the messages that
+    failed are retried.
+    """
+    failures = []
+    recorded = 0
+    # EventBridge can also invoke directly, with a single event
+    records = batch["Records"] if "Records" in batch else [None]
+    for record in records:
+        message_id = record["messageId"] if record is not None else None
+        try:
+            body = json.loads(record["body"]) if record is not None else batch
+            event = parse_event(body)
+            if event is None:
+                continue
+            if account is not None:
+                event = replace(event, account=account)
+            index.record(event, thresholds)
+            recorded += 1
+        except Exception:
+            if message_id is None:
+                raise
+            logger.exception(f"Failed to record message {message_id}")
+            failures.append({"itemIdentifier": message_id})
+
+    logger.info(f"Recorded {recorded} activity events.", failed=len(failures))
+    return {"batchItemFailures": failures}
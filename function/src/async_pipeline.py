@@ -0,0 +1,238 @@
+"""An asyncio alternative to the threaded pipeline in account.py.
+
+Users are evaluated against the enabled rules as they are parsed from the
+report, and each matching user's remediation starts straight away instead
+of after the whole report has been classified. boto3 has no native asyncio
+support, so IAM calls run on a thread pool and are awaited from the event
+loop, which stays free to parse and to serve other accounts.
+
+Checkpoints, the state store and the activity index are only supported by
+the threaded pipeline, and setting them with this one is an error rather
+than being silently ignored.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Iterable, List, Optional, Tuple
+
+from src.account import AccountSummary
+from src.config import Settings, get_settings
+from src.exemptions import Exemptions
+from src.instrumentation import get_instrumentation
+from src.listing import get_first_report
+from src.logger import logger
+from src.organisation import SessionCache, account_id_from_arn, aggregate_summaries
+from src.remediation import (
+    Outcome,
+    RemediationPlan,
+    Remediator,
+    UserRemediation,
+    plan_remediation,
+)
+from src.results import (
+    ResultSink,
+    UserResult,
+    exempt_result,
+    format_login,
+    service_active_result,
+)
+from src.rules import CONSOLE_INACTIVE, compile_rules, evaluate
+from src.service_access import ServiceAccessJobs
+
+# Rows parsed between giving remediation tasks a chance to run
+YIELD_EVERY_ROWS = 500
+
+# Settings only the threaded pipeline supports
+UNSUPPORTED_SETTINGS = (
+    "checkpoint_store_uri",
+    "checkpoint_store_path",
+    "state_store_path",
+    "activity_index_table",
+    "activity_index_path",
+)
+
+
+def check_supported(settings: Settings):
+    unsupported = [name for name in UNSUPPORTED_SETTINGS if getattr(settings, name)]
+    if unsupported:
+        raise ValueError(
+            f"{', '.join(unsupported)} not supported by the asyncio pipeline, "
+            "use handle_event instead"
+        )
+
+
+async def monitor_account_async(
+    iam_client,
+    report_only: bool,
+    account: str = "self",
+    max_concurrency: Optional[int] = None,
+    sink: Optional[ResultSink] = None,
+) -> AccountSummary:
+    """Find the inactive users in an account and, unless report_only, disable
+    them concurrently while the rest of the report is still being parsed."""
+    settings = get_settings()
+    check_supported(settings)
+    max_concurrency = max_concurrency or settings.remediation_max_workers
+    instrumentation = get_instrumentation()
+    loop = asyncio.get_running_loop()
+
+    # Polling sleeps, so it runs off the event loop
+    credential_report = await asyncio.to_thread(get_first_report, iam_client)
+
+    rules = compile_rules(settings)
+    remediating = {rule.name for rule in rules if rule.remediate}
+    summary = AccountSummary(account, source=credential_report.source)
+    if tuple(settings.enabled_rules) != (CONSOLE_INACTIVE,):
+        summary.rule_matches = {rule.name: 0 for rule in rules}
+    remediator = Remediator(iam_client, max_concurrency)
+    exemptions = Exemptions(iam_client, account, max_concurrency)
+    service_access = ServiceAccessJobs(iam_client, account)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    tasks: List[asyncio.Task] = []
+
+    def exempt(user, rules: Tuple[str, ...]):
+        logger.info(f"{user.username} is exempt", account=account)
+        summary.exempt += 1
+        summary.inactive -= 1
+        if sink is not None:
+            sink.write(exempt_result(account, user.username, rules, format_login(user)))
+
+    async def remediate(
+        user, rules: Tuple[str, ...], plan: RemediationPlan
+    ) -> Optional[UserRemediation]:
+        async with semaphore:
+            # Tags are only listed for inactive users, as they are found
+            if exemptions.tags:
+                tagged = await loop.run_in_executor(
+                    executor, exemptions.has_exempt_tag, user.username
+                )
+                if tagged:
+                    exempt(user, rules)
+                    return None
+            if service_access.enabled and plan.deactivate_access_keys:
+                access = await loop.run_in_executor(
+                    executor, service_access.last_accessed, user.username, user.arn
+                )
+                if access is not None and access.accessed_since(
+                    service_access.active_since
+                ):
+                    logger.info(
+                        f"{user.username} accessed {access.service} at {access.last_authenticated}, keeping their access keys",
+                        account=account,
+                    )
+                    summary.service_active += 1
+                    plan = replace(plan, deactivate_access_keys=False)
+                    if plan.is_empty:
+                        summary.inactive -= 1
+                        if sink is not None:
+                            sink.write(
+                                service_active_result(
+                                    account, user.username, rules, format_login(user)
+                                )
+                            )
+                        return None
+            if report_only:
+                logger.info(
+                    f"{user.username} is inactive, last console login: {user.password_last_used}",
+                    account=account,
+                    rules=rules,
+                )
+                if sink is not None:
+                    sink.write(UserResult.from_user(account, user, rules))
+                return None
+
+            remediation = await loop.run_in_executor(
+                executor, remediator.disable_user, user, plan
+            )
+        logger.info(
+            f"{user.username} remediation {remediation.outcome.value}, last console login: {user.password_last_used}",
+            account=account,
+        )
+        if sink is not None:
+            sink.write(UserResult.from_user(account, user, rules, remediation))
+        return remediation
+
+    try:
+        with instrumentation.phase("classify"):
+            verdicts = evaluate(credential_report.records(), rules)
+            for index, verdict in enumerate(verdicts):
+                summary.users += 1
+                user = verdict.user
+                if summary.rule_matches is not None:
+                    for rule in verdict.matched:
+                        summary.rule_matches[rule] += 1
+                if remediating.intersection(verdict.matched):
+                    summary.inactive += 1
+                    if exemptions.username_exempt(user.username):
+                        exempt(user, verdict.matched)
+                    else:
+                        plan = plan_remediation(user, console=verdict.console_inactive)
+                        tasks.append(
+                            asyncio.create_task(remediate(user, verdict.matched, plan))
+                        )
+                elif verdict.matched and sink is not None:
+                    sink.write(UserResult.from_user(account, user, verdict.matched))
+
+                if index % YIELD_EVERY_ROWS == 0:
+                    await asyncio.sleep(0)
+
+        with instrumentation.phase("remediate"):
+            remediations = await asyncio.gather(*tasks)
+    finally:
+        executor.shutdown(wait=False)
+
+    logger.info(f"Found {summary.users} user accounts.", account=account)
+    logger.info(f"Found {summary.inactive} inactive user accounts.", account=account)
+
+    if not report_only:
+        outcomes = [
+            remediation.outcome
+            for remediation in remediations
+            if remediation is not None
+        ]
+        summary.disabled = outcomes.count(Outcome.SUCCESS)
+        summary.already_disabled = outcomes.count(Outcome.ALREADY_DISABLED)
+        summary.failed = outcomes.count(Outcome.FAILED)
+        logger.info(
+            f"Disabled {summary.disabled} users, "
+            f"{summary.already_disabled} already disabled, "
+            f"{summary.failed} failed.",
+            account=account,
+        )
+
+    return summary
+
+
+async def monitor_organisation_async(
+    session_cache: SessionCache,
+    role_arns: Iterable[str],
+    report_only: bool,
+    sink: Optional[ResultSink] = None,
+) -> dict:
+    """Monitor every account concurrently on one event loop."""
+    settings = get_settings()
+    accounts = asyncio.Semaphore(settings.organisation_max_concurrent_accounts)
+
+    async def monitor(role_arn: str) -> AccountSummary:
+        account = account_id_from_arn(role_arn)
+        async with accounts:
+            try:
+                iam_client = await asyncio.to_thread(
+                    session_cache.client, role_arn, "iam"
+                )
+                return await monitor_account_async(
+                    iam_client,
+                    report_only,
+                    account,
+                    settings.organisation_remediation_max_workers,
+                    sink,
+                )
+            except Exception as e:
+                logger.exception(f"Failed to monitor account {account}")
+                return AccountSummary(account, error=str(e))
+
+    summaries = await asyncio.gather(*(monitor(arn) for arn in role_arns))
+
+    return aggregate_summaries(list(summaries))
@@ -0,0 +1,263 @@
+"""Chunked remediation that can stop before the Lambda times out and resume
+in the next invocation.
+
+The users to disable are written to a checkpoint before any of them are
+remediated, and the checkpoint is updated after each chunk, so an
+interrupted run always knows which users are left.
+
+Checkpoints are kept in S3 (checkpoint_store_uri), which outlives the
+Lambda's execution environment, or in a local SQLite database
+(checkpoint_store_path). A run stopped early returns its checkpoint's
+continuation token. The next invocation resumes from the checkpoint when
+given that token, or no token at all, as scheduled invocations are; a
+checkpoint not matching the token given is discarded, and the run starts
+afresh.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Protocol, Tuple
+
+from botocore.exceptions import ClientError
+
+from src.clients import get_client, parse_s3_uri
+from src.logger import logger
+from src.remediation import Outcome, RemediationPlan, Remediator
+from src.results import ResultSink, UserResult
+
+
+@dataclass
+class PendingUser:
+    username: str
+    plan: RemediationPlan
+    # Kept for the user's result
+    rules: Tuple[str, ...] = ()
+    last_console_login: Optional[str] = None
+
+
+@dataclass
+class Checkpoint:
+    account: str
+    # Returned by the handler while the checkpoint has users left to disable
+    token: str = field(default_factory=lambda: uuid.uuid4().hex)
+    pending: List[PendingUser] = field(default_factory=list)
+    disabled: int = 0
+    already_disabled: int = 0
+    failed: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.disabled + self.already_disabled + self.failed + len(self.pending)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, body: str) -> "Checkpoint":
+        values = json.loads(body)
+        values["pending"] = [
+            PendingUser(
+                user["username"],
+                RemediationPlan(**user["plan"]),
+                tuple(user["rules"]),
+                user["last_console_login"],
+            )
+            for user in values["pending"]
+        ]
+        return cls(**values)
+
+
+class CheckpointStore(Protocol):
+    """Persists each account's unfinished remediation between invocations."""
+
+    def load(self, account: str) -> Optional[Checkpoint]: ...
+
+    def save(self, checkpoint: Checkpoint) -> None: ...
+
+    def delete(self, account: str) -> None: ...
+
+
+class SqliteCheckpointStore:
+    """CheckpointStore backed by a local SQLite database.
+
+    The database has to outlive the invocation to be resumed from, e.g. on
+    an EFS mount, or under /tmp for warm invocations.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoint ("
+                "account TEXT PRIMARY KEY, body TEXT)"
+            )
+
+    def load(self, account: str) -> Optional[Checkpoint]:
+        with sqlite3.connect(self.path) as connection:
+            row = connection.execute(
+                "SELECT body FROM checkpoint WHERE account = ?", (account,)
+            ).fetchone()
+
+        return None if row is None else Checkpoint.from_json(row[0])
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO checkpoint VALUES (?, ?)",
+                (checkpoint.account, checkpoint.to_json()),
+            )
+
+    def delete(self, account: str) -> None:
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("DELETE FROM checkpoint WHERE account = ?", (account,))
+
+
+class S3CheckpointStore:
+    """CheckpointStore keeping each account's checkpoint as a JSON object."""
+
+    def __init__(self, s3_client, bucket: str, prefix: str = ""):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, account: str) -> str:
+        return f"{self.prefix}{account}.json"
+
+    def load(self, account: str) -> Optional[Checkpoint]:
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=self._key(account)
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchKey":
+                return None
+            raise
+
+        return Checkpoint.from_json(response["Body"].read().decode("utf8"))
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(checkpoint.account),
+            Body=checkpoint.to_json().encode("utf8"),
+        )
+
+    def delete(self, account: str) -> None:
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._key(account))
+
+
+def open_checkpoint_store(settings) -> Optional[CheckpointStore]:
+    """The configured checkpoint store, if any."""
+    if settings.checkpoint_store_uri:
+        bucket, prefix = parse_s3_uri(settings.checkpoint_store_uri)
+        return S3CheckpointStore(get_client("s3"), bucket, prefix)
+    if settings.checkpoint_store_path:
+        return SqliteCheckpointStore(settings.checkpoint_store_path)
+
+    return None
+
+
+def resumable(
+    checkpoint: Optional[Checkpoint], continuation_token: Optional[str]
+) -> bool:
+    """Whether to resume from the checkpoint, given the continuation token
+    the invocation was given, if any."""
+    if checkpoint is None:
+        if continuation_token is not None:
+            logger.info(
+                "Nothing left to resume, starting afresh",
+                continuation_token=continuation_token,
+            )
+        return False
+
+    if continuation_token is not None and continuation_token != checkpoint.token:
+        logger.warning(
+            "The checkpoint is for another run, starting afresh",
+            account=checkpoint.account,
+            continuation_token=continuation_token,
+            checkpoint_token=checkpoint.token,
+        )
+        return False
+
+    return True
+
+
+class Deadline:
+    """The time left in the invocation, from the Lambda context, less a
+    margin kept back for saving the checkpoint and returning."""
+
+    def __init__(self, remaining_millis: Callable[[], int], margin_seconds: float):
+        self.remaining_millis = remaining_millis
+        self.margin_seconds = margin_seconds
+
+    def remaining(self) -> float:
+        return self.remaining_millis() / 1000 - self.margin_seconds
+
+    def allows(self, seconds: float) -> bool:
+        return self.remaining() > seconds
+
+
+def remediate_in_chunks(
+    remediator: Remediator,
+    store: CheckpointStore,
+    checkpoint: Checkpoint,
+    chunk_size: int,
+    deadline: Optional[Deadline] = None,
+    sink: Optional[ResultSink] = None,
+    outcomes: Optional[Dict[str, Outcome]] = None,
+) -> bool:
+    """Disable the checkpoint's pending users a chunk at a time, saving the
+    checkpoint after each chunk, and recording each user's outcome in
+    outcomes when given.
+
+    Stops early, leaving the checkpoint for the next invocation, when the
+    deadline might not allow another chunk as slow as the slowest so far.
+    Returns whether every user has been remediated.
+    """
+    slowest = 0.0
+    while checkpoint.pending:
+        if deadline is not None and not deadline.allows(slowest):
+            logger.info(
+                f"Stopping with {len(checkpoint.pending)} users left to disable.",
+                account=checkpoint.account,
+                continuation_token=checkpoint.token,
+            )
+            return False
+
+        chunk = checkpoint.pending[:chunk_size]
+        start = time.perf_counter()
+        result = remediator.remediate_all(
+            [user.username for user in chunk], [user.plan for user in chunk]
+        )
+        slowest = max(slowest, time.perf_counter() - start)
+
+        for user, remediation in zip(chunk, result.users):
+            if outcomes is not None:
+                outcomes[user.username] = remediation.outcome
+            logger.info(
+                f"{remediation.username} remediation {remediation.outcome.value}",
+                account=checkpoint.account,
+            )
+            if sink is not None:
+                sink.write(
+                    UserResult.from_remediation(
+                        checkpoint.account,
+                        user.username,
+                        user.rules,
+                        user.last_console_login,
+                        remediation,
+                    )
+                )
+        checkpoint.disabled += result.count(Outcome.SUCCESS)
+        checkpoint.already_disabled += result.count(Outcome.ALREADY_DISABLED)
+        checkpoint.failed += result.count(Outcome.FAILED)
+        del checkpoint.pending[: len(chunk)]
+        store.save(checkpoint)
+
+    store.delete(checkpoint.account)
+    return True
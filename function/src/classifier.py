@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import calendar
+import datetime
+from array import array
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import TYPE_CHECKING, Iterable, List, Optional, Union
+
+from src.report import iter_report_rows
+from src.timestamps import epoch_seconds
+
+if TYPE_CHECKING:
+    from src.models import UserLike
+
+SECONDS_PER_DAY = 86400
+
+# Timestamps are stored as epoch seconds of their wall clock time (matching the
+# tz-naive comparison in helpers.py), with the report's sentinel strings mapped
+# to values below any real timestamp.
+NO_INFORMATION = -(2**63)
+NOT_APPLICABLE = NO_INFORMATION + 1
+NOT_SUPPORTED = NO_INFORMATION + 2
+
+# Upper bound used when a classification can't change with time alone
+NEVER = 2**63 - 1
+
+SENTINELS = {
+    "no_information": NO_INFORMATION,
+    "N/A": NOT_APPLICABLE,
+    "not_supported": NOT_SUPPORTED,
+}
+
+# password_enabled is tri-state; not_supported is truthy in helpers.is_inactive
+PASSWORD_DISABLED = 0
+PASSWORD_ENABLED = 1
+PASSWORD_NOT_SUPPORTED = 2
+
+
+class Reason(IntEnum):
+    ACTIVE = 0
+    ROOT_USER = 1
+    NO_PASSWORD = 2
+    NEVER_LOGGED_IN = 3
+    NEVER_LOGGED_IN_GRACE_PERIOD_EXCEEDED = 4
+    RECENT_PASSWORD_RESET = 5
+    INACTIVE = 6
+
+
+INACTIVE_REASONS = frozenset(
+    (Reason.NEVER_LOGGED_IN_GRACE_PERIOD_EXCEEDED, Reason.INACTIVE)
+)
+
+
+def to_epoch(value: Union[datetime.datetime, str]) -> int:
+    if isinstance(value, str):
+        sentinel = SENTINELS.get(value)
+        if sentinel is not None:
+            return sentinel
+        return epoch_seconds(value)
+
+    return calendar.timegm(value.replace(tzinfo=None).timetuple())
+
+
+def to_password_enabled(value: Union[bool, str]) -> int:
+    if value is True or value == "true":
+        return PASSWORD_ENABLED
+    if value is False or value == "false":
+        return PASSWORD_DISABLED
+    return PASSWORD_NOT_SUPPORTED
+
+
+@dataclass
+class ReportColumns:
+    """The columns of a credential report needed for classification."""
+
+    usernames: List[str] = field(default_factory=list)
+    password_enabled: array = field(default_factory=lambda: array("b"))
+    password_last_used: array = field(default_factory=lambda: array("q"))
+    password_last_changed: array = field(default_factory=lambda: array("q"))
+
+    def __len__(self) -> int:
+        return len(self.usernames)
+
+    def append(
+        self, username, password_enabled, password_last_used, password_last_changed
+    ):
+        self.usernames.append(username)
+        self.password_enabled.append(to_password_enabled(password_enabled))
+        self.password_last_used.append(to_epoch(password_last_used))
+        self.password_last_changed.append(to_epoch(password_last_changed))
+
+    @classmethod
+    def from_users(cls, users: Iterable[UserLike]) -> "ReportColumns":
+        columns = cls()
+        for user in users:
+            columns.append(
+                user.username,
+                user.password_enabled,
+                user.password_last_used,
+                user.password_last_changed,
+            )
+
+        return columns
+
+    @classmethod
+    def from_report(cls, content: bytes) -> "ReportColumns":
+        """Read the columns straight from the report CSV, without building Users."""
+        columns = cls()
+        rows = iter_report_rows(content)
+        header = next(rows, None)
+        if header is None:
+            return columns
+
+        username = header.index("user")
+        password_enabled = header.index("password_enabled")
+        password_last_used = header.index("password_last_used")
+        password_last_changed = header.index("password_last_changed")
+
+        for row in rows:
+            if row:
+                columns.append(
+                    row[username],
+                    row[password_enabled],
+                    row[password_last_used],
+                    row[password_last_changed],
+                )
+
+        return columns
+
+
+@dataclass
+class Classification:
+    inactive: List[bool]
+    reasons: array
+
+    def inactive_indices(self) -> List[int]:
+        return [index for index, inactive in enumerate(self.inactive) if inactive]
+
+
+def reference_now() -> int:
+    """The current time in the same wall clock epoch seconds as the columns."""
+    return calendar.timegm(datetime.datetime.now().timetuple())
+
+
+def classify(
+    columns: ReportColumns,
+    inactivity_threshold: int,
+    reset_grace_period_threshold: int,
+    now: Optional[int] = None,
+) -> Classification:
+    """Classify every user in the report in a single pass.
+
+    Equivalent to calling helpers.is_inactive for each user, but with one
+    reference "now" and the thresholds converted once into epoch cut-offs.
+    """
+    if now is None:
+        now = reference_now()
+
+    # (now - t).days > threshold  <=>  t <= now - (threshold + 1) days
+    last_used_cutoff = now - (inactivity_threshold + 1) * SECONDS_PER_DAY
+    last_changed_cutoff = now - (reset_grace_period_threshold + 1) * SECONDS_PER_DAY
+
+    reasons = array("b")
+    for username, enabled, last_used, last_changed in zip(
+        columns.usernames,
+        columns.password_enabled,
+        columns.password_last_used,
+        columns.password_last_changed,
+    ):
+        grace_period_exceeded = NOT_SUPPORTED < last_changed <= last_changed_cutoff
+
+        if username == "<root_account>":
+            reason = Reason.ROOT_USER
+        elif enabled == PASSWORD_DISABLED:
+            reason = Reason.NO_PASSWORD
+        elif last_used == NO_INFORMATION:
+            if grace_period_exceeded:
+                reason = Reason.NEVER_LOGGED_IN_GRACE_PERIOD_EXCEEDED
+            else:
+                reason = Reason.NEVER_LOGGED_IN
+        elif NOT_SUPPORTED < last_used <= last_used_cutoff:
+            if grace_period_exceeded:
+                reason = Reason.INACTIVE
+            else:
+                reason = Reason.RECENT_PASSWORD_RESET
+        else:
+            reason = Reason.ACTIVE
+
+        reasons.append(reason)
+
+    return Classification([reason in INACTIVE_REASONS for reason in reasons], reasons)
+
+
+def inactive_times(
+    columns: ReportColumns,
+    inactivity_threshold: int,
+    reset_grace_period_threshold: int,
+) -> array:
+    """inactive_at for every user in the report, in a single pass."""
+    inactivity = (inactivity_threshold + 1) * SECONDS_PER_DAY
+    grace_period = (reset_grace_period_threshold + 1) * SECONDS_PER_DAY
+
+    times = array("q")
+    for username, enabled, last_used, last_changed in zip(
+        columns.usernames,
+        columns.password_enabled,
+        columns.password_last_used,
+        columns.password_last_changed,
+    ):
+        if (
+            username == "<root_account>"
+            or enabled == PASSWORD_DISABLED
+            or last_changed <= NOT_SUPPORTED
+        ):
+            times.append(NEVER)
+        elif last_used == NO_INFORMATION:
+            times.append(last_changed + grace_period)
+        elif last_used <= NOT_SUPPORTED:
+            times.append(NEVER)
+        else:
+            times.append(max(last_changed + grace_period, last_used + inactivity))
+
+    return times
+
+
+def inactive_at(
+    username: str,
+    enabled: int,
+    last_used: int,
+    last_changed: int,
+    inactivity_threshold: int,
+    reset_grace_period_threshold: int,
+) -> int:
+    """Return the earliest time at which classify would find the user
+    inactive, or NEVER if it can't without their report row changing."""
+    if (
+        username == "<root_account>"
+        or enabled == PASSWORD_DISABLED
+        or last_changed <= NOT_SUPPORTED
+    ):
+        return NEVER
+
+    grace_period_end = last_changed + (reset_grace_period_threshold + 1) * (
+        SECONDS_PER_DAY
+    )
+    if last_used == NO_INFORMATION:
+        return grace_period_end
+    if last_used <= NOT_SUPPORTED:
+        return NEVER
+
+    return max(
+        grace_period_end, last_used + (inactivity_threshold + 1) * SECONDS_PER_DAY
+    )
@@ -0,0 +1,218 @@
+"""Replay saved credential reports through the rules, without touching AWS.
+
+Usage: poetry run inactive-account-monitor REPORT_OR_DIRECTORY ... [options]
+
+Every report is evaluated in report only mode with the same rules as the
+Lambda, optionally as of another time and with other thresholds. Reports
+are evaluated in parallel on a process pool.
+
+Users matching exempt_username_patterns are reported as exempt, as they are
+by the Lambda. exempt_tags is not applied, as the users' tags aren't in the
+report, so users exempt by their tags are reported as matching.
+"""
+
+import argparse
+import dataclasses
+import datetime
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from src.config import Settings
+from src.exemptions import compile_patterns
+from src.report import CredentialReport
+from src.results import UserResult, exempt_result, format_login
+from src.rules import compile_rules, evaluate
+
+# Settings that can be overridden from the command line, by option name
+SETTING_OPTIONS = (
+    "inactivity_threshold_days",
+    "grace_period_threshold_days",
+    "access_key_unused_threshold_days",
+    "access_key_rotation_threshold_days",
+)
+
+EPILOG = (
+    "Users matching exempt_username_patterns, from the environment or "
+    "--exempt-username-patterns, are reported as exempt. Unlike the Lambda, "
+    "exempt_tags is not applied, as tags aren't in the credential report."
+)
+
+
+@dataclass
+class Replay:
+    path: str
+    users: int = 0
+    exempt: int = 0
+    rule_matches: Dict[str, int] = field(default_factory=dict)
+    results: List[UserResult] = field(default_factory=list)
+    seconds: Dict[str, float] = field(default_factory=dict)
+
+
+def replay(path: str, settings: Settings, now: Optional[datetime.datetime]) -> Replay:
+    """Evaluate the enabled rules against every user in a report file."""
+    result = Replay(path)
+    rules = compile_rules(settings, now)
+    username_exempt = compile_patterns(settings.exempt_username_patterns)
+    result.rule_matches = {rule.name: 0 for rule in rules}
+
+    start = time.perf_counter()
+    with open(path, "rb") as file:
+        report = CredentialReport(file.read())
+    result.seconds["read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for verdict in evaluate(report.records(), rules):
+        result.users += 1
+        if verdict.matched:
+            for rule in verdict.matched:
+                result.rule_matches[rule] += 1
+            if username_exempt is not None and username_exempt(verdict.user.username):
+                result.exempt += 1
+                result.results.append(
+                    exempt_result(
+                        path,
+                        verdict.user.username,
+                        verdict.matched,
+                        format_login(verdict.user),
+                    )
+                )
+            else:
+                result.results.append(
+                    UserResult.from_user(path, verdict.user, verdict.matched)
+                )
+    result.seconds["evaluate"] = time.perf_counter() - start
+
+    return result
+
+
+def report_paths(paths: List[str]) -> List[str]:
+    """Expand directories into the CSV files directly inside them."""
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            expanded += sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if name.endswith(".csv")
+            )
+        else:
+            expanded.append(path)
+
+    return expanded
+
+
+def parse_now(value: str) -> datetime.datetime:
+    # The rules compare wall clock times, like helpers.py
+    return datetime.datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="inactive-account-monitor",
+        description="Replay saved credential reports through the rules.",
+        epilog=EPILOG,
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="credential report CSV files, or directories of them"
+    )
+    parser.add_argument(
+        "--now",
+        type=parse_now,
+        help="evaluate as of this ISO 8601 time instead of the current time",
+    )
+    parser.add_argument(
+        "--rules", help="comma separated rules to evaluate, e.g. console-inactive"
+    )
+    for name in SETTING_OPTIONS:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name)
+    parser.add_argument(
+        "--exempt-username-patterns",
+        help="comma separated globs of usernames to report as exempt, e.g. breakglass-*",
+    )
+    parser.add_argument("--workers", type=int, help="processes to evaluate reports on")
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print each verdict as a line of JSON instead of text",
+    )
+
+    return parser
+
+
+def build_settings(args: argparse.Namespace) -> Settings:
+    """The settings from the environment, with the command line's overrides."""
+    overrides = {
+        name: getattr(args, name)
+        for name in SETTING_OPTIONS
+        if getattr(args, name) is not None
+    }
+    if args.rules is not None:
+        overrides["enabled_rules"] = tuple(
+            rule.strip() for rule in args.rules.split(",") if rule.strip()
+        )
+    if args.exempt_username_patterns is not None:
+        overrides["exempt_username_patterns"] = tuple(
+            pattern.strip()
+            for pattern in args.exempt_username_patterns.split(",")
+            if pattern.strip()
+        )
+
+    return dataclasses.replace(Settings.from_environ(), **overrides)
+
+
+def print_replay(result: Replay, as_json: bool):
+    for user in result.results:
+        if as_json:
+            print(json.dumps(dataclasses.asdict(user), separators=(",", ":")))
+        else:
+            print(
+                f"{result.path}\t{user.username}\t{','.join(user.rules)}\t"
+                f"{user.last_console_login}\t{user.action}"
+            )
+
+    matches = ", ".join(
+        f"{rule} {count}" for rule, count in result.rule_matches.items()
+    )
+    timings = ", ".join(
+        f"{name} {seconds:.3f}s" for name, seconds in result.seconds.items()
+    )
+    print(
+        f"{result.path}: {result.users} users, {matches}, exempt {result.exempt} "
+        f"({timings})",
+        file=sys.stderr,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        settings = build_settings(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    paths = report_paths(args.paths)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        replays = executor.map(
+            replay, paths, [settings] * len(paths), [args.now] * len(paths)
+        )
+        for result in replays:
+            print_replay(result, args.json)
+
+    print(
+        f"Replayed {len(paths)} reports in {time.perf_counter() - start:.3f}s",
+        file=sys.stderr,
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+from functools import cache
+from typing import Optional, Tuple
+
+from src.config import get_settings
+from src.instrumentation import get_instrumentation
+
+
+def pool_size(max_workers: Optional[int] = None) -> int:
+    """Connections for a client shared by every thread calling IAM at once.
+
+    The remediation workers, max_workers or remediation_max_workers, also
+    list exempt users' tags, and service access jobs run on threads of their
+    own, so the pool has a connection for the larger of the two, plus one
+    for the credential report. Otherwise concurrent calls would queue for a
+    connection, or open and discard connections beyond the pool.
+    """
+    settings = get_settings()
+    workers = max_workers or settings.remediation_max_workers
+    if settings.service_access_enabled:
+        workers = max(workers, settings.service_access_max_jobs)
+
+    return workers + 1
+
+
+def client_config(max_pool_connections: Optional[int] = None):
+    """The botocore Config every client is created with, with a pool of
+    pool_size() connections by default."""
+    from botocore.config import Config
+
+    settings = get_settings()
+    return Config(
+        retries={
+            "mode": settings.client_retry_mode,
+            # Including the first attempt, unlike max_attempts
+            "total_max_attempts": settings.client_max_attempts,
+        },
+        max_pool_connections=max_pool_connections or pool_size(),
+        connect_timeout=settings.client_connect_timeout_seconds,
+        read_timeout=settings.client_read_timeout_seconds,
+    )
+
+
+def create_client(
+    service_name: str,
+    session=None,
+    max_pool_connections: Optional[int] = None,
+    **kwargs,
+):
+    """Create a client, from the session when given, with client_config."""
+    import boto3
+
+    return (session or boto3).client(
+        service_name, config=client_config(max_pool_connections), **kwargs
+    )
+
+
+S3_SCHEME = "s3://"
+
+
+def parse_s3_uri(uri: str) -> Tuple[str, str]:
+    """The bucket and key prefix of an s3://bucket/prefix/ URI. The prefix is
+    empty, or ends with a slash so keys can be appended to it."""
+    bucket, _, prefix = uri[len(S3_SCHEME) :].partition("/")
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+
+    return bucket, prefix
+
+
+@cache
+def get_client(service_name: str):
+    """Return a client for the service, created on first use and reused by
+    later (warm) invocations."""
+    return get_instrumentation().instrument_client(create_client(service_name))
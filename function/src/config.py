@@ -1,31 +1,229 @@
+import dataclasses
 import os
+from functools import cache
+from typing import Any, Dict, Optional, Tuple
 
-from aws_lambda_powertools import Logger
+from src.logger import logger
 
-logger = Logger(service="inactive-account-monitor")
+TRUE_VALUES = ("true", "1", "yes")
+FALSE_VALUES = ("false", "0", "no")
+RETRY_MODES = ("legacy", "standard", "adaptive")
 
 
-class Config:
-    __conf = {
-        "inactivity_threshold_days": 30,
-        "default_region": "eu-west-2",
-        "grace_period_threshold_days": 7,
-        "get_credential_report_retry_limit": 5,
-    }
+def setting(default, minimum=None, maximum=None):
+    """A Settings field with optional inclusive bounds."""
+    return dataclasses.field(
+        default=default, metadata={"minimum": minimum, "maximum": maximum}
+    )
 
-    @staticmethod
-    def get(name):
-        value = None
 
-        logger.debug("Retrieving config value for key {0}".format(name))
-        if name in Config.__conf:
-            value = Config.__conf[name]
+@dataclasses.dataclass(frozen=True)
+class Settings:
+    """Configuration read from environment variables of the same name.
 
-        value = os.environ.get(name, value)
+    Values are parsed and validated once per cold start by get_settings, so
+    hot paths read plain attributes.
+    """
 
-        if value is None:
-            raise KeyError(
-                "Could not retrieve configuration value for [{0}]".format(name)
+    report_only: bool = True
+    inactivity_threshold_days: int = setting(30, minimum=1)
+    grace_period_threshold_days: int = setting(7, minimum=0)
+    default_region: str = "eu-west-2"
+
+    get_credential_report_retry_limit: int = setting(5, minimum=1)
+    credential_report_backoff_base_seconds: float = setting(1.0, minimum=0)
+    credential_report_backoff_max_seconds: float = setting(16.0, minimum=0)
+    # Reports are only regenerated by AWS every four hours
+    credential_report_max_age_seconds: int = setting(4 * 60 * 60, minimum=0)
+    # Also list the users through the IAM API when the report isn't ready by
+    # then, and use whichever finishes first
+    listing_fallback_enabled: bool = True
+    listing_fallback_after_seconds: float = setting(10.0, minimum=0)
+
+    remediation_max_workers: int = setting(8, minimum=1, maximum=64)
+    remediation_retry_limit: int = setting(5, minimum=1)
+    remediation_backoff_base_seconds: float = setting(0.5, minimum=0)
+    remediation_backoff_max_seconds: float = setting(8.0, minimum=0)
+
+    # botocore retries, on top of which throttled remediation calls are
+    # retried with remediation_backoff_*
+    client_retry_mode: str = "adaptive"
+    client_max_attempts: int = setting(3, minimum=1)
+    client_connect_timeout_seconds: float = setting(5.0, minimum=0)
+    client_read_timeout_seconds: float = setting(30.0, minimum=0)
+
+    # Comma separated role ARNs, one per account, to monitor from this account
+    organisation_role_arns: Tuple[str, ...] = ()
+    organisation_max_concurrent_accounts: int = setting(4, minimum=1, maximum=32)
+    organisation_remediation_max_workers: int = setting(4, minimum=1, maximum=64)
+    sts_session_duration_seconds: int = setting(3600, minimum=900, maximum=43200)
+    sts_session_refresh_margin_seconds: int = setting(300, minimum=0)
+
+    # SQLite database keeping each user's classification between runs, to
+    # report who became inactive since, e.g. under /tmp to reuse it across
+    # warm invocations
+    state_store_path: Optional[str] = None
+
+    # Where to checkpoint remediation progress, so a run stopped before the
+    # Lambda timeout is resumed by the next invocation: an s3://bucket/prefix/,
+    # or a SQLite database path
+    checkpoint_store_uri: Optional[str] = None
+    checkpoint_store_path: Optional[str] = None
+    remediation_chunk_size: int = setting(50, minimum=1)
+    # Time kept back from the Lambda timeout to save the checkpoint and return
+    checkpoint_margin_seconds: float = setting(5.0, minimum=0)
+
+    # Index of each user's last console login and password change, kept up
+    # to date from CloudTrail events by handle_activity_event, which the
+    # scheduled run reads the users due to be disabled from. A DynamoDB table
+    # name, or a SQLite database path.
+    activity_index_table: Optional[str] = None
+    activity_index_path: Optional[str] = None
+    # How often the index is reconciled with a full credential report
+    activity_reconcile_interval_hours: int = setting(7 * 24, minimum=1)
+
+    # Local directory, or s3://bucket/prefix/, to stream each run's per-user
+    # results to as JSON Lines
+    results_uri: Optional[str] = None
+
+    # Comma separated rules to evaluate, from rules.RULES. Users matching
+    # console-inactive or key-unused are disabled, other rules only report.
+    enabled_rules: Tuple[str, ...] = ("console-inactive",)
+    access_key_unused_threshold_days: int = setting(90, minimum=1)
+    access_key_rotation_threshold_days: int = setting(90, minimum=1)
+
+    # Users never disabled: comma separated username globs, e.g. breakglass-*,
+    # and IAM user tags, as key or key=value
+    exempt_username_patterns: Tuple[str, ...] = ()
+    exempt_tags: Tuple[str, ...] = ()
+    # How long each user's tags are cached across warm invocations
+    exempt_tags_cache_seconds: int = setting(3600, minimum=0)
+
+    # Before deactivating users' access keys, find out when they last accessed
+    # any service with generate_service_last_accessed_details jobs, and keep
+    # the keys of users who did within inactivity_threshold_days
+    service_access_enabled: bool = False
+    # Jobs in flight at once, across every account monitored concurrently
+    service_access_max_jobs: int = setting(16, minimum=1, maximum=64)
+    service_access_poll_limit: int = setting(10, minimum=1)
+    service_access_backoff_base_seconds: float = setting(0.5, minimum=0)
+    service_access_backoff_max_seconds: float = setting(4.0, minimum=0)
+
+    # Profile every run with cProfile and tracemalloc, as well as invocations
+    # with "profile": true in their event, writing the artefacts to a local
+    # directory, /tmp/profiles by default, or s3://bucket/prefix/
+    profiling_enabled: bool = False
+    profiling_uri: Optional[str] = None
+    # Allocations listed for each phase, largest first
+    profiling_top_allocations: int = setting(10, minimum=1)
+
+    # Emit phase timings and IAM call counts as CloudWatch EMF metrics
+    metrics_enabled: bool = True
+    # Record each phase as an X-Ray subsegment, requires aws-xray-sdk
+    tracing_enabled: bool = False
+
+    def __post_init__(self):
+        errors = []
+        for field in dataclasses.fields(self):
+            value = getattr(self, field.name)
+            minimum = field.metadata.get("minimum")
+            maximum = field.metadata.get("maximum")
+            if minimum is not None and value < minimum:
+                errors.append(f"{field.name} must be at least {minimum}, got {value}")
+            if maximum is not None and value > maximum:
+                errors.append(f"{field.name} must be at most {maximum}, got {value}")
+
+        if self.client_retry_mode not in RETRY_MODES:
+            errors.append(
+                f"client_retry_mode must be one of {', '.join(RETRY_MODES)}, "
+                f"got {self.client_retry_mode!r}"
+            )
+
+        if self.checkpoint_store_uri and not self.checkpoint_store_uri.startswith(
+            "s3://"
+        ):
+            errors.append(
+                "checkpoint_store_uri must be an s3://bucket/prefix/, "
+                f"got {self.checkpoint_store_uri!r}"
             )
 
-        return value
+        for tag in self.exempt_tags:
+            if not tag.partition("=")[0].strip():
+                errors.append(f"exempt_tags: missing key in {tag!r}")
+
+        if self.organisation_role_arns and (
+            self.activity_index_table or self.activity_index_path
+        ):
+            # Events are only indexed for the account the function runs in
+            errors.append(
+                "activity_index_table and activity_index_path can't be used with "
+                "organisation_role_arns"
+            )
+
+        from src.rules import RULES
+
+        for rule in self.enabled_rules:
+            if rule not in RULES:
+                errors.append(f"enabled_rules: unknown rule {rule!r}")
+
+        if errors:
+            raise ValueError("Invalid configuration: " + "; ".join(errors))
+
+    @classmethod
+    def from_environ(cls, environ=os.environ) -> "Settings":
+        values: Dict[str, Any] = {}
+        errors = []
+        for field in dataclasses.fields(cls):
+            if field.name not in environ:
+                continue
+            if field.name == "report_only":
+                values[field.name] = parse_report_only(environ[field.name])
+                continue
+            try:
+                values[field.name] = parse_value(field.type, environ[field.name])
+            except ValueError as e:
+                errors.append(f"{field.name}: {e}")
+
+        if errors:
+            raise ValueError("Invalid configuration: " + "; ".join(errors))
+
+        return cls(**values)
+
+
+def parse_report_only(value: str) -> bool:
+    """Fail safe: only the exact "false" disables users, as it always has."""
+    if value == "false":
+        return False
+    if value != "true":
+        logger.warning(
+            "report_only isn't exactly false, so only reporting", value=value
+        )
+
+    return True
+
+
+def parse_value(field_type, value: str):
+    if field_type is bool:
+        if value.lower() in TRUE_VALUES:
+            return True
+        if value.lower() in FALSE_VALUES:
+            return False
+        raise ValueError(f"expected true or false, got {value!r}")
+    if field_type is int:
+        return int(value)
+    if field_type is float:
+        return float(value)
+    if field_type == Tuple[str, ...]:
+        return tuple(item.strip() for item in value.split(",") if item.strip())
+    if field_type == Optional[str]:
+        return value or None
+
+    return value
+
+
+@cache
+def get_settings() -> Settings:
+    settings = Settings.from_environ()
+    logger.debug("Loaded settings", settings=dataclasses.asdict(settings))
+
+    return settings
@@ -1,13 +1,23 @@
+from __future__ import annotations
+
+import datetime
+import threading
 from time import sleep
-from typing import Any, List, Type
+from typing import TYPE_CHECKING, Any, List, Optional, Type
+
+from botocore.exceptions import ClientError
 
-from aws_lambda_powertools import Logger
-from pydantic import BaseModel
+from src.config import get_settings
+from src.instrumentation import get_instrumentation
+from src.logger import logger
+from src.report import CredentialReport
+from src.retry import backoff_delay
 
-from src.config import Config
-from src.models import CredentialReport, User
+if TYPE_CHECKING:
+    from pydantic import BaseModel
 
-logger = Logger(service="inactive-account-monitor")
+# Errors returned by GetCredentialReport when there is no usable report
+REPORT_UNAVAILABLE_ERRORS = ("ReportNotPresent", "ReportExpired", "ReportInProgress")
 
 
 # Utility function to generate pydantic models from args (normally kwargs)
@@ -15,31 +25,84 @@ def populate_model_from_args(model: Type[BaseModel], args: List[Any]):
     return model(**{field: arg for field, arg in zip(model.model_fields, args)})
 
 
-def get_credential_report(iam_client) -> CredentialReport:
-    iam_client.generate_credential_report()
-    success = False
-    retry_limit = Config.get("get_credential_report_retry_limit")
-    retries = 0
+def is_report_fresh(response: dict, max_age_seconds: int) -> bool:
+    generated_time = response.get("GeneratedTime")
+    if generated_time is None:
+        return False
+
+    age = datetime.datetime.now(datetime.timezone.utc) - generated_time
+    return age.total_seconds() < max_age_seconds
+
+
+def fetch_recent_credential_report(iam_client, max_age_seconds: int) -> Optional[dict]:
+    """Return the existing credential report if it is younger than max_age_seconds."""
+    if max_age_seconds <= 0:
+        return None
+
+    try:
+        with get_instrumentation().phase("download"):
+            response = iam_client.get_credential_report()
+    except ClientError as e:
+        if e.response["Error"]["Code"] in REPORT_UNAVAILABLE_ERRORS:
+            return None
+        raise
+
+    if not is_report_fresh(response, max_age_seconds):
+        return None
+
+    return response
+
+
+def wait_for_credential_report(
+    iam_client, stop: Optional[threading.Event] = None
+) -> dict:
+    """Generate a credential report, polling its state with exponential backoff.
+
+    Polling is abandoned once stop is set, e.g. when another source of the
+    users was ready first.
+    """
+    settings = get_settings()
+    retry_limit = settings.get_credential_report_retry_limit
+    backoff_base = settings.credential_report_backoff_base_seconds
+    backoff_max = settings.credential_report_backoff_max_seconds
+
+    instrumentation = get_instrumentation()
+
+    with instrumentation.phase("generate"):
+        state = iam_client.generate_credential_report()["State"]
+
+    attempts = 1
+    with instrumentation.phase("poll"):
+        while state != "COMPLETE":
+            if attempts >= retry_limit:
+                raise Exception(
+                    f"Unable to get credential report after {attempts} attempts"
+                )
+
+            logger.info(f"Credential report generation state is {state}")
+            sleep(backoff_delay(attempts - 1, backoff_base, backoff_max))
+            if stop is not None and stop.is_set():
+                raise Exception("Abandoned waiting for the credential report")
+            state = iam_client.generate_credential_report()["State"]
+            attempts += 1
+
+    logger.info(f"Credential report ready after {attempts} attempts")
 
-    while not success and retries < retry_limit:
-        try:
-            iam_client.get_credential_report()
-            success = True
-        except Exception as e:
-            logger.info(e)
-            sleep(1)
-        finally:
-            retries = retries + 1
+    with instrumentation.phase("download"):
+        return iam_client.get_credential_report()
 
-    if retries == retry_limit:
-        raise Exception(f"Unable to get credential report after {retries} attempts")
 
-    logger.info(f"Got credential report after {retries} attempts")
+def get_credential_report(
+    iam_client, stop: Optional[threading.Event] = None
+) -> CredentialReport:
+    max_age = get_settings().credential_report_max_age_seconds
 
-    response = iam_client.get_credential_report()
-    content = response["Content"].decode("utf8").strip()
-    rows = content.split("\n")
-    body = rows[1:]
-    users = [populate_model_from_args(User, row.split(",")) for row in body]
+    response = fetch_recent_credential_report(iam_client, max_age)
+    if response is None:
+        response = wait_for_credential_report(iam_client, stop)
+    else:
+        logger.info(
+            f"Reusing credential report generated at {response['GeneratedTime']}"
+        )
 
-    return CredentialReport(users=users)
+    return CredentialReport(response["Content"], response.get("GeneratedTime"))
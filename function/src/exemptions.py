@@ -0,0 +1,160 @@
+"""Users exempt from being disabled, e.g. break-glass or service users.
+
+Users are exempt when their username matches one of exempt_username_patterns,
+shell style globs compiled once into a single regular expression, or when
+they have one of exempt_tags. Tags are only listed for the users found
+inactive, concurrently, and cached across warm invocations for
+exempt_tags_cache_seconds.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from botocore.exceptions import ClientError
+
+from src.config import get_settings
+from src.logger import logger
+from src.remediation import is_no_such_entity
+
+Tags = Dict[str, str]
+
+
+@lru_cache(maxsize=8)
+def compile_patterns(patterns: Tuple[str, ...]) -> Optional[Callable[[str], bool]]:
+    """A single matcher for all the globs, or None if there are none."""
+    if not patterns:
+        return None
+
+    regex = re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns))
+    return lambda username: regex.match(username) is not None
+
+
+def parse_tags(specs: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Map each exempting tag key to its value, or None for any value."""
+    tags: Dict[str, Optional[str]] = {}
+    for spec in specs:
+        key, separator, value = spec.partition("=")
+        tags[key.strip()] = value.strip() if separator else None
+
+    return tags
+
+
+class TagCache:
+    """Users' tags by account and username, expiring after ttl_seconds."""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], Tuple[float, Tags]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, account: str, username: str) -> Optional[Tags]:
+        with self._lock:
+            entry = self._entries.get((account, username))
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+
+        return entry[1]
+
+    def put(self, account: str, username: str, tags: Tags, ttl_seconds: float):
+        with self._lock:
+            self._entries[(account, username)] = (time.monotonic() + ttl_seconds, tags)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by warm invocations
+_tag_cache = TagCache()
+
+
+def get_tag_cache() -> TagCache:
+    return _tag_cache
+
+
+class Exemptions:
+    """Decides which of an account's inactive users are exempt."""
+
+    def __init__(
+        self,
+        iam_client,
+        account: str = "self",
+        max_workers: Optional[int] = None,
+        cache: Optional[TagCache] = None,
+    ):
+        settings = get_settings()
+        self.iam_client = iam_client
+        self.account = account
+        self.max_workers = max_workers or settings.remediation_max_workers
+        self.cache = cache or get_tag_cache()
+        self.ttl_seconds = settings.exempt_tags_cache_seconds
+        self._matcher = compile_patterns(settings.exempt_username_patterns)
+        self.tags = parse_tags(settings.exempt_tags)
+
+    @property
+    def enabled(self) -> bool:
+        return self._matcher is not None or bool(self.tags)
+
+    def user_tags(self, username: str) -> Tags:
+        tags = self.cache.get(self.account, username)
+        if tags is not None:
+            return tags
+
+        tags = {}
+        paginator = self.iam_client.get_paginator("list_user_tags")
+        try:
+            for page in paginator.paginate(UserName=username):
+                for tag in page["Tags"]:
+                    tags[tag["Key"]] = tag["Value"]
+        except ClientError as e:
+            # Deleted since the report, so there's nothing to disable
+            if not is_no_such_entity(e):
+                raise
+
+        self.cache.put(self.account, username, tags, self.ttl_seconds)
+        return tags
+
+    def has_exempt_tag(self, username: str) -> bool:
+        try:
+            tags = self.user_tags(username)
+        except Exception as e:
+            # Leave the user alone rather than risk disabling a break-glass user
+            logger.warning(
+                f"Unable to list the tags of {username}, treating them as exempt: {e}",
+                account=self.account,
+            )
+            return True
+
+        return any(
+            key in tags and (value is None or tags[key] == value)
+            for key, value in self.tags.items()
+        )
+
+    def username_exempt(self, username: str) -> bool:
+        return self._matcher is not None and self._matcher(username)
+
+    def exempt(self, usernames: Iterable[str]) -> Set[str]:
+        """The exempt users among usernames, listing tags concurrently."""
+        exempt = set()
+        remaining = []
+        for username in usernames:
+            if self.username_exempt(username):
+                exempt.add(username)
+            else:
+                remaining.append(username)
+
+        if self.tags and remaining:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for username, tagged in zip(
+                    remaining, executor.map(self.has_exempt_tag, remaining)
+                ):
+                    if tagged:
+                        exempt.add(username)
+
+        return exempt
@@ -1,21 +1,26 @@
+from __future__ import annotations
+
 import datetime
+from typing import TYPE_CHECKING, Optional
 
-from src.models import User
+if TYPE_CHECKING:
+    from src.models import UserLike
 
 
-def is_root_user(user: User) -> bool:
+def is_root_user(user: UserLike) -> bool:
     return user.username == "<root_account>"
 
 
-def has_never_logged_in(user: User) -> bool:
+def has_never_logged_in(user: UserLike) -> bool:
     return user.password_last_used == "no_information"
 
 
-def has_exceeded_inactivity_threshold(user: User, inactivity_threshold: int) -> bool:
+def has_exceeded_inactivity_threshold(
+    user: UserLike, inactivity_threshold: int, now: Optional[datetime.datetime] = None
+) -> bool:
     if isinstance(user.password_last_used, datetime.date):
-        dt_since_login = datetime.datetime.now() - user.password_last_used.replace(
-            tzinfo=None
-        )
+        now = now or datetime.datetime.now()
+        dt_since_login = now - user.password_last_used.replace(tzinfo=None)
         days_since_login = dt_since_login.days
 
         return days_since_login > inactivity_threshold
@@ -24,12 +29,13 @@ def has_exceeded_inactivity_threshold(user: User, inactivity_threshold: int) ->
 
 
 def has_exceeded_password_reset_grace_period(
-    user: User, reset_grace_period_threshold: int
+    user: UserLike,
+    reset_grace_period_threshold: int,
+    now: Optional[datetime.datetime] = None,
 ) -> bool:
     if isinstance(user.password_last_changed, datetime.date):
-        dt_since_password_reset = (
-            datetime.datetime.now() - user.password_last_changed.replace(tzinfo=None)
-        )
+        now = now or datetime.datetime.now()
+        dt_since_password_reset = now - user.password_last_changed.replace(tzinfo=None)
         days_since_password_reset = dt_since_password_reset.days
         return days_since_password_reset > reset_grace_period_threshold
 
@@ -37,7 +43,10 @@ def has_exceeded_password_reset_grace_period(
 
 
 def is_inactive(
-    user: User, inactivity_threshold: int, reset_grace_period_threshold: int
+    user: UserLike,
+    inactivity_threshold: int,
+    reset_grace_period_threshold: int,
+    now: Optional[datetime.datetime] = None,
 ):
     if is_root_user(user):
         return False
@@ -48,13 +57,17 @@ def is_inactive(
 
     # Allow users some time to login after a account creation
     if has_never_logged_in(user):
-        if has_exceeded_password_reset_grace_period(user, reset_grace_period_threshold):
+        if has_exceeded_password_reset_grace_period(
+            user, reset_grace_period_threshold, now
+        ):
             return True
         return False
 
     if has_exceeded_inactivity_threshold(
-        user, inactivity_threshold
-    ) and has_exceeded_password_reset_grace_period(user, reset_grace_period_threshold):
+        user, inactivity_threshold, now
+    ) and has_exceeded_password_reset_grace_period(
+        user, reset_grace_period_threshold, now
+    ):
         return True
 
     return False
@@ -70,11 +83,13 @@ def disable_programmatic_access(iam_client, username: str):
     )
 
     for access_key in response["AccessKeyMetadata"]:
+        if access_key["Status"] == "Inactive":
+            continue
         iam_client.update_access_key(
             UserName=username, AccessKeyId=access_key["AccessKeyId"], Status="Inactive"
         )
 
 
-def disable_user(iam_client, user: User):
+def disable_user(iam_client, user: UserLike):
     disable_console_access(iam_client, user.username)
     disable_programmatic_access(iam_client, user.username)
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.config import get_settings
+from src.logger import logger
+from src.retry import THROTTLING_ERRORS
+
+if TYPE_CHECKING:
+    from src.profiling import Profiler
+
+METRICS_NAMESPACE = "InactiveAccountMonitor"
+SERVICE = "inactive-account-monitor"
+
+# When a phase started and ended, in perf_counter seconds
+Interval = Tuple[float, float]
+
+
+def wall_clock_seconds(intervals: Iterable[Interval]) -> float:
+    """The time during which any of the intervals was running.
+
+    Accounts are monitored concurrently, so summing their phases would count
+    time they overlap more than once, and could exceed the run itself.
+    """
+    merged: List[List[float]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return sum(end - start for start, end in merged)
+
+
+class InMemoryCollector:
+    """Collects phase timings and IAM call counts for the current invocation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.phases: Dict[str, List[Interval]] = {}
+            self.calls: Counter = Counter()
+            self.throttles: Counter = Counter()
+
+    def record_phase(self, name: str, start: float, end: float):
+        with self._lock:
+            self.phases.setdefault(name, []).append((start, end))
+
+    def record_call(self, operation: str):
+        with self._lock:
+            self.calls[operation] += 1
+
+    def record_throttle(self, operation: str):
+        with self._lock:
+            self.throttles[operation] += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "phases": {
+                    name: wall_clock_seconds(intervals)
+                    for name, intervals in self.phases.items()
+                },
+                "calls": dict(self.calls),
+                "throttles": dict(self.throttles),
+            }
+
+
+class Instrumentation:
+    """Times the phases of a run and counts the IAM calls made.
+
+    A phase's duration is the wall clock time during which it was running
+    in any account, not the sum across accounts.
+
+    The data is always kept in memory, and is emitted as CloudWatch EMF
+    metrics on flush when metrics are enabled. When a Tracer is given each
+    phase is also recorded as an X-Ray subsegment.
+    """
+
+    def __init__(self, metrics_enabled: bool = False, tracer=None):
+        self.collector = InMemoryCollector()
+        self.metrics_enabled = metrics_enabled
+        self.tracer = tracer
+        # Attached while a run is profiled, see profiling.py
+        self.profiler: Optional[Profiler] = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        subsegment = (
+            self.tracer.provider.in_subsegment(f"## {name}")
+            if self.tracer is not None
+            else nullcontext()
+        )
+        profiling = (
+            self.profiler.phase(name) if self.profiler is not None else nullcontext()
+        )
+        start = time.perf_counter()
+        try:
+            with subsegment, profiling:
+                yield
+        finally:
+            self.collector.record_phase(name, start, time.perf_counter())
+
+    def _before_call(self, model, **kwargs):
+        self.collector.record_call(model.name)
+
+    def _needs_retry(self, response, operation, **kwargs):
+        # Called for every attempt, including those botocore retries itself
+        if response is None:
+            return
+        error_code = response[1].get("Error", {}).get("Code")
+        if error_code in THROTTLING_ERRORS:
+            self.collector.record_throttle(operation.name)
+
+    def instrument_client(self, client):
+        """Count every call, and throttled attempt, made with the client."""
+        events = client.meta.events
+        service = client.meta.service_model.service_name
+        events.register(f"before-call.{service}", self._before_call)
+        events.register(f"needs-retry.{service}", self._needs_retry)
+
+        return client
+
+    def flush(self) -> dict:
+        """Log this invocation's data, emit it as metrics and start afresh."""
+        summary = self.collector.summary()
+        logger.info("Run instrumentation", instrumentation=summary)
+
+        if self.metrics_enabled:
+            emit_metrics(summary)
+
+        self.collector.reset()
+
+        return summary
+
+
+def emit_metrics(summary: dict):
+    from aws_lambda_powertools.metrics import MetricUnit, single_metric
+
+    for name, seconds in summary["phases"].items():
+        with single_metric(
+            name="PhaseDuration",
+            unit=MetricUnit.Milliseconds,
+            value=seconds * 1000,
+            namespace=METRICS_NAMESPACE,
+            default_dimensions={"service": SERVICE, "Phase": name},
+        ):
+            pass
+
+    for metric, counts in (("IamCalls", "calls"), ("IamThrottles", "throttles")):
+        for operation, count in summary[counts].items():
+            with single_metric(
+                name=metric,
+                unit=MetricUnit.Count,
+                value=count,
+                namespace=METRICS_NAMESPACE,
+                default_dimensions={"service": SERVICE, "Operation": operation},
+            ):
+                pass
+
+
+def create_tracer():
+    try:
+        from aws_lambda_powertools import Tracer
+
+        return Tracer(service=SERVICE)
+    except ImportError:
+        logger.warning("Tracing is enabled but aws-xray-sdk is not installed")
+        return None
+
+
+_instrumentation: Optional[Instrumentation] = None
+
+
+def get_instrumentation() -> Instrumentation:
+    global _instrumentation
+
+    if _instrumentation is None:
+        settings = get_settings()
+        _instrumentation = Instrumentation(
+            settings.metrics_enabled,
+            create_tracer() if settings.tracing_enabled else None,
+        )
+
+    return _instrumentation
@@ -1,45 +1,154 @@
-from typing import Any
+from __future__ import annotations
 
-import boto3
-from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.typing import LambdaContext
+import asyncio
+from typing import TYPE_CHECKING, Any, Optional
 
-from src.config import Config
-from src.credential_report import get_credential_report
-from src.helpers import disable_user, is_inactive
+from src.account import monitor_account
+from src.activity import Thresholds, open_activity_index, record_batch
+from src.async_pipeline import (
+    check_supported,
+    monitor_account_async,
+    monitor_organisation_async,
+)
+from src.checkpoint import Deadline
+from src.clients import get_client
+from src.config import get_settings
+from src.instrumentation import get_instrumentation
+from src.logger import logger
+from src.organisation import SessionCache, monitor_organisation
+from src.profiling import profiled
+from src.results import ResultSink, close_sink, open_sink
 
-iam_client = boto3.client("iam")
-logger = Logger(service="inactive-account-monitor")
-inactivity_threshold = Config.get("inactivity_threshold_days")
-grace_period_threshold = Config.get("grace_period_threshold_days")
-report_only = Config.get("report_only") != "false"
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.typing import LambdaContext
+
+# Fail the cold start straight away if the configuration is invalid
+settings = get_settings()
+session_cache: Optional[SessionCache] = None
+
+
+def get_session_cache() -> SessionCache:
+    global session_cache
+
+    if session_cache is None:
+        session_cache = SessionCache(get_client("sts"))
+
+    return session_cache
+
+
+def open_results_sink() -> Optional[ResultSink]:
+    return open_sink(settings.results_uri) if settings.results_uri else None
+
+
+def compact_summary(
+    summary: dict, sink: Optional[ResultSink], instrumentation: dict
+) -> dict:
+    """The per-account and per-user detail is left to the results, so that
+    the summary returned stays small however many users there are."""
+    compact = {
+        key: value
+        for key, value in summary.items()
+        if key not in ("accounts", "newly_inactive")
+    }
+    if summary.get("newly_inactive") is not None:
+        compact["newly_inactive"] = (
+            summary["newly_inactive"]
+            if isinstance(summary["newly_inactive"], int)
+            else len(summary["newly_inactive"])
+        )
+    compact["results"] = sink.location if sink is not None else None
+    compact["instrumentation"] = instrumentation
+
+    return compact
 
 
 @logger.inject_lambda_context(log_event=True)
+@profiled
 def handle_event(event: dict, context: LambdaContext) -> dict[Any, Any]:
-    credential_report = get_credential_report(iam_client)
-    users = credential_report.users
+    """Monitor the account, or organisation, and return a compact summary.
 
-    logger.info(f"Found {len(users)} user accounts.")
+    While users are left to disable when the invocation stops, the summary
+    carries their continuation_token, or an organisation's
+    continuation_tokens by account. The next invocation resumes from the
+    checkpoint when its event has the same, or none.
+    """
+    deadline = Deadline(
+        context.get_remaining_time_in_millis, settings.checkpoint_margin_seconds
+    )
+    sink = open_results_sink()
 
-    inactive_console_users = [
-        user
-        for user in users
-        if is_inactive(user, inactivity_threshold, grace_period_threshold)
-    ]
+    try:
+        if settings.organisation_role_arns:
+            summary = monitor_organisation(
+                get_session_cache(),
+                settings.organisation_role_arns,
+                settings.report_only,
+                deadline,
+                sink,
+                event.get("continuation_tokens"),
+            )
+            logger.info("Organisation summary", summary=summary)
+        else:
+            summary = monitor_account(
+                get_client("iam"),
+                settings.report_only,
+                deadline=deadline,
+                sink=sink,
+                continuation_token=event.get("continuation_token"),
+            ).to_dict()
+    finally:
+        close_sink(sink)
+        instrumentation = get_instrumentation().flush()
 
-    logger.info(f"Found {len(inactive_console_users)} inactive user accounts.")
+    return compact_summary(summary, sink, instrumentation)
 
-    if report_only:
-        for user in inactive_console_users:
-            logger.info(
-                f"{user.username} is inactive, last console login: {user.password_last_used}"
-            )
-    else:
-        for user in inactive_console_users:
-            disable_user(iam_client, user)
-            logger.info(
-                f"{user.username} has been disabled, last console login: {user.password_last_used}"
+
+@logger.inject_lambda_context(log_event=True)
+@profiled
+def handle_event_async(event: dict, context: LambdaContext) -> dict[Any, Any]:
+    """Alternative entry point running the asyncio pipeline."""
+    check_supported(settings)
+    sink = open_results_sink()
+
+    try:
+        if settings.organisation_role_arns:
+            summary = asyncio.run(
+                monitor_organisation_async(
+                    get_session_cache(),
+                    settings.organisation_role_arns,
+                    settings.report_only,
+                    sink,
+                )
             )
+            logger.info("Organisation summary", summary=summary)
+        else:
+            summary = asyncio.run(
+                monitor_account_async(
+                    get_client("iam"), settings.report_only, sink=sink
+                )
+            ).to_dict()
+    finally:
+        close_sink(sink)
+        instrumentation = get_instrumentation().flush()
+
+    return compact_summary(summary, sink, instrumentation)
+
+
+@logger.inject_lambda_context
+def handle_activity_event(event: dict, context: LambdaContext) -> dict[Any, Any]:
+    """Record the console logins and password changes in a batch of
+    CloudTrail events, from SQS or EventBridge, in the activity index.
+
+    Returns the SQS partial batch response, so only the messages that
+    failed to be recorded are redelivered.
+    """
+    index = open_activity_index(settings)
+    if index is None:
+        raise ValueError(
+            "activity_index_table or activity_index_path must be set to record activity"
+        )
+
+    # Without an organisation, the scheduled run indexes its account as self
+    account = None if settings.organisation_role_arns else "self"
 
-    return event
+    return record_batch(index, event, Thresholds.from_settings(settings), account)
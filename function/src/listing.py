@@ -0,0 +1,258 @@
+"""An alternative to the credential report, built from the IAM list APIs.
+
+Generating a credential report is rate limited by AWS and can take longer
+than the polling budget on large accounts. The same columns can be listed
+per user instead: ListUsers includes when each password was last used, and
+the login profile, access keys and MFA devices are fanned out across a
+thread pool. The result is a CSV in the credential report's format, so the
+rest of the pipeline can't tell the sources apart.
+
+No API has when a password was last changed. The login profile's CreateDate
+doesn't move when the password is reset, so a recently reset user would look
+past the grace period, and password_last_changed is always N/A instead. The
+console-inactive rule can't be evaluated without it, so the users are only
+listed when no enabled rule needs it, and otherwise the run waits for the
+credential report, or fails.
+"""
+
+from __future__ import annotations
+
+import csv
+import datetime
+import io
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+from src.config import get_settings
+from src.credential_report import get_credential_report
+from src.instrumentation import get_instrumentation
+from src.logger import logger
+from src.remediation import is_no_such_entity
+from src.report import LISTED_USERS, CredentialReport
+from src.rules import CONSOLE_INACTIVE, MFA_MISSING
+
+REPORT_HEADER = [
+    "user",
+    "arn",
+    "user_creation_time",
+    "password_enabled",
+    "password_last_used",
+    "password_last_changed",
+    "password_next_rotation",
+    "mfa_active",
+    "access_key_1_active",
+    "access_key_1_last_rotated",
+    "access_key_1_last_used_date",
+    "access_key_1_last_used_region",
+    "access_key_1_last_used_service",
+    "access_key_2_active",
+    "access_key_2_last_rotated",
+    "access_key_2_last_used_date",
+    "access_key_2_last_used_region",
+    "access_key_2_last_used_service",
+    "cert_1_active",
+    "cert_1_last_rotated",
+    "cert_2_active",
+    "cert_2_last_rotated",
+]
+
+
+# Rules needing password_last_changed, which isn't listed
+UNLISTABLE_RULES = frozenset((CONSOLE_INACTIVE,))
+
+
+def format_time(value: Optional[datetime.datetime], missing: str = "N/A") -> str:
+    """Format a time like the credential report, e.g. 2023-06-02T13:45:12+00:00."""
+    if value is None:
+        return missing
+
+    return value.astimezone(datetime.timezone.utc).replace(microsecond=0).isoformat()
+
+
+def format_bool(value: bool) -> str:
+    return "true" if value else "false"
+
+
+class UserLister:
+    """Lists every user's credentials into credential report rows.
+
+    Signing certificates aren't listed, as nothing reads them. MFA devices
+    are only listed when a rule needs them.
+    """
+
+    def __init__(
+        self,
+        iam_client,
+        max_workers: Optional[int] = None,
+        include_mfa: bool = False,
+        stop: Optional[threading.Event] = None,
+    ):
+        self.iam_client = iam_client
+        self.max_workers = max_workers or get_settings().remediation_max_workers
+        self.include_mfa = include_mfa
+        self.stop = stop or threading.Event()
+
+    def _has_login_profile(self, username: str) -> bool:
+        try:
+            self.iam_client.get_login_profile(UserName=username)
+        except ClientError as e:
+            if is_no_such_entity(e):
+                return False
+            raise
+
+        return True
+
+    def _access_key_columns(self, username: str) -> List[str]:
+        paginator = self.iam_client.get_paginator("list_access_keys")
+        keys = [
+            key
+            for page in paginator.paginate(UserName=username)
+            for key in page["AccessKeyMetadata"]
+        ]
+        # A user has at most two keys, reported oldest first
+        keys.sort(key=lambda key: key["CreateDate"])
+
+        columns = []
+        for index in range(2):
+            if index >= len(keys):
+                columns += ["false", "N/A", "N/A", "N/A", "N/A"]
+                continue
+
+            key = keys[index]
+            last_used = self.iam_client.get_access_key_last_used(
+                AccessKeyId=key["AccessKeyId"]
+            )["AccessKeyLastUsed"]
+            columns += [
+                format_bool(key["Status"] == "Active"),
+                format_time(key["CreateDate"]),
+                format_time(last_used.get("LastUsedDate")),
+                last_used.get("Region", "N/A"),
+                last_used.get("ServiceName", "N/A"),
+            ]
+
+        return columns
+
+    def _mfa_active(self, username: str) -> bool:
+        if not self.include_mfa:
+            return False
+
+        response = self.iam_client.list_mfa_devices(UserName=username)
+        return bool(response["MFADevices"])
+
+    def user_row(self, user: Dict) -> Optional[List[str]]:
+        """The user's credential report row, or None if they were deleted
+        while being listed, or listing was stopped."""
+        if self.stop.is_set():
+            return None
+
+        username = user["UserName"]
+        try:
+            password_enabled = self._has_login_profile(username)
+            # Kept after the password is removed, like the report
+            password_last_used = format_time(
+                user.get("PasswordLastUsed"),
+                "no_information" if password_enabled else "N/A",
+            )
+
+            return [
+                username,
+                user["Arn"],
+                format_time(user["CreateDate"]),
+                format_bool(password_enabled),
+                password_last_used,
+                # Not known, see above
+                "N/A",
+                "N/A",
+                format_bool(self._mfa_active(username)),
+                *self._access_key_columns(username),
+                "false",
+                "N/A",
+                "false",
+                "N/A",
+            ]
+        except ClientError as e:
+            if is_no_such_entity(e):
+                return None
+            raise
+
+    def list_report(self) -> CredentialReport:
+        generated_time = datetime.datetime.now(datetime.timezone.utc)
+        paginator = self.iam_client.get_paginator("list_users")
+        users = (user for page in paginator.paginate() for user in page["Users"])
+
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator="\n")
+        writer.writerow(REPORT_HEADER)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for row in executor.map(self.user_row, users):
+                if row is not None:
+                    writer.writerow(row)
+
+        if self.stop.is_set():
+            raise Exception("Abandoned listing the users")
+
+        return CredentialReport(
+            output.getvalue().encode("utf8"), generated_time, LISTED_USERS
+        )
+
+
+def list_credential_report(
+    iam_client, stop: Optional[threading.Event] = None
+) -> CredentialReport:
+    """Build the credential report from the IAM list APIs."""
+    lister = UserLister(
+        iam_client,
+        include_mfa=MFA_MISSING in get_settings().enabled_rules,
+        stop=stop,
+    )
+    with get_instrumentation().phase("list"):
+        return lister.list_report()
+
+
+def get_first_report(iam_client) -> CredentialReport:
+    """Return the credential report, or if it has failed or isn't ready
+    within listing_fallback_after_seconds, whichever of it and the listed
+    users is ready first. The users are only listed when every enabled rule
+    can be evaluated from the listing."""
+    settings = get_settings()
+    if not settings.listing_fallback_enabled:
+        return get_credential_report(iam_client)
+    unlistable = UNLISTABLE_RULES.intersection(settings.enabled_rules)
+    if unlistable:
+        logger.info(
+            f"{', '.join(sorted(unlistable))} can't be evaluated from the listed "
+            "users, waiting for the credential report"
+        )
+        return get_credential_report(iam_client)
+
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        report = executor.submit(get_credential_report, iam_client, stop)
+        sources = {report: "credential report"}
+        wait([report], timeout=settings.listing_fallback_after_seconds)
+        if not report.done() or report.exception() is not None:
+            logger.info("Credential report not ready, listing the users")
+            listing = executor.submit(list_credential_report, iam_client, stop)
+            sources[listing] = "listed users"
+
+        pending = set(sources)
+        failure: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                failure = future.exception()
+                if failure is None:
+                    logger.info(f"Using the {sources[future]}")
+                    return future.result()
+                logger.warning(f"Unable to get the {sources[future]}: {failure}")
+
+        assert failure is not None
+        raise failure
+    finally:
+        # Stop the other source, without waiting for it to notice
+        stop.set()
+        executor.shutdown(wait=False)
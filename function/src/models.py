@@ -1,12 +1,20 @@
+from collections.abc import Iterator
 from datetime import datetime
-from typing import List, Literal, Union
+from functools import cache
+from typing import Any, Dict, List, Literal, Optional, Set, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
+
+from src.report import iter_report_rows
+from src.timestamps import decode_timestamp
 
 NOT_SUPPORTED = Literal["not_supported"]
 NO_INFORMTION = Literal["no_information"]
 NOT_APPLICABLE = Literal["N/A"]
 
+# Credential report columns whose name differs from the matching User field
+REPORT_COLUMN_ALIASES = {"user": "username"}
+
 
 class User(BaseModel):
     username: str
@@ -33,5 +41,125 @@ class User(BaseModel):
     cert_2_last_rotated: Union[datetime, NOT_APPLICABLE]
 
 
-class CredentialReport(BaseModel):
-    users: List[User]
+def map_report_header(header: List[str]) -> Dict[int, str]:
+    """Map credential report column positions to User field names.
+
+    Columns that don't correspond to a User field are ignored, so the report
+    can gain columns without breaking the parser.
+    """
+    mapping = {}
+    for index, column in enumerate(header):
+        field = REPORT_COLUMN_ALIASES.get(column, column)
+        if field in User.model_fields:
+            mapping[index] = field
+
+    return mapping
+
+
+def iter_users(content: bytes, indices: Optional[Set[int]] = None) -> Iterator[User]:
+    """Yield a User for every row in a credential report CSV.
+
+    When indices is given only those rows (zero based, excluding the header)
+    are turned into Users.
+    """
+    rows = iter_report_rows(content)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    mapping = map_report_header(header).items()
+    for index, row in enumerate(row for row in rows if row):
+        if indices is None or index in indices:
+            yield User.model_validate({field: row[index] for index, field in mapping})
+
+
+# Fields decoded with decode_timestamp rather than by pydantic
+TIMESTAMP_FIELDS = frozenset(
+    field
+    for field, annotation in User.__annotations__.items()
+    if annotation is datetime or datetime in getattr(annotation, "__args__", ())
+)
+
+
+@cache
+def field_adapter(field: str) -> TypeAdapter:
+    return TypeAdapter(User.__annotations__[field])
+
+
+def decode_password_enabled(value: str) -> Union[bool, str]:
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    return value
+
+
+class UserRecord:
+    """Lightweight alternative to User for a single credential report row.
+
+    Only the columns read when classifying a user are decoded up front. The
+    remaining fields are validated against their User field type on first
+    access.
+    """
+
+    __slots__ = (
+        "username",
+        "arn",
+        "password_enabled",
+        "password_last_used",
+        "password_last_changed",
+        "_row",
+        "_mapping",
+        "_decoded",
+    )
+
+    def __init__(self, row: List[str], mapping: Dict[str, int]):
+        self.username = row[mapping["username"]]
+        self.arn = row[mapping["arn"]]
+        self.password_enabled = decode_password_enabled(
+            row[mapping["password_enabled"]]
+        )
+        self.password_last_used = decode_timestamp(row[mapping["password_last_used"]])
+        self.password_last_changed = decode_timestamp(
+            row[mapping["password_last_changed"]]
+        )
+        self._row = row
+        self._mapping = mapping
+        self._decoded: Optional[Dict[str, Any]] = None
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes that aren't slots, i.e. the lazy fields
+        if name.startswith("_") or name not in self._mapping:
+            raise AttributeError(name)
+
+        if self._decoded is None:
+            self._decoded = {}
+        if name not in self._decoded:
+            raw = self._row[self._mapping[name]]
+            if name in TIMESTAMP_FIELDS:
+                self._decoded[name] = decode_timestamp(raw)
+            else:
+                self._decoded[name] = field_adapter(name).validate_python(raw)
+
+        return self._decoded[name]
+
+    def to_user(self) -> User:
+        return User.model_validate(
+            {field: self._row[index] for field, index in self._mapping.items()}
+        )
+
+
+def iter_records(content: bytes) -> Iterator[UserRecord]:
+    """Yield a UserRecord for every row in a credential report CSV."""
+    rows = iter_report_rows(content)
+    header = next(rows, None)
+    if header is None:
+        return
+
+    mapping = {field: index for index, field in map_report_header(header).items()}
+    for row in rows:
+        if row:
+            yield UserRecord(row, mapping)
+
+
+UserLike = Union[User, UserRecord]
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from src.account import AccountSummary, monitor_account
+from src.checkpoint import Deadline
+from src.clients import create_client, pool_size
+from src.config import get_settings
+from src.instrumentation import get_instrumentation
+from src.logger import logger
+from src.results import ResultSink
+
+if TYPE_CHECKING:
+    import boto3
+
+
+def account_id_from_arn(role_arn: str) -> str:
+    return role_arn.split(":")[4]
+
+
+class SessionCache:
+    """Caches clients for assumed roles, re-assuming a role shortly before
+    its credentials expire."""
+
+    def __init__(self, sts_client, session_name: str = "inactive-account-monitor"):
+        self.sts_client = sts_client
+        self.session_name = session_name
+        settings = get_settings()
+        self.duration = settings.sts_session_duration_seconds
+        self.refresh_margin = datetime.timedelta(
+            seconds=settings.sts_session_refresh_margin_seconds
+        )
+        # Each account's clients are shared by its remediation workers
+        self.max_pool_connections = pool_size(
+            settings.organisation_remediation_max_workers
+        )
+        self._sessions: Dict[str, Tuple[boto3.Session, datetime.datetime]] = {}
+        self._clients: Dict[Tuple[str, str], object] = {}
+        self._lock = threading.Lock()
+
+    def _is_expiring(self, expiration: datetime.datetime) -> bool:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return expiration - now <= self.refresh_margin
+
+    def _assume_role(self, role_arn: str) -> Tuple[boto3.Session, datetime.datetime]:
+        import boto3
+
+        credentials = self.sts_client.assume_role(
+            RoleArn=role_arn,
+            RoleSessionName=self.session_name,
+            DurationSeconds=self.duration,
+        )["Credentials"]
+        session = boto3.Session(
+            aws_access_key_id=credentials["AccessKeyId"],
+            aws_secret_access_key=credentials["SecretAccessKey"],
+            aws_session_token=credentials["SessionToken"],
+        )
+
+        return session, credentials["Expiration"]
+
+    def client(self, role_arn: str, service: str):
+        with self._lock:
+            cached = self._sessions.get(role_arn)
+            if cached is None or self._is_expiring(cached[1]):
+                logger.debug(f"Assuming role {role_arn}")
+                cached = self._assume_role(role_arn)
+                self._sessions[role_arn] = cached
+                self._clients = {
+                    key: client
+                    for key, client in self._clients.items()
+                    if key[0] != role_arn
+                }
+
+            key = (role_arn, service)
+            if key not in self._clients:
+                self._clients[key] = get_instrumentation().instrument_client(
+                    create_client(service, cached[0], self.max_pool_connections)
+                )
+
+            return self._clients[key]
+
+
+def monitor_organisation(
+    session_cache: SessionCache,
+    role_arns: Iterable[str],
+    report_only: bool,
+    deadline: Optional[Deadline] = None,
+    sink: Optional[ResultSink] = None,
+    continuation_tokens: Optional[Dict[str, str]] = None,
+) -> dict:
+    """Monitor every account concurrently and aggregate their summaries,
+    resuming each account given its continuation token."""
+    continuation_tokens = continuation_tokens or {}
+    settings = get_settings()
+    max_accounts = settings.organisation_max_concurrent_accounts
+    max_workers = settings.organisation_remediation_max_workers
+
+    def monitor(role_arn: str) -> AccountSummary:
+        account = account_id_from_arn(role_arn)
+        try:
+            iam_client = session_cache.client(role_arn, "iam")
+            return monitor_account(
+                iam_client,
+                report_only,
+                account,
+                max_workers,
+                deadline,
+                sink,
+                continuation_tokens.get(account),
+            )
+        except Exception as e:
+            logger.exception(f"Failed to monitor account {account}")
+            return AccountSummary(account, error=str(e))
+
+    with ThreadPoolExecutor(max_workers=max_accounts) as executor:
+        summaries = list(executor.map(monitor, role_arns))
+
+    return aggregate_summaries(summaries)
+
+
+def aggregate_summaries(summaries: List[AccountSummary]) -> dict:
+    return {
+        "accounts": [summary.to_dict() for summary in summaries],
+        "users": sum(summary.users for summary in summaries),
+        "inactive": sum(summary.inactive for summary in summaries),
+        "disabled": sum(summary.disabled for summary in summaries),
+        "already_disabled": sum(summary.already_disabled for summary in summaries),
+        "failed": sum(summary.failed for summary in summaries),
+        "exempt": sum(summary.exempt for summary in summaries),
+        "service_active": sum(summary.service_active for summary in summaries),
+        "newly_inactive": sum(
+            len(summary.newly_inactive or []) for summary in summaries
+        ),
+        "failed_accounts": [
+            summary.account for summary in summaries if summary.error is not None
+        ],
+        "sources": {
+            summary.account: summary.source
+            for summary in summaries
+            if summary.source is not None
+        },
+        "continuation_tokens": {
+            summary.account: summary.continuation_token
+            for summary in summaries
+            if summary.continuation_token is not None
+        },
+    }
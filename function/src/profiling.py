@@ -0,0 +1,255 @@
+"""Opt-in profiling of a run with cProfile and tracemalloc.
+
+A Profiler attached to the instrumentation records the allocations made,
+and the peak traced memory, in each phase (download, parse, classify,
+remediate and so on), while cProfile profiles the whole run. The artefacts
+are a pstats file, readable with pstats or snakeviz, and a JSON summary of
+memory by phase, written to a local directory or S3.
+
+cProfile only profiles the thread it was enabled on, which parses and
+classifies the report, so time spent on the remediation threads shows as
+waiting for them. The peak of a phase nested in, or running alongside,
+another is the peak since the outermost phase started.
+
+Profiling is enabled for every run by profiling_enabled, or for one
+invocation by "profile": true in its event. Otherwise the only cost is
+checking whether a profiler is attached at the start of each phase.
+"""
+
+from __future__ import annotations
+
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol
+
+from src.clients import S3_SCHEME, get_client, parse_s3_uri
+from src.config import get_settings
+from src.instrumentation import Instrumentation, get_instrumentation
+from src.logger import logger
+
+DEFAULT_PROFILING_DIR = "/tmp/profiles"
+PROFILE_NAME = "profile.pstats"
+MEMORY_NAME = "memory.json"
+
+
+class ArtefactSink(Protocol):
+    """Somewhere to write profiling artefacts to."""
+
+    def write(self, name: str, data: bytes) -> str:
+        """Write the artefact, returning where it was written."""
+        ...
+
+
+class LocalDirectorySink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(data)
+
+        return path
+
+
+class S3ArtefactSink:
+    def __init__(self, s3_client, bucket: str, prefix: str = ""):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def write(self, name: str, data: bytes) -> str:
+        key = self.prefix + name
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+        return f"s3://{self.bucket}/{key}"
+
+
+def open_artefact_sink(uri: Optional[str] = None) -> ArtefactSink:
+    """A sink writing to a local directory, or to an s3://bucket/prefix/."""
+    uri = uri or get_settings().profiling_uri or DEFAULT_PROFILING_DIR
+    if uri.startswith(S3_SCHEME):
+        bucket, prefix = parse_s3_uri(uri)
+        return S3ArtefactSink(get_client("s3"), bucket, prefix)
+
+    return LocalDirectorySink(uri)
+
+
+def profile_name(now: Optional[datetime.datetime] = None) -> str:
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return f"{now:%Y-%m-%dT%H-%M-%S-%fZ}"
+
+
+class Profiler:
+    """Profiles a run, and records the memory allocated in each phase."""
+
+    def __init__(self, top_allocations: Optional[int] = None):
+        self.top_allocations = (
+            top_allocations or get_settings().profiling_top_allocations
+        )
+        self.phases: List[Dict[str, Any]] = []
+        # Where the artefacts were written, once profiling is over
+        self.locations: List[str] = []
+        self._depth = 0
+        self._lock = threading.Lock()
+        self._profile: Any = None
+        self._thread: Optional[int] = None
+        self._started_tracing = False
+
+    def start(self):
+        import cProfile
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._thread = threading.get_ident()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self) -> Dict[str, bytes]:
+        """Stop profiling, and return the artefacts by name."""
+        import marshal
+        import tracemalloc
+
+        self._profile.disable()
+        self._profile.create_stats()
+        peak = tracemalloc.get_traced_memory()[1]
+        if self._started_tracing:
+            tracemalloc.stop()
+
+        memory = {"peak_bytes": peak, "phases": self.phases}
+        return {
+            PROFILE_NAME: marshal.dumps(self._profile.stats),
+            MEMORY_NAME: json.dumps(memory, indent=2).encode("utf8"),
+        }
+
+    @contextmanager
+    def _paused(self) -> Iterator[None]:
+        """Leave the snapshots out of the profile. cProfile is per thread, so
+        it can only be paused on the thread it was started on."""
+        pause = self._profile is not None and threading.get_ident() == self._thread
+        if pause:
+            self._profile.disable()
+        try:
+            yield
+        finally:
+            if pause:
+                self._profile.enable()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        import tracemalloc
+
+        with self._paused():
+            with self._lock:
+                if self._depth == 0:
+                    tracemalloc.reset_peak()
+                self._depth += 1
+            before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._paused():
+                peak = tracemalloc.get_traced_memory()[1]
+                after = tracemalloc.take_snapshot()
+                with self._lock:
+                    self._depth -= 1
+                self.record_phase(name, seconds, before, after, peak)
+
+    def record_phase(self, name: str, seconds: float, before, after, peak: int):
+        import tracemalloc
+
+        differences = [
+            diff
+            for diff in after.compare_to(before, "lineno")
+            # Allocated taking the snapshots
+            if diff.traceback[0].filename != tracemalloc.__file__
+        ]
+        top = sorted(differences, key=lambda diff: diff.size_diff, reverse=True)
+        phase = {
+            "phase": name,
+            "seconds": seconds,
+            "allocated_bytes": sum(diff.size_diff for diff in differences),
+            "peak_bytes": peak,
+            "top_allocations": [
+                {
+                    "location": f"{diff.traceback[0].filename}:{diff.traceback[0].lineno}",
+                    "size_bytes": diff.size_diff,
+                    "count": diff.count_diff,
+                }
+                for diff in top[: self.top_allocations]
+                if diff.size_diff > 0
+            ],
+        }
+        with self._lock:
+            self.phases.append(phase)
+
+
+@contextmanager
+def profile(
+    sink: Optional[ArtefactSink] = None,
+    name: Optional[str] = None,
+    instrumentation: Optional[Instrumentation] = None,
+) -> Iterator[Profiler]:
+    """Profile the code run in the block, e.g. from a test or benchmark, and
+    write the artefacts to the sink under name/."""
+    sink = sink or open_artefact_sink()
+    name = name or profile_name()
+    instrumentation = instrumentation or get_instrumentation()
+    profiler = Profiler()
+
+    instrumentation.profiler = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        artefacts = profiler.stop()
+        instrumentation.profiler = None
+        profiler.locations = write_artefacts(sink, name, artefacts)
+
+
+def write_artefacts(sink: ArtefactSink, name: str, artefacts: Dict[str, bytes]):
+    """Write the artefacts under name/, returning where. Profiling is only a
+    diagnostic, so failing to write is logged instead of replacing the run's
+    outcome, whether it succeeded or not."""
+    locations = []
+    for artefact, data in artefacts.items():
+        try:
+            locations.append(sink.write(f"{name}/{artefact}", data))
+        except Exception:
+            logger.exception(f"Failed to write the profiling artefact {artefact}")
+    logger.info("Wrote profiling artefacts", locations=locations)
+
+    return locations
+
+
+def profiling_requested(event: Any) -> bool:
+    return get_settings().profiling_enabled or (
+        isinstance(event, dict) and event.get("profile") is True
+    )
+
+
+def profiled(handler: Callable) -> Callable:
+    """Profile invocations of the handler when profiling is requested, and
+    add where the artefacts were written to its response."""
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if not profiling_requested(event):
+            return handler(event, context)
+
+        with profile() as profiler:
+            response = handler(event, context)
+
+        return {**response, "profile": profiler.locations}
+
+    return wrapper
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from botocore.exceptions import ClientError
+
+from src.config import get_settings
+from src.logger import logger
+from src.retry import call_with_retry
+
+if TYPE_CHECKING:
+    from src.models import UserLike
+
+
+class Outcome(str, Enum):
+    SUCCESS = "success"
+    ALREADY_DISABLED = "already_disabled"
+    FAILED = "failed"
+
+
+@dataclass
+class CallTiming:
+    operation: str
+    seconds: float
+
+
+@dataclass
+class UserRemediation:
+    username: str
+    outcome: Outcome
+    calls: List[CallTiming] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+@dataclass
+class RemediationResult:
+    users: List[UserRemediation] = field(default_factory=list)
+
+    def count(self, outcome: Outcome) -> int:
+        return sum(1 for user in self.users if user.outcome == outcome)
+
+    def latencies(self) -> Dict[str, List[float]]:
+        """Return the latency of every IAM call made, grouped by operation."""
+        latencies: Dict[str, List[float]] = {}
+        for user in self.users:
+            for call in user.calls:
+                latencies.setdefault(call.operation, []).append(call.seconds)
+
+        return latencies
+
+    def latency_summary(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for operation, seconds in self.latencies().items():
+            seconds = sorted(seconds)
+            summary[operation] = {
+                "count": len(seconds),
+                "mean": sum(seconds) / len(seconds),
+                "p50": seconds[len(seconds) // 2],
+                "max": seconds[-1],
+            }
+
+        return summary
+
+
+@dataclass(frozen=True)
+class RemediationPlan:
+    """The IAM changes needed to disable a user."""
+
+    delete_login_profile: bool
+    deactivate_access_keys: bool
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.delete_login_profile or self.deactivate_access_keys)
+
+
+def plan_remediation(
+    user: UserLike, console: bool = True, access_keys: bool = True
+) -> RemediationPlan:
+    """Work out from the user's credential report row which IAM calls are needed
+    to disable their console and/or programmatic access.
+
+    A report can be up to credential_report_max_age_seconds old, so anything
+    created since is left for the next run to pick up.
+    """
+    return RemediationPlan(
+        # not_supported is only reported for the root user, which is never disabled
+        delete_login_profile=console and user.password_enabled is not False,
+        deactivate_access_keys=access_keys
+        and bool(user.access_key_1_active or user.access_key_2_active),
+    )
+
+
+def is_no_such_entity(error: ClientError) -> bool:
+    return error.response["Error"]["Code"] == "NoSuchEntity"
+
+
+class Remediator:
+    """Disables users on a bounded thread pool.
+
+    boto3 clients are thread safe, so a single client is shared by the
+    workers. Throttled calls are retried with exponential backoff.
+    """
+
+    def __init__(self, iam_client, max_workers: Optional[int] = None):
+        self.iam_client = iam_client
+        settings = get_settings()
+        self.max_workers = max_workers or settings.remediation_max_workers
+        self.retry_limit = settings.remediation_retry_limit
+        self.backoff_base = settings.remediation_backoff_base_seconds
+        self.backoff_max = settings.remediation_backoff_max_seconds
+
+    def _call(self, remediation: UserRemediation, operation: str, **kwargs) -> dict:
+        start = time.perf_counter()
+        try:
+            return call_with_retry(
+                getattr(self.iam_client, operation),
+                self.retry_limit,
+                self.backoff_base,
+                self.backoff_max,
+                **kwargs,
+            )
+        finally:
+            remediation.calls.append(CallTiming(operation, time.perf_counter() - start))
+
+    def _delete_login_profile(self, remediation: UserRemediation) -> bool:
+        try:
+            self._call(
+                remediation, "delete_login_profile", UserName=remediation.username
+            )
+        except ClientError as e:
+            if is_no_such_entity(e):
+                return False
+            raise
+
+        return True
+
+    def _deactivate_access_keys(self, remediation: UserRemediation) -> bool:
+        try:
+            response = self._call(
+                remediation, "list_access_keys", UserName=remediation.username
+            )
+        except ClientError as e:
+            if is_no_such_entity(e):
+                return False
+            raise
+
+        changed = False
+        for access_key in response["AccessKeyMetadata"]:
+            if access_key["Status"] == "Inactive":
+                continue
+            try:
+                self._call(
+                    remediation,
+                    "update_access_key",
+                    UserName=remediation.username,
+                    AccessKeyId=access_key["AccessKeyId"],
+                    Status="Inactive",
+                )
+                changed = True
+            except ClientError as e:
+                if not is_no_such_entity(e):
+                    raise
+
+        return changed
+
+    def disable_user(
+        self, user: UserLike, plan: Optional[RemediationPlan] = None
+    ) -> UserRemediation:
+        """Disable the user, making only the IAM calls their report row needs."""
+        return self.remediate(user.username, plan or plan_remediation(user))
+
+    def remediate(self, username: str, plan: RemediationPlan) -> UserRemediation:
+        """Make the IAM calls in the plan for the user.
+
+        Anything that turns out to be gone already (NoSuchEntity) counts as
+        done.
+        """
+        remediation = UserRemediation(username, Outcome.ALREADY_DISABLED)
+
+        try:
+            changed = False
+            if plan.delete_login_profile:
+                changed |= self._delete_login_profile(remediation)
+            if plan.deactivate_access_keys:
+                changed |= self._deactivate_access_keys(remediation)
+            if changed:
+                remediation.outcome = Outcome.SUCCESS
+        except Exception as e:
+            logger.exception(f"Failed to disable {username}")
+            remediation.outcome = Outcome.FAILED
+            remediation.error = str(e)
+
+        return remediation
+
+    def disable_users(
+        self,
+        users: Iterable[UserLike],
+        plans: Optional[Iterable[RemediationPlan]] = None,
+    ) -> RemediationResult:
+        users = list(users)
+        if plans is None:
+            plans = [plan_remediation(user) for user in users]
+
+        return self.remediate_all([user.username for user in users], plans)
+
+    def remediate_all(
+        self, usernames: Iterable[str], plans: Iterable[RemediationPlan]
+    ) -> RemediationResult:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            remediations = executor.map(self.remediate, usernames, plans)
+
+            return RemediationResult(list(remediations))
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import csv
+import io
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional
+
+# The pydantic models are only imported once users are actually built, so a
+# run that only needs the report columns never pays for them
+if TYPE_CHECKING:
+    from src.models import User, UserRecord
+
+# Where a report's rows came from
+CREDENTIAL_REPORT = "credential-report"
+LISTED_USERS = "listed-users"
+
+
+def iter_report_rows(content: bytes) -> Iterator[List[str]]:
+    """Yield the rows of a credential report CSV, header first.
+
+    The bytes are decoded incrementally as the csv reader consumes them, so
+    the whole report is never held as a str.
+    """
+    stream = io.TextIOWrapper(io.BytesIO(content), encoding="utf8", newline="")
+    yield from csv.reader(stream)
+
+
+class CredentialReport:
+    """Lazily parsed credential report.
+
+    Iterating over the report parses one user at a time from the raw CSV, so
+    callers can process large reports without materialising every User.
+    """
+
+    def __init__(
+        self,
+        content: bytes,
+        generated_time: Optional[datetime] = None,
+        source: str = CREDENTIAL_REPORT,
+    ):
+        self.content = content
+        self.generated_time = generated_time
+        self.source = source
+
+    def __iter__(self) -> Iterator[User]:
+        from src.models import iter_users
+
+        return iter_users(self.content)
+
+    @property
+    def users(self) -> List[User]:
+        return list(self)
+
+    def records(self) -> Iterator[UserRecord]:
+        """Iterate over the report as lightweight UserRecords instead of Users."""
+        from src.models import iter_records
+
+        return iter_records(self.content)
+
+    def users_at(self, indices: Iterable[int]) -> List[User]:
+        from src.models import iter_users
+
+        return list(iter_users(self.content, set(indices)))
@@ -0,0 +1,200 @@
+"""Per-user results of a run, streamed as JSON Lines to a file or S3.
+
+One flat record is written for every user matching a rule, as soon as
+what is done about them is known, so nothing is held in memory and the
+output loads directly into tools reading JSON Lines or Parquet. Users
+matching no rule are only counted in the summary, which keeps the output
+to the users something is, or would be, done about.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import IO, TYPE_CHECKING, Dict, Optional, Protocol, Tuple
+
+from src.clients import S3_SCHEME, get_client, parse_s3_uri
+from src.logger import logger
+
+if TYPE_CHECKING:
+    from src.models import UserLike
+    from src.remediation import UserRemediation
+
+# Results for S3 are spooled in memory up to this size, then on disk
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+REPORTED = "reported"
+EXEMPT = "exempt"
+SERVICE_ACTIVE = "service-active"
+
+
+@dataclass
+class UserResult:
+    account: str
+    username: str
+    rules: Tuple[str, ...]
+    last_console_login: Optional[str]
+    # reported, exempt, service-active, or the outcome of the remediation
+    action: str
+    error: Optional[str] = None
+    # Seconds spent in each IAM operation made to remediate the user
+    call_seconds: Dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_user(
+        cls,
+        account: str,
+        user: UserLike,
+        rules: Tuple[str, ...],
+        remediation: Optional[UserRemediation] = None,
+    ) -> "UserResult":
+        return cls.from_remediation(
+            account, user.username, rules, format_login(user), remediation
+        )
+
+    @classmethod
+    def from_remediation(
+        cls,
+        account: str,
+        username: str,
+        rules: Tuple[str, ...],
+        last_console_login: Optional[str],
+        remediation: Optional[UserRemediation] = None,
+    ) -> "UserResult":
+        if remediation is None:
+            return cls(account, username, rules, last_console_login, REPORTED)
+
+        call_seconds: Dict[str, float] = {}
+        for call in remediation.calls:
+            call_seconds[call.operation] = (
+                call_seconds.get(call.operation, 0.0) + call.seconds
+            )
+
+        return cls(
+            account,
+            username,
+            rules,
+            last_console_login,
+            remediation.outcome.value,
+            remediation.error,
+            call_seconds,
+        )
+
+
+def exempt_result(
+    account: str,
+    username: str,
+    rules: Tuple[str, ...],
+    last_console_login: Optional[str],
+) -> UserResult:
+    return UserResult(account, username, rules, last_console_login, EXEMPT)
+
+
+def service_active_result(
+    account: str,
+    username: str,
+    rules: Tuple[str, ...],
+    last_console_login: Optional[str],
+) -> UserResult:
+    return UserResult(account, username, rules, last_console_login, SERVICE_ACTIVE)
+
+
+def format_login(user: UserLike) -> Optional[str]:
+    last_used = user.password_last_used
+    if isinstance(last_used, datetime.date):
+        return last_used.isoformat()
+
+    return None if last_used is None else str(last_used)
+
+
+class ResultSink(Protocol):
+    """Somewhere to stream a run's results to."""
+
+    location: str
+
+    def write(self, result: UserResult) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class JsonLinesSink:
+    """Writes each result to a binary file as a line of JSON.
+
+    Accounts are monitored concurrently, so writes are serialised.
+    """
+
+    def __init__(self, file: IO[bytes], location: str):
+        self.file = file
+        self.location = location
+        self._lock = threading.Lock()
+
+    def write(self, result: UserResult) -> None:
+        line = json.dumps(asdict(result), separators=(",", ":")) + "\n"
+        with self._lock:
+            self.file.write(line.encode("utf8"))
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class LocalFileSink(JsonLinesSink):
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        super().__init__(open(path, "ab"), path)
+
+
+class S3Sink(JsonLinesSink):
+    """Uploads the results to S3 once the run is over."""
+
+    def __init__(self, s3_client, bucket: str, key: str):
+        super().__init__(
+            tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES),
+            f"s3://{bucket}/{key}",
+        )
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+
+    def close(self) -> None:
+        try:
+            self.file.seek(0)
+            self.s3_client.upload_fileobj(self.file, self.bucket, self.key)
+        finally:
+            # Spooled to disk beyond SPOOL_MAX_BYTES
+            super().close()
+
+
+def close_sink(sink: Optional[ResultSink]):
+    """Close the sink once the run is over. Called while the run's own
+    exception is propagating, failing to close is logged instead, so it
+    doesn't mask the run's error."""
+    if sink is None:
+        return
+    if sys.exc_info()[1] is None:
+        sink.close()
+        return
+
+    try:
+        sink.close()
+    except Exception:
+        logger.exception(f"Failed to write the results to {sink.location}")
+
+
+def results_name(now: Optional[datetime.datetime] = None) -> str:
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return f"{now:%Y-%m-%dT%H-%M-%SZ}.jsonl"
+
+
+def open_sink(uri: str, name: Optional[str] = None) -> ResultSink:
+    """Open a sink writing to a local directory, or to an s3://bucket/prefix/."""
+    name = name or results_name()
+    if uri.startswith(S3_SCHEME):
+        bucket, prefix = parse_s3_uri(uri)
+        return S3Sink(get_client("s3"), bucket, prefix + name)
+
+    return LocalFileSink(os.path.join(uri, name))
@@ -0,0 +1,41 @@
+import random
+from time import sleep
+from typing import Callable, TypeVar
+
+from botocore.exceptions import ClientError
+
+T = TypeVar("T")
+
+THROTTLING_ERRORS = (
+    "Throttling",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter for the given (zero based) attempt."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def is_throttling_error(error: Exception) -> bool:
+    return (
+        isinstance(error, ClientError)
+        and error.response.get("Error", {}).get("Code") in THROTTLING_ERRORS
+    )
+
+
+def call_with_retry(
+    func: Callable[..., T], retry_limit: int, base: float, cap: float, **kwargs
+) -> T:
+    """Call func, retrying throttling errors with exponential backoff."""
+    attempt = 0
+    while True:
+        try:
+            return func(**kwargs)
+        except ClientError as e:
+            if not is_throttling_error(e) or attempt + 1 >= retry_limit:
+                raise
+            sleep(backoff_delay(attempt, base, cap))
+            attempt += 1
@@ -0,0 +1,148 @@
+"""Declarative rules evaluated against every user in a single pass.
+
+Each rule is compiled once per run into a predicate over a credential report
+row, with its thresholds and the reference time bound in, so evaluating a
+rule is only a few attribute reads and comparisons per user.
+"""
+
+from __future__ import annotations
+
+import datetime
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from src.helpers import is_inactive, is_root_user
+
+if TYPE_CHECKING:
+    from src.config import Settings
+    from src.models import UserLike
+
+Predicate = Callable[["UserLike"], bool]
+
+CONSOLE_INACTIVE = "console-inactive"
+KEY_UNUSED = "key-unused"
+KEY_UNROTATED = "key-unrotated"
+MFA_MISSING = "mfa-missing"
+
+ACCESS_KEYS = (1, 2)
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    predicate: Predicate
+    # Whether users matching the rule are disabled, or only reported
+    remediate: bool
+
+
+@dataclass(frozen=True)
+class Verdict:
+    user: UserLike
+    matched: Tuple[str, ...]
+
+    @property
+    def console_inactive(self) -> bool:
+        return CONSOLE_INACTIVE in self.matched
+
+    @property
+    def keys_unused(self) -> bool:
+        return KEY_UNUSED in self.matched
+
+
+def days_since(now: datetime.datetime, value) -> int:
+    return (now - value.replace(tzinfo=None)).days
+
+
+def active_keys(user: UserLike) -> List[int]:
+    return [key for key in ACCESS_KEYS if getattr(user, f"access_key_{key}_active")]
+
+
+def compile_console_inactive(settings: Settings, now: datetime.datetime) -> Predicate:
+    inactivity_threshold = settings.inactivity_threshold_days
+    grace_period_threshold = settings.grace_period_threshold_days
+
+    return lambda user: is_inactive(
+        user, inactivity_threshold, grace_period_threshold, now
+    )
+
+
+def compile_key_unused(settings: Settings, now: datetime.datetime) -> Predicate:
+    threshold = settings.access_key_unused_threshold_days
+
+    def key_unused(user: UserLike, key: int) -> bool:
+        last_used = getattr(user, f"access_key_{key}_last_used_date")
+        if isinstance(last_used, datetime.date):
+            return days_since(now, last_used) > threshold
+
+        # Never used, allow the same time from when it was created or rotated
+        last_rotated = getattr(user, f"access_key_{key}_last_rotated")
+        return (
+            isinstance(last_rotated, datetime.date)
+            and days_since(now, last_rotated) > threshold
+        )
+
+    def predicate(user: UserLike) -> bool:
+        # Only when every active key is unused, so no key in use is disabled
+        keys = active_keys(user)
+        return bool(keys) and all(key_unused(user, key) for key in keys)
+
+    return predicate
+
+
+def compile_key_unrotated(settings: Settings, now: datetime.datetime) -> Predicate:
+    threshold = settings.access_key_rotation_threshold_days
+
+    def predicate(user: UserLike) -> bool:
+        for key in active_keys(user):
+            last_rotated = getattr(user, f"access_key_{key}_last_rotated")
+            if (
+                isinstance(last_rotated, datetime.date)
+                and days_since(now, last_rotated) > threshold
+            ):
+                return True
+
+        return False
+
+    return predicate
+
+
+def compile_mfa_missing(settings: Settings, now: datetime.datetime) -> Predicate:
+    return lambda user: (
+        user.password_enabled is True and not is_root_user(user) and not user.mfa_active
+    )
+
+
+RULES: Dict[str, Tuple[Callable[[Settings, datetime.datetime], Predicate], bool]] = {
+    CONSOLE_INACTIVE: (compile_console_inactive, True),
+    KEY_UNUSED: (compile_key_unused, True),
+    KEY_UNROTATED: (compile_key_unrotated, False),
+    MFA_MISSING: (compile_mfa_missing, False),
+}
+
+
+def compile_rules(
+    settings: Settings, now: Optional[datetime.datetime] = None
+) -> List[Rule]:
+    """Compile the enabled rules, with one reference time for all of them."""
+    now = now or datetime.datetime.now()
+    rules = []
+    for name in settings.enabled_rules:
+        compile_rule, remediate = RULES[name]
+        rules.append(Rule(name, compile_rule(settings, now), remediate))
+
+    return rules
+
+
+def evaluate(users: Iterable[UserLike], rules: List[Rule]) -> Iterator[Verdict]:
+    """Yield a verdict, with the rules that matched, for every user."""
+    for user in users:
+        yield Verdict(user, tuple(rule.name for rule in rules if rule.predicate(user)))
@@ -0,0 +1,179 @@
+"""When users last accessed any AWS service, from IAM's service last accessed data.
+
+The credential report only has when a password or access key was last used,
+not whether a key is still used for anything. Before a user's access keys
+are deactivated, a generate_service_last_accessed_details job is started for
+them, and users who accessed a service within inactivity_threshold_days keep
+their keys. Jobs take seconds to finish, so they are started for every user
+up front and polled concurrently with backoff. At most
+service_access_max_jobs are in flight at once, across every account
+monitored concurrently, and the next job starts as soon as another's
+results are collected.
+"""
+
+from __future__ import annotations
+
+import calendar
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from time import sleep
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.classifier import SECONDS_PER_DAY, reference_now
+from src.config import get_settings
+from src.logger import logger
+from src.retry import backoff_delay, call_with_retry
+
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+
+
+@dataclass(frozen=True)
+class ServiceAccess:
+    username: str
+    # The user's most recent access to any service, None if never
+    last_authenticated: Optional[datetime.datetime] = None
+    service: Optional[str] = None
+
+    def accessed_since(self, since: int) -> bool:
+        """Whether the user accessed a service since the wall clock epoch
+        seconds, as the classifier compares times."""
+        if self.last_authenticated is None:
+            return False
+
+        wall_clock = self.last_authenticated.replace(tzinfo=None)
+        return calendar.timegm(wall_clock.timetuple()) >= since
+
+
+def latest_access(username: str, services: Iterable[dict]) -> ServiceAccess:
+    latest = None
+    for service in services:
+        last_authenticated = service.get("LastAuthenticated")
+        if last_authenticated is not None and (
+            latest is None or last_authenticated > latest["LastAuthenticated"]
+        ):
+            latest = service
+
+    if latest is None:
+        return ServiceAccess(username)
+
+    return ServiceAccess(
+        username, latest["LastAuthenticated"], latest.get("ServiceNamespace")
+    )
+
+
+_budget_lock = threading.Lock()
+_budget: Optional[Tuple[int, threading.BoundedSemaphore]] = None
+
+
+def get_job_budget(size: int) -> threading.BoundedSemaphore:
+    """The jobs in flight, shared by every account in the process."""
+    global _budget
+    with _budget_lock:
+        if _budget is None or _budget[0] != size:
+            _budget = (size, threading.BoundedSemaphore(size))
+
+        return _budget[1]
+
+
+class ServiceAccessJobs:
+    """Runs service last accessed jobs for an account's users."""
+
+    def __init__(self, iam_client, account: str = "self"):
+        settings = get_settings()
+        self.iam_client = iam_client
+        self.account = account
+        self.enabled = settings.service_access_enabled
+        self.max_jobs = settings.service_access_max_jobs
+        self.poll_limit = settings.service_access_poll_limit
+        self.backoff_base = settings.service_access_backoff_base_seconds
+        self.backoff_max = settings.service_access_backoff_max_seconds
+        self.retry_limit = settings.remediation_retry_limit
+        self.retry_backoff_base = settings.remediation_backoff_base_seconds
+        self.retry_backoff_max = settings.remediation_backoff_max_seconds
+        # Users who accessed a service since then keep their access keys
+        self.active_since = (
+            reference_now() - settings.inactivity_threshold_days * SECONDS_PER_DAY
+        )
+
+    def _call(self, operation: str, **kwargs) -> dict:
+        return call_with_retry(
+            getattr(self.iam_client, operation),
+            self.retry_limit,
+            self.retry_backoff_base,
+            self.retry_backoff_max,
+            **kwargs,
+        )
+
+    def start(self, username: str, arn: Optional[str] = None) -> str:
+        if arn is None:
+            # Not known for users read from the activity index
+            arn = self._call("get_user", UserName=username)["User"]["Arn"]
+
+        return self._call(
+            "generate_service_last_accessed_details",
+            Arn=arn,
+            Granularity="SERVICE_LEVEL",
+        )["JobId"]
+
+    def collect(self, job_id: str) -> List[dict]:
+        """Poll the job with exponential backoff until it finishes, and return
+        every service's last access."""
+        for attempt in range(self.poll_limit):
+            sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+            response = self._call("get_service_last_accessed_details", JobId=job_id)
+            status = response["JobStatus"]
+            if status == FAILED:
+                raise Exception(
+                    f"Job {job_id} failed: {response.get('Error', {}).get('Message')}"
+                )
+            if status != COMPLETED:
+                continue
+
+            services = list(response["ServicesLastAccessed"])
+            while response.get("IsTruncated"):
+                response = self._call(
+                    "get_service_last_accessed_details",
+                    JobId=job_id,
+                    Marker=response["Marker"],
+                )
+                services.extend(response["ServicesLastAccessed"])
+
+            return services
+
+        raise Exception(f"Job {job_id} still in progress after {self.poll_limit} polls")
+
+    def last_accessed(
+        self, username: str, arn: Optional[str] = None
+    ) -> Optional[ServiceAccess]:
+        """When the user last accessed a service, or None if it couldn't be
+        found out, in which case the credential report's verdict stands."""
+        with get_job_budget(self.max_jobs):
+            try:
+                services = self.collect(self.start(username, arn))
+            except Exception as e:
+                logger.warning(
+                    f"Unable to get the services {username} last accessed: {e}",
+                    account=self.account,
+                )
+                return None
+
+        return latest_access(username, services)
+
+    def last_accessed_all(
+        self, users: Iterable[Tuple[str, Optional[str]]]
+    ) -> Dict[str, ServiceAccess]:
+        """Run a job for each (username, arn), pipelined within the budget."""
+        users = list(users)
+        if not users:
+            return {}
+
+        accesses = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_jobs, len(users))) as executor:
+            for access in executor.map(lambda user: self.last_accessed(*user), users):
+                if access is not None:
+                    accesses[access.username] = access
+
+        return accesses
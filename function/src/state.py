@@ -0,0 +1,111 @@
+"""Each user's classification, kept between runs to report what changed.
+
+Every run still classifies the whole report with the columnar classify(),
+which is cheaper than deciding which rows could be skipped. The store keeps
+each user's verdict and the time they become inactive, inactive_at, so a
+run can report the users who became inactive since the last one, and only
+writes the users whose verdict or inactive_at changed.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Dict, List, Protocol, Tuple
+
+from src.classifier import (
+    INACTIVE_REASONS,
+    Classification,
+    ReportColumns,
+    inactive_times,
+)
+
+# A user's verdict, as a classifier Reason, and when they become inactive
+UserState = Tuple[int, int]
+
+
+@dataclass
+class StateDiff:
+    newly_inactive: List[str] = field(default_factory=list)
+    # Users whose state changed, or who are new, with their current state
+    changed: List[Tuple[str, int, int]] = field(default_factory=list)
+    # Users no longer in the report
+    removed: List[str] = field(default_factory=list)
+
+
+class StateStore(Protocol):
+    """Persists each user's last known state between runs."""
+
+    def load(self) -> Dict[str, UserState]: ...
+
+    def apply(self, diff: StateDiff) -> None: ...
+
+
+class SqliteStateStore:
+    """StateStore backed by a local SQLite database.
+
+    Several accounts can share a database, each one's users are kept
+    separately.
+    """
+
+    def __init__(self, path: str, account: str = "self"):
+        self.path = path
+        self.account = account
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS user_state ("
+                "account TEXT, username TEXT, reason INTEGER, "
+                "inactive_at INTEGER, PRIMARY KEY (account, username))"
+            )
+
+    def load(self) -> Dict[str, UserState]:
+        with sqlite3.connect(self.path) as connection:
+            rows = connection.execute(
+                "SELECT username, reason, inactive_at FROM user_state "
+                "WHERE account = ?",
+                (self.account,),
+            )
+            return {username: (reason, moment) for username, reason, moment in rows}
+
+    def apply(self, diff: StateDiff) -> None:
+        with sqlite3.connect(self.path) as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO user_state VALUES (?, ?, ?, ?)",
+                ((self.account, *change) for change in diff.changed),
+            )
+            connection.executemany(
+                "DELETE FROM user_state WHERE account = ? AND username = ?",
+                ((self.account, username) for username in diff.removed),
+            )
+
+
+def diff_states(
+    columns: ReportColumns,
+    classification: Classification,
+    previous: Dict[str, UserState],
+    inactivity_threshold: int,
+    reset_grace_period_threshold: int,
+) -> StateDiff:
+    """Compare the classified report with the users' previous states, which
+    are consumed doing so."""
+    diff = StateDiff()
+    for username, reason, moment in zip(
+        columns.usernames,
+        classification.reasons,
+        inactive_times(columns, inactivity_threshold, reset_grace_period_threshold),
+    ):
+        state = (reason, moment)
+        before = previous.pop(username, None)
+        if before == state:
+            continue
+
+        diff.changed.append((username, *state))
+        if reason in INACTIVE_REASONS and (
+            before is None or before[0] not in INACTIVE_REASONS
+        ):
+            diff.newly_inactive.append(username)
+
+    # Whoever is left wasn't in the report
+    diff.removed = list(previous)
+
+    return diff
@@ -0,0 +1,61 @@
+"""Decoding of the credential report's timestamp columns.
+
+A report row has up to eight timestamp columns, many of them holding one of
+a few sentinel strings. Sentinels are returned as a single interned string
+each, rather than a new string per cell, and the thresholds only need
+timestamps as epoch seconds, which are computed from the report's fixed
+format with the date part cached, as it repeats across rows.
+"""
+
+import calendar
+import datetime
+import sys
+from functools import lru_cache
+from typing import Dict, Union
+
+# Values in report timestamp columns that aren't timestamps
+TIMESTAMP_SENTINELS: Dict[str, str] = {
+    sentinel: sys.intern(sentinel)
+    for sentinel in ("not_supported", "no_information", "N/A")
+}
+
+# Timestamps in the report look like 2023-06-02T13:45:12+00:00
+TIMESTAMP_LENGTH = len("2023-06-02T13:45:12+00:00")
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+SECONDS_PER_DAY = 86400
+
+
+def decode_timestamp(value: str) -> Union[datetime.datetime, str]:
+    """Decode a timestamp column to a datetime, or the interned sentinel."""
+    sentinel = TIMESTAMP_SENTINELS.get(value)
+    if sentinel is not None:
+        return sentinel
+
+    # Implemented in C, faster than building the datetime from slices
+    return datetime.datetime.fromisoformat(value)
+
+
+@lru_cache(maxsize=4096)
+def day_epoch_seconds(date: str) -> int:
+    return (datetime.date.fromisoformat(date).toordinal() - EPOCH_ORDINAL) * (
+        SECONDS_PER_DAY
+    )
+
+
+def epoch_seconds(value: str) -> int:
+    """Return the wall clock epoch seconds of a timestamp, ignoring its offset
+    like the tz-naive comparisons in helpers.py."""
+    if len(value) == TIMESTAMP_LENGTH and value[10] == "T":
+        try:
+            return (
+                day_epoch_seconds(value[:10])
+                + int(value[11:13]) * 3600
+                + int(value[14:16]) * 60
+                + int(value[17:19])
+            )
+        except ValueError:
+            pass
+
+    moment = datetime.datetime.fromisoformat(value)
+    return calendar.timegm(moment.replace(tzinfo=None).timetuple())
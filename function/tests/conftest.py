@@ -1,13 +1,59 @@
 import datetime
 import os
+import re
+import types
 from dataclasses import dataclass
+from typing import List
 from unittest.mock import MagicMock
 
-import boto3
 import pytest
+from faults import FaultInjector
 from moto import mock_aws
 
+from src.classifier import SECONDS_PER_DAY, reference_now
+from src.clients import create_client
+from src.config import get_settings
+from src.instrumentation import Instrumentation
 from src.models import User
+from src.profiling import LocalDirectorySink, profile
+
+MOCK_PASSWORD = "test_password"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--profile-dir",
+        help="Profile each test with cProfile and tracemalloc, see src/profiling.py, "
+        "writing the artefacts to a directory per test under this one.",
+    )
+
+
+@pytest.fixture(autouse=True)
+def reload_settings():
+    """Re-read the settings for every test, so tests can change the environment."""
+    get_settings.cache_clear()
+    yield
+    get_settings.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def instrumentation(monkeypatch):
+    """Collect each test's instrumentation in memory, without emitting metrics."""
+    instrumentation = Instrumentation()
+    monkeypatch.setattr("src.instrumentation._instrumentation", instrumentation)
+    return instrumentation
+
+
+@pytest.fixture(autouse=True)
+def profiling(request, instrumentation):
+    directory = request.config.getoption("--profile-dir")
+    if directory is None:
+        yield None
+        return
+
+    name = re.sub(r"[^\w.-]+", "_", request.node.nodeid)
+    with profile(LocalDirectorySink(directory), name, instrumentation) as profiler:
+        yield profiler
 
 
 @pytest.fixture
@@ -19,6 +65,9 @@ def lambda_context():
         invoked_function_arn: str = "arn:aws:lambda:eu-west-1:809313241:function:test"
         aws_request_id: str = "52fdfc07-2182-154f-163f-5f0f9a621d72"
 
+        def get_remaining_time_in_millis(self) -> int:
+            return 30_000
+
     return LambdaContext()
 
 
@@ -38,7 +87,91 @@ def iam_client(aws_credentials):
     Return a mocked S3 client
     """
     with mock_aws():
-        yield boto3.client("iam", region_name="eu-west-2")
+        iam_client = create_client("iam", region_name="eu-west-2")
+        # Creating the client read the settings, re-read them for the test
+        get_settings.cache_clear()
+        yield iam_client
+
+
+@pytest.fixture
+def inject_faults(iam_client):
+    """Inject latency, throttling and errors into the mocked IAM client's
+    requests, see faults.py."""
+    injectors: List[FaultInjector] = []
+
+    def inject(**kwargs) -> FaultInjector:
+        injector = FaultInjector(iam_client, **kwargs).install()
+        injectors.append(injector)
+        return injector
+
+    yield inject
+    for injector in reversed(injectors):
+        injector.uninstall()
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """Skip the backoff delays while polling for a credential report."""
+    sleeps: List[float] = []
+    monkeypatch.setattr("src.credential_report.sleep", sleeps.append)
+    return sleeps
+
+
+@pytest.fixture
+def sixty_days_later(monkeypatch):
+    """Move every clock classifying users 60 days into the future, past every
+    threshold, and return the time then."""
+    later = reference_now() + 60 * SECONDS_PER_DAY
+    monkeypatch.setattr("src.classifier.reference_now", lambda: later)
+    monkeypatch.setattr("src.service_access.reference_now", lambda: later)
+    later_datetime = datetime.datetime.fromtimestamp(later, datetime.timezone.utc)
+    dt_mock = MagicMock(wraps=datetime.datetime)
+    dt_mock.now.return_value = later_datetime.replace(tzinfo=None)
+    monkeypatch.setattr(
+        "src.rules.datetime",
+        types.SimpleNamespace(datetime=dt_mock, date=datetime.date),
+    )
+
+    return later_datetime
+
+
+@pytest.fixture
+def create_user(iam_client):
+    """Create a user in the mocked account, or with client when given, with
+    a password unless console is False, an access key and tags."""
+
+    def create(
+        username: str,
+        console: bool = True,
+        access_key: bool = False,
+        client=None,
+        **tags: str,
+    ):
+        client = client or iam_client
+        client.create_user(
+            UserName=username,
+            Tags=[{"Key": key, "Value": value} for key, value in tags.items()],
+        )
+        if console:
+            client.create_login_profile(UserName=username, Password=MOCK_PASSWORD)
+        if access_key:
+            client.create_access_key(UserName=username)
+
+    return create
+
+
+@pytest.fixture
+def create_console_users(create_user):
+    """Create count users with a password, returning their usernames."""
+
+    def create(count: int) -> List[str]:
+        usernames = [f"user{index}" for index in range(count)]
+        for username in usernames:
+            create_user(username)
+
+        return usernames
+
+    return create
 
 
 @pytest.fixture
@@ -0,0 +1,173 @@
+"""A fault injecting stand-in for IAM, wrapping moto.
+
+moto answers every request instantly and never fails. FaultInjector takes
+the place of moto's handler on one client, and delays, throttles or fails
+each request before moto sees it, so a failed request has no effect, like
+a throttled request to AWS. Faults are injected per HTTP attempt, beneath
+botocore's retries, so the client's retry configuration applies as it would
+against AWS.
+"""
+
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from botocore.awsrequest import AWSResponse
+from moto.core.botocore_stubber import MockRawResponse
+from moto.core.models import botocore_stubber
+
+IAM_NAMESPACE = "https://iam.amazonaws.com/doc/2010-05-08/"
+
+
+@dataclass
+class Latency:
+    """Log-normally distributed latency, as AWS API latencies have a long
+    tail. A sigma of 0 gives a constant latency."""
+
+    median_seconds: float = 0.0
+    sigma: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median_seconds <= 0:
+            return 0.0
+
+        return self.median_seconds * math.exp(rng.gauss(0, self.sigma))
+
+
+@dataclass
+class OperationFaults:
+    latency: Latency = field(default_factory=Latency)
+    # Fractions of requests failing with Throttling, or ServiceFailure (500)
+    throttle_rate: float = 0.0
+    server_error_rate: float = 0.0
+
+
+@dataclass
+class FaultStats:
+    requests: Counter = field(default_factory=Counter)
+    throttled: Counter = field(default_factory=Counter)
+    server_errors: Counter = field(default_factory=Counter)
+    report_in_progress: int = 0
+
+
+class FaultInjector:
+    """Injects faults into an IAM client's requests to moto.
+
+    faults are keyed by operation name, e.g. DeleteLoginProfile, falling
+    back to default. The first report_in_progress GenerateCredentialReport
+    calls answer INPROGRESS, and GetCredentialReport fails with
+    ReportInProgress meanwhile.
+    """
+
+    def __init__(
+        self,
+        client,
+        faults: Optional[Dict[str, OperationFaults]] = None,
+        default: Optional[OperationFaults] = None,
+        report_in_progress: int = 0,
+        seed: int = 0,
+    ):
+        self.client = client
+        self.faults = faults or {}
+        self.default = default or OperationFaults()
+        self.stats = FaultStats()
+        self._report_pending = report_in_progress
+        self._report_started = False
+        self._rng = random.Random(seed)
+        # Requests are made concurrently by the remediation workers
+        self._lock = threading.Lock()
+
+    def install(self) -> "FaultInjector":
+        events = self.client.meta.events
+        events.unregister("before-send", botocore_stubber)
+        events.register("before-send", self)
+        return self
+
+    def uninstall(self):
+        events = self.client.meta.events
+        events.unregister("before-send", self)
+        events.register("before-send", botocore_stubber)
+
+    def __enter__(self) -> "FaultInjector":
+        return self.install()
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def __call__(self, event_name: str, request, **kwargs) -> Optional[AWSResponse]:
+        operation = event_name.rsplit(".", 1)[-1]
+        faults = self.faults.get(operation, self.default)
+        with self._lock:
+            self.stats.requests[operation] += 1
+            latency = faults.latency.sample(self._rng)
+            outcome = self._rng.random()
+            report_response = self._report_response(request, operation)
+
+        if latency:
+            time.sleep(latency)
+
+        if report_response is not None:
+            return report_response
+        if outcome < faults.throttle_rate:
+            with self._lock:
+                self.stats.throttled[operation] += 1
+            return self._error(request, 400, "Throttling", "Rate exceeded")
+        if outcome < faults.throttle_rate + faults.server_error_rate:
+            with self._lock:
+                self.stats.server_errors[operation] += 1
+            return self._error(request, 500, "ServiceFailure", "Internal failure")
+
+        return botocore_stubber(event_name, request, **kwargs)
+
+    def _report_response(self, request, operation: str) -> Optional[AWSResponse]:
+        # Called holding the lock
+        if self._report_pending <= 0:
+            return None
+
+        if operation == "GenerateCredentialReport":
+            self._report_pending -= 1
+            self._report_started = True
+            self.stats.report_in_progress += 1
+            return self._response(
+                request,
+                200,
+                "<GenerateCredentialReportResponse "
+                f'xmlns="{IAM_NAMESPACE}"><GenerateCredentialReportResult>'
+                "<State>INPROGRESS</State><Description>Generating</Description>"
+                "</GenerateCredentialReportResult>"
+                f"{self._metadata()}</GenerateCredentialReportResponse>",
+            )
+        if operation == "GetCredentialReport" and self._report_started:
+            return self._error(
+                request, 404, "ReportInProgress", "Report is being generated"
+            )
+
+        return None
+
+    @staticmethod
+    def _metadata() -> str:
+        return f"<ResponseMetadata><RequestId>{uuid.uuid4()}</RequestId></ResponseMetadata>"
+
+    def _error(self, request, status: int, code: str, message: str) -> AWSResponse:
+        error_type = "Receiver" if status >= 500 else "Sender"
+        return self._response(
+            request,
+            status,
+            f'<ErrorResponse xmlns="{IAM_NAMESPACE}"><Error><Type>{error_type}</Type>'
+            f"<Code>{code}</Code><Message>{message}</Message></Error>"
+            f"<RequestId>{uuid.uuid4()}</RequestId></ErrorResponse>",
+        )
+
+    @staticmethod
+    def _response(request, status: int, body: str) -> AWSResponse:
+        return AWSResponse(
+            request.url,
+            status,
+            {"Content-Type": "text/xml"},
+            MockRawResponse(body.encode("utf8")),
+        )
@@ -0,0 +1,419 @@
+import dataclasses
+import datetime
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from src import lambda_handler
+from src.account import monitor_account
+from src.activity import (
+    ACTIVITY_INDEX,
+    ActivityEvent,
+    DynamoDbActivityIndex,
+    SqliteActivityIndex,
+    Thresholds,
+    UserActivity,
+    open_activity_index,
+    parse_event,
+    record_batch,
+)
+from src.classifier import (
+    NO_INFORMATION,
+    PASSWORD_DISABLED,
+    SECONDS_PER_DAY,
+    reference_now,
+)
+from src.clients import create_client
+from src.config import get_settings
+from src.listing import list_credential_report
+from src.report import CREDENTIAL_REPORT, LISTED_USERS
+from src.timestamps import epoch_seconds
+
+THRESHOLDS = Thresholds(30, 7)
+MOCK_PASSWORD = "test_password"
+
+
+def at(moment: str) -> int:
+    return epoch_seconds(moment)
+
+
+def cloudtrail_event(name: str, username: str, moment: str, **detail) -> dict:
+    """An EventBridge event as delivered for a CloudTrail management event."""
+    return {
+        "account": "111111111111",
+        "detail-type": "AWS Console Sign In via CloudTrail",
+        "source": "aws.signin",
+        "detail": {
+            "eventName": name,
+            "eventTime": moment,
+            "userIdentity": {"type": "IAMUser", "userName": username},
+            **detail,
+        },
+    }
+
+
+def console_login(username: str, moment: str, result: str = "Success") -> dict:
+    return cloudtrail_event(
+        "ConsoleLogin",
+        username,
+        moment,
+        responseElements={"ConsoleLogin": result},
+    )
+
+
+def sqs_batch(*events: dict) -> dict:
+    return {
+        "Records": [
+            {"messageId": f"message{index}", "body": json.dumps(event)}
+            for index, event in enumerate(events)
+        ]
+    }
+
+
+@pytest.fixture
+def dynamodb_index(aws_credentials, iam_client):
+    dynamodb_client = create_client("dynamodb", region_name="eu-west-2")
+    dynamodb_client.create_table(
+        TableName="activity",
+        KeySchema=[
+            {"AttributeName": "account", "KeyType": "HASH"},
+            {"AttributeName": "username", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "account", "AttributeType": "S"},
+            {"AttributeName": "username", "AttributeType": "S"},
+            {"AttributeName": "inactive_at", "AttributeType": "N"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": "inactive_at",
+                "KeySchema": [
+                    {"AttributeName": "account", "KeyType": "HASH"},
+                    {"AttributeName": "inactive_at", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            }
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return DynamoDbActivityIndex(dynamodb_client, "activity")
+
+
+class PasswordLastUsed:
+    """moto's GetUser has no PasswordLastUsed, so it's added here."""
+
+    def __init__(self, iam_client, last_used):
+        self.iam_client = iam_client
+        self.last_used = last_used
+
+    def __getattr__(self, name):
+        return getattr(self.iam_client, name)
+
+    def get_user(self, UserName):
+        response = self.iam_client.get_user(UserName=UserName)
+        if UserName in self.last_used:
+            response["User"]["PasswordLastUsed"] = self.last_used[UserName]
+        return response
+
+
+@pytest.fixture
+def us_east_1(monkeypatch):
+    # The only region the index is used in
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+
+
+@pytest.fixture
+def sqlite_index(tmp_path):
+    return SqliteActivityIndex(str(tmp_path / "activity.db"))
+
+
+@pytest.fixture(params=["sqlite", "dynamodb"])
+def index(request):
+    return request.getfixturevalue(f"{request.param}_index")
+
+
+def test_parse_console_login():
+    event = parse_event(console_login("test", "2023-07-30T12:00:00Z"))
+
+    assert event == ActivityEvent(
+        "111111111111", "test", "ConsoleLogin", at("2023-07-30T12:00:00+00:00")
+    )
+
+
+def test_parse_ignores_failed_and_root_logins():
+    root = console_login("test", "2023-07-30T12:00:00Z")
+    root["detail"]["userIdentity"] = {"type": "Root"}
+
+    assert parse_event(console_login("test", "2023-07-30T12:00:00Z", "Failure")) is None
+    assert parse_event(root) is None
+    assert parse_event({"detail": {"eventName": "GetUser"}}) is None
+
+
+def test_parse_password_change_of_another_user():
+    event = cloudtrail_event(
+        "UpdateLoginProfile",
+        "admin",
+        "2023-07-30T12:00:00Z",
+        requestParameters={"userName": "test"},
+    )
+
+    parsed = parse_event(event)
+
+    assert parsed is not None
+    assert parsed.username == "test"
+    assert parsed.name == "UpdateLoginProfile"
+
+
+def test_events_only_move_activity_forward():
+    activity = UserActivity("test", password_last_used=at("2023-07-30T00:00:00"))
+
+    older = ActivityEvent("self", "test", "ConsoleLogin", at("2023-07-01T00:00:00"))
+    newer = ActivityEvent("self", "test", "ConsoleLogin", at("2023-07-31T00:00:00"))
+
+    assert older.apply(activity).password_last_used == at("2023-07-30T00:00:00")
+    assert newer.apply(activity).password_last_used == at("2023-07-31T00:00:00")
+
+
+def test_only_users_due_are_returned(index):
+    changed = at("2023-01-01T00:00:00")
+    index.reconcile(
+        "self",
+        [
+            UserActivity("active", 1, at("2023-07-30T00:00:00"), changed),
+            UserActivity("inactive", 1, at("2023-06-01T00:00:00"), changed),
+            UserActivity("never", 1, NO_INFORMATION, changed),
+            UserActivity("no-password", PASSWORD_DISABLED, NO_INFORMATION, changed),
+        ],
+        THRESHOLDS,
+        at("2023-08-01T00:00:00"),
+    )
+
+    due = index.due("self", at("2023-08-01T00:00:00"))
+
+    assert [user.username for user in due] == ["inactive", "never"]
+    assert index.due("other", at("2023-08-01T00:00:00")) == []
+
+
+def test_logins_are_recorded(index):
+    changed = at("2023-01-01T00:00:00")
+    index.reconcile(
+        "self",
+        [UserActivity("test", 1, at("2023-06-01T00:00:00"), changed)],
+        THRESHOLDS,
+        at("2023-08-01T00:00:00"),
+    )
+
+    login = ActivityEvent("self", "test", "ConsoleLogin", at("2023-07-31T00:00:00"))
+    index.record(login, THRESHOLDS)
+
+    assert index.due("self", at("2023-08-01T00:00:00")) == []
+    assert [
+        user.username
+        for user in index.due("self", at("2023-07-31T00:00:00") + 31 * SECONDS_PER_DAY)
+    ] == ["test"]
+
+
+def test_new_users_wait_for_their_grace_period(index):
+    created = ActivityEvent(
+        "self", "new", "CreateLoginProfile", at("2023-07-30T00:00:00")
+    )
+    index.record(created, THRESHOLDS)
+
+    assert index.due("self", at("2023-08-01T00:00:00")) == []
+    assert [user.username for user in index.due("self", at("2023-08-07T00:00:00"))] == [
+        "new"
+    ]
+
+
+def test_reconciliation_keeps_newer_recorded_activity(index):
+    login = ActivityEvent("self", "test", "ConsoleLogin", at("2023-07-31T00:00:00"))
+    index.record(login, THRESHOLDS)
+
+    # The report was generated before the login
+    index.reconcile(
+        "self",
+        [UserActivity("test", 1, at("2023-06-01T00:00:00"), at("2023-01-01T00:00:00"))],
+        THRESHOLDS,
+        at("2023-08-01T00:00:00"),
+    )
+
+    assert index.due("self", at("2023-08-01T00:00:00")) == []
+    reconciliation = index.reconciliation("self")
+    assert reconciliation is not None
+    assert reconciliation.reconciled_at == at("2023-08-01T00:00:00")
+    assert reconciliation.is_due(Thresholds(60, 7), 3600, at("2023-08-01T00:00:00"))
+
+
+def test_reconciliation_drops_deleted_users(index):
+    changed = at("2023-01-01T00:00:00")
+    inactive = UserActivity("deleted", 1, at("2023-06-01T00:00:00"), changed)
+    index.reconcile("self", [inactive], THRESHOLDS, at("2023-08-01T00:00:00"))
+
+    index.reconcile("self", [], THRESHOLDS, at("2023-08-02T00:00:00"))
+
+    assert index.due("self", at("2023-08-02T00:00:00")) == []
+
+
+def test_disabled_users_are_no_longer_due(index):
+    changed = at("2023-01-01T00:00:00")
+    inactive = UserActivity("test", 1, at("2023-06-01T00:00:00"), changed)
+    index.reconcile("self", [inactive], THRESHOLDS, at("2023-08-01T00:00:00"))
+
+    index.mark_disabled("self", ["test", "unknown"])
+
+    assert index.due("self", at("2023-08-01T00:00:00")) == []
+
+
+def test_record_batch_reports_failed_messages(sqlite_index):
+    batch = sqs_batch(console_login("test", "2023-07-30T12:00:00Z"))
+    batch["Records"].append({"messageId": "bad", "body": "{}"})
+    batch["Records"].append({"messageId": "broken", "body": "not json"})
+
+    response = record_batch(sqlite_index, batch, THRESHOLDS, "self")
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "broken"}]}
+
+
+def test_monitor_account_reads_the_index_between_reconciliations(
+    iam_client, sqlite_index, us_east_1, no_sleep, monkeypatch
+):
+    monkeypatch.setenv("activity_index_path", sqlite_index.path)
+    monkeypatch.setenv("activity_reconcile_interval_hours", str(365 * 24))
+    iam_client.create_user(UserName="test")
+    iam_client.create_login_profile(UserName="test", Password=MOCK_PASSWORD)
+
+    # The first run reconciles the index with the report
+    summary = monitor_account(iam_client, report_only=False)
+    assert summary.users == 1
+    assert summary.inactive == 0
+    assert summary.source == CREDENTIAL_REPORT
+    assert sqlite_index.reconciliation("self") is not None
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The report is only needed to reconcile")
+
+    monkeypatch.setattr("src.account.get_first_report", fail)
+    later = reference_now() + 60 * SECONDS_PER_DAY
+    monkeypatch.setattr("src.account.reference_now", lambda: later)
+
+    summary = monitor_account(iam_client, report_only=False)
+
+    assert summary.source == ACTIVITY_INDEX
+    assert summary.inactive == 1
+    assert summary.disabled == 1
+    with pytest.raises(iam_client.exceptions.NoSuchEntityException):
+        iam_client.get_login_profile(UserName="test")
+    assert monitor_account(iam_client, report_only=False).inactive == 0
+
+
+def test_users_active_since_they_were_indexed_are_not_disabled(
+    iam_client, create_user, sqlite_index, us_east_1, no_sleep, monkeypatch
+):
+    monkeypatch.setenv("activity_index_path", sqlite_index.path)
+    monkeypatch.setenv("activity_reconcile_interval_hours", str(365 * 24))
+    for username in ("inactive", "returned", "deleted"):
+        create_user(username)
+    monitor_account(iam_client, report_only=False)
+    iam_client.delete_login_profile(UserName="deleted")
+    iam_client.delete_user(UserName="deleted")
+
+    later = reference_now() + 60 * SECONDS_PER_DAY
+    monkeypatch.setattr("src.account.reference_now", lambda: later)
+    # Logged in without the event reaching the index
+    logged_in = datetime.datetime.fromtimestamp(
+        later - SECONDS_PER_DAY, datetime.timezone.utc
+    )
+    client = PasswordLastUsed(iam_client, {"returned": logged_in})
+
+    summary = monitor_account(client, report_only=False)
+
+    assert summary.inactive == 1
+    assert summary.disabled == 1
+    with pytest.raises(iam_client.exceptions.NoSuchEntityException):
+        iam_client.get_login_profile(UserName="inactive")
+    iam_client.get_login_profile(UserName="returned")
+    assert sqlite_index.due("self", later) == []
+    assert sqlite_index.due("self", later + 30 * SECONDS_PER_DAY)[0].username == (
+        "returned"
+    )
+
+
+class FailingDeletes(PasswordLastUsed):
+    """Deleting the users' login profiles is denied."""
+
+    def delete_login_profile(self, UserName):
+        raise ClientError(
+            {"Error": {"Code": "AccessDenied", "Message": "Denied"}},
+            "DeleteLoginProfile",
+        )
+
+
+def test_users_failing_to_be_disabled_stay_due(
+    iam_client, create_user, sqlite_index, us_east_1, no_sleep, monkeypatch
+):
+    monkeypatch.setenv("activity_index_path", sqlite_index.path)
+    monkeypatch.setenv("activity_reconcile_interval_hours", str(365 * 24))
+    create_user("test")
+    monitor_account(iam_client, report_only=False)
+    later = reference_now() + 60 * SECONDS_PER_DAY
+    monkeypatch.setattr("src.account.reference_now", lambda: later)
+
+    summary = monitor_account(FailingDeletes(iam_client, {}), report_only=False)
+
+    assert summary.failed == 1
+    assert [activity.username for activity in sqlite_index.due("self", later)] == [
+        "test"
+    ]
+
+
+def test_the_index_is_not_reconciled_with_listed_users(
+    iam_client, create_user, sqlite_index, us_east_1, no_sleep, monkeypatch
+):
+    monkeypatch.setenv("activity_index_path", sqlite_index.path)
+    monkeypatch.setattr("src.account.get_first_report", list_credential_report)
+    create_user("test")
+
+    summary = monitor_account(iam_client, report_only=True)
+
+    assert summary.source == LISTED_USERS
+    assert summary.users == 1
+    assert sqlite_index.reconciliation("self") is None
+
+
+def test_the_index_is_only_used_in_us_east_1(sqlite_index, monkeypatch):
+    monkeypatch.setenv("activity_index_path", sqlite_index.path)
+
+    with pytest.raises(ValueError, match="only kept up to date in us-east-1"):
+        open_activity_index(get_settings())
+
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+
+    assert isinstance(open_activity_index(get_settings()), SqliteActivityIndex)
+
+
+def test_handler_records_an_sqs_batch(
+    sqlite_index, us_east_1, lambda_context, monkeypatch
+):
+    monkeypatch.setattr(
+        lambda_handler,
+        "settings",
+        dataclasses.replace(
+            lambda_handler.settings, activity_index_path=sqlite_index.path
+        ),
+    )
+    login = console_login("test", "2023-07-30T12:00:00Z")
+
+    response = lambda_handler.handle_activity_event(sqs_batch(login), lambda_context)
+
+    assert response == {"batchItemFailures": []}
+    login_at = at("2023-07-30T12:00:00+00:00")
+    sqlite_index.reconcile(
+        "self",
+        [UserActivity("test", 1, NO_INFORMATION, at("2023-01-01T00:00:00"))],
+        THRESHOLDS,
+        login_at,
+    )
+    assert sqlite_index.due("self", login_at + 31 * SECONDS_PER_DAY)[0] == (
+        UserActivity("test", 1, login_at, at("2023-01-01T00:00:00"))
+    )
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from botocore.exceptions import ClientError
+
+from src.async_pipeline import monitor_account_async, monitor_organisation_async
+from src.clients import create_client
+from src.organisation import SessionCache
+
+
+def test_monitor_account_async(iam_client, create_user, no_sleep, sixty_days_later):
+    for username in ("test_1", "test_2"):
+        create_user(username, access_key=True)
+    iam_client.create_user(UserName="programmatic")
+
+    summary = asyncio.run(monitor_account_async(iam_client, report_only=False))
+
+    assert (summary.users, summary.inactive, summary.disabled) == (3, 2, 2)
+    for username in ("test_1", "test_2"):
+        with pytest.raises(ClientError):
+            iam_client.get_login_profile(UserName=username)
+        keys = iam_client.list_access_keys(UserName=username)["AccessKeyMetadata"]
+        assert keys[0]["Status"] == "Inactive"
+
+
+def test_monitor_account_async_report_only(
+    iam_client, create_user, no_sleep, sixty_days_later
+):
+    create_user("test_1", access_key=True)
+
+    summary = asyncio.run(monitor_account_async(iam_client, report_only=True))
+
+    assert (summary.inactive, summary.disabled) == (1, 0)
+    iam_client.get_login_profile(UserName="test_1")
+
+
+def test_monitor_organisation_async(
+    iam_client, create_user, no_sleep, sixty_days_later
+):
+    role_arns = [
+        "arn:aws:iam::111111111111:role/inactive-account-monitor",
+        "arn:aws:iam::222222222222:role/inactive-account-monitor",
+    ]
+    session_cache = SessionCache(create_client("sts", region_name="eu-west-2"))
+    create_user(
+        "test_1", access_key=True, client=session_cache.client(role_arns[1], "iam")
+    )
+
+    summary = asyncio.run(
+        monitor_organisation_async(session_cache, role_arns, report_only=False)
+    )
+
+    assert [account["disabled"] for account in summary["accounts"]] == [0, 1]
+    assert summary["disabled"] == 1
+
+
+def test_settings_only_the_threaded_pipeline_supports_are_rejected(
+    iam_client, monkeypatch, tmp_path
+):
+    monkeypatch.setenv("checkpoint_store_path", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setenv("activity_index_path", str(tmp_path / "activity.db"))
+
+    with pytest.raises(ValueError, match="checkpoint_store_path, activity_index_path"):
+        asyncio.run(monitor_account_async(iam_client, report_only=False))
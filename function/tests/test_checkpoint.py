@@ -0,0 +1,140 @@
+import boto3
+import pytest
+
+from src.account import monitor_account
+from src.checkpoint import (
+    Checkpoint,
+    Deadline,
+    PendingUser,
+    S3CheckpointStore,
+    SqliteCheckpointStore,
+    open_checkpoint_store,
+    remediate_in_chunks,
+)
+from src.config import get_settings
+from src.remediation import RemediationPlan, Remediator
+
+CONSOLE = RemediationPlan(delete_login_profile=True, deactivate_access_keys=False)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteCheckpointStore(str(tmp_path / "checkpoint.db"))
+
+
+@pytest.fixture
+def s3_store(iam_client, monkeypatch):
+    s3_client = boto3.client("s3", region_name="eu-west-2")
+    s3_client.create_bucket(
+        Bucket="results",
+        CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+    )
+    monkeypatch.setenv("checkpoint_store_uri", "s3://results/checkpoints")
+    return open_checkpoint_store(get_settings())
+
+
+def expiring_after(invocations: int) -> Deadline:
+    """A deadline allowing the given number of chunks."""
+    remaining = iter([60_000] * invocations)
+    return Deadline(lambda: next(remaining, 0), margin_seconds=1)
+
+
+@pytest.mark.parametrize("backend", ["store", "s3_store"])
+def test_checkpoints_are_saved_and_loaded(backend, request):
+    store = request.getfixturevalue(backend)
+    checkpoint = Checkpoint(
+        "111111111111", pending=[PendingUser("test", CONSOLE)], disabled=2
+    )
+    store.save(checkpoint)
+
+    assert store.load("111111111111") == checkpoint
+    assert store.load("222222222222") is None
+
+    store.delete("111111111111")
+    assert store.load("111111111111") is None
+
+
+def test_remediate_in_chunks_finishes_and_deletes_the_checkpoint(
+    iam_client, create_console_users, store
+):
+    usernames = create_console_users(5)
+    checkpoint = Checkpoint(
+        "self", pending=[PendingUser(username, CONSOLE) for username in usernames]
+    )
+
+    done = remediate_in_chunks(Remediator(iam_client), store, checkpoint, 2)
+
+    assert done
+    assert checkpoint.disabled == 5
+    assert store.load("self") is None
+
+
+def test_remediate_in_chunks_stops_at_the_deadline(
+    iam_client, create_console_users, store
+):
+    usernames = create_console_users(5)
+    checkpoint = Checkpoint(
+        "self", pending=[PendingUser(username, CONSOLE) for username in usernames]
+    )
+
+    done = remediate_in_chunks(
+        Remediator(iam_client), store, checkpoint, 2, expiring_after(1)
+    )
+
+    assert not done
+    saved = store.load("self")
+    assert saved is not None
+    assert saved.disabled == 2
+    assert [user.username for user in saved.pending] == usernames[2:]
+
+
+def test_monitor_account_resumes_from_the_checkpoint(
+    iam_client, create_console_users, store, monkeypatch
+):
+    monkeypatch.setenv("checkpoint_store_path", store.path)
+    monkeypatch.setenv("remediation_chunk_size", "2")
+    # Run the rule engine, so that the new users can be made inactive
+    monkeypatch.setenv("enabled_rules", "console-inactive,mfa-missing")
+    monkeypatch.setattr("src.rules.is_inactive", lambda *args: True)
+    usernames = create_console_users(5)
+
+    summary = monitor_account(iam_client, report_only=False, deadline=expiring_after(2))
+
+    assert summary.inactive == 5
+    assert summary.disabled == 4
+    assert summary.continuation_token is not None
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The report is not needed to resume")
+
+    monkeypatch.setattr("src.account.get_first_report", fail)
+    resumed = monitor_account(
+        iam_client, report_only=False, continuation_token=summary.continuation_token
+    )
+
+    assert resumed.inactive == 5
+    assert resumed.disabled == 5
+    assert resumed.continuation_token is None
+    assert store.load("self") is None
+    for username in usernames:
+        with pytest.raises(iam_client.exceptions.NoSuchEntityException):
+            iam_client.get_login_profile(UserName=username)
+
+
+def test_another_runs_checkpoint_is_discarded(
+    iam_client, create_console_users, s3_store, monkeypatch
+):
+    create_console_users(2)
+    stale = Checkpoint("self", pending=[PendingUser("user0", CONSOLE)])
+    s3_store.save(stale)
+
+    summary = monitor_account(
+        iam_client, report_only=False, continuation_token="another-run"
+    )
+
+    # Started afresh from the credential report, where no one is inactive
+    assert summary.users == 2
+    assert summary.disabled == 0
+    assert isinstance(s3_store, S3CheckpointStore)
+    assert s3_store.load("self") is None
+    iam_client.get_login_profile(UserName="user0")
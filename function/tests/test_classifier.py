@@ -0,0 +1,154 @@
+import datetime
+import random
+
+import pytest
+
+from src.classifier import (
+    NEVER,
+    Reason,
+    ReportColumns,
+    classify,
+    inactive_at,
+    inactive_times,
+)
+from src.helpers import is_inactive
+
+MOCK_INACTIVITY_THRESHOLD = 30
+MOCK_GRACE_PERIOD = 7
+NOW = datetime.datetime(2023, 8, 1, 0, 0, 0)
+SECONDS_PER_DAY = 86400
+
+
+def random_timestamp(rng: random.Random, threshold: int):
+    # Cluster timestamps around the threshold boundaries, at whole seconds as
+    # they appear in the credential report
+    days = rng.choice([threshold, threshold + 1, rng.randint(0, 90)])
+    seconds = rng.choice([0, 1, -1, rng.randint(-SECONDS_PER_DAY, SECONDS_PER_DAY)])
+    offset = datetime.timezone(datetime.timedelta(hours=rng.randint(-12, 12)))
+    return (NOW - datetime.timedelta(days=days, seconds=seconds)).replace(
+        tzinfo=rng.choice([datetime.timezone.utc, offset])
+    )
+
+
+def random_user(rng: random.Random, user, inactivity_threshold, grace_period):
+    return user.model_copy(
+        update={
+            "username": rng.choice(["test", "<root_account>"]),
+            "password_enabled": rng.choice([True, False, "not_supported"]),
+            "password_last_used": rng.choice(
+                [
+                    random_timestamp(rng, inactivity_threshold),
+                    "no_information",
+                    "N/A",
+                    "not_supported",
+                ]
+            ),
+            "password_last_changed": rng.choice(
+                [random_timestamp(rng, grace_period), "N/A", "not_supported"]
+            ),
+        }
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_classify_agrees_with_is_inactive(freeze_time, active_user, seed):
+    rng = random.Random(seed)
+    inactivity_threshold = rng.randint(0, 60)
+    grace_period = rng.randint(0, 14)
+    users = [
+        random_user(rng, active_user, inactivity_threshold, grace_period)
+        for _ in range(200)
+    ]
+
+    classification = classify(
+        ReportColumns.from_users(users), inactivity_threshold, grace_period
+    )
+
+    assert classification.inactive == [
+        is_inactive(user, inactivity_threshold, grace_period) for user in users
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_inactive_at_agrees_with_classify(active_user, seed):
+    rng = random.Random(seed)
+    users = [
+        random_user(rng, active_user, MOCK_INACTIVITY_THRESHOLD, MOCK_GRACE_PERIOD)
+        for _ in range(200)
+    ]
+    columns = ReportColumns.from_users(users)
+    moments = [
+        inactive_at(
+            username,
+            enabled,
+            last_used,
+            last_changed,
+            MOCK_INACTIVITY_THRESHOLD,
+            MOCK_GRACE_PERIOD,
+        )
+        for username, enabled, last_used, last_changed in zip(
+            columns.usernames,
+            columns.password_enabled,
+            columns.password_last_used,
+            columns.password_last_changed,
+        )
+    ]
+
+    reachable = sorted(set(moments) - {NEVER})
+    for now in (reachable[0] - 1, *reachable[:50]):
+        classification = classify(
+            columns, MOCK_INACTIVITY_THRESHOLD, MOCK_GRACE_PERIOD, now
+        )
+        assert classification.inactive == [moment <= now for moment in moments]
+    assert (
+        list(inactive_times(columns, MOCK_INACTIVITY_THRESHOLD, MOCK_GRACE_PERIOD))
+        == moments
+    )
+
+
+def test_classify_reasons(
+    freeze_time,
+    recently_created_user_with_no_logins,
+    not_recently_created_user_with_no_logins,
+    disabled_user,
+    active_user,
+    recently_reenabled_user_with_no_recent_login,
+    inactive_user,
+    root_user,
+):
+    columns = ReportColumns.from_users(
+        [
+            recently_created_user_with_no_logins,
+            not_recently_created_user_with_no_logins,
+            disabled_user,
+            active_user,
+            recently_reenabled_user_with_no_recent_login,
+            inactive_user,
+            root_user,
+        ]
+    )
+
+    classification = classify(columns, MOCK_INACTIVITY_THRESHOLD, MOCK_GRACE_PERIOD)
+
+    assert list(classification.reasons) == [
+        Reason.NEVER_LOGGED_IN,
+        Reason.NEVER_LOGGED_IN_GRACE_PERIOD_EXCEEDED,
+        Reason.NO_PASSWORD,
+        Reason.ACTIVE,
+        Reason.ACTIVE,
+        Reason.INACTIVE,
+        Reason.ROOT_USER,
+    ]
+    assert classification.inactive_indices() == [1, 5]
+
+
+def test_report_columns_from_report(iam_client):
+    iam_client.create_user(UserName="test_1")
+    iam_client.create_login_profile(UserName="test_1", Password="test_password")
+    iam_client.generate_credential_report()
+    content = iam_client.get_credential_report()["Content"]
+
+    columns = ReportColumns.from_report(content)
+
+    assert columns.usernames == ["test_1"]
+    assert list(columns.password_enabled) == [1]
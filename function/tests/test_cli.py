@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from src.cli import main, report_paths
+
+HEADER = (
+    "user,arn,user_creation_time,password_enabled,password_last_used,"
+    "password_last_changed,password_next_rotation,mfa_active,access_key_1_active,"
+    "access_key_1_last_rotated,access_key_1_last_used_date,"
+    "access_key_1_last_used_region,access_key_1_last_used_service,"
+    "access_key_2_active,access_key_2_last_rotated,access_key_2_last_used_date,"
+    "access_key_2_last_used_region,access_key_2_last_used_service,cert_1_active,"
+    "cert_1_last_rotated,cert_2_active,cert_2_last_rotated"
+)
+
+
+def row(username: str, last_used: str, mfa_active="true") -> str:
+    created = "2023-01-01T00:00:00+00:00"
+    return ",".join(
+        [username, f"arn:aws:iam::123456789012:user/{username}", created, "true"]
+        + [last_used, created, "N/A", mfa_active, "false", "N/A", "N/A", "N/A", "N/A"]
+        + ["false", "N/A", "N/A", "N/A", "N/A", "false", "N/A", "false", "N/A"]
+    )
+
+
+@pytest.fixture
+def reports(tmp_path):
+    (tmp_path / "a.csv").write_text(
+        "\n".join(
+            [
+                HEADER,
+                row("active", "2023-07-30T00:00:00+00:00"),
+                row("inactive", "2023-06-01T00:00:00+00:00"),
+            ]
+        )
+    )
+    (tmp_path / "b.csv").write_text(
+        "\n".join([HEADER, row("no_mfa", "2023-07-30T00:00:00+00:00", "false")])
+    )
+    (tmp_path / "notes.txt").write_text("not a report")
+    return tmp_path
+
+
+def test_report_paths_expands_directories(reports):
+    assert report_paths([str(reports), "other.csv"]) == [
+        str(reports / "a.csv"),
+        str(reports / "b.csv"),
+        "other.csv",
+    ]
+
+
+def test_main_prints_verdicts_as_of_now(reports, capsys):
+    main([str(reports), "--now", "2023-08-01", "--workers", "1"])
+
+    out, err = capsys.readouterr()
+    assert out.splitlines() == [
+        f"{reports / 'a.csv'}\tinactive\tconsole-inactive\t"
+        "2023-06-01T00:00:00+00:00\treported"
+    ]
+    assert "a.csv: 2 users, console-inactive 1, exempt 0" in err
+    assert "Replayed 2 reports" in err
+
+
+def test_main_overrides_rules_and_thresholds(reports, capsys):
+    main(
+        [
+            str(reports),
+            "--now",
+            "2023-08-01T00:00:00+00:00",
+            "--rules",
+            "console-inactive,mfa-missing",
+            "--inactivity-threshold-days",
+            "90",
+            "--json",
+        ]
+    )
+
+    verdicts = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(verdict["username"], verdict["rules"]) for verdict in verdicts] == [
+        ("no_mfa", ["mfa-missing"])
+    ]
+
+
+def test_main_reports_exempt_usernames(reports, capsys, monkeypatch):
+    monkeypatch.setenv("exempt_username_patterns", "in*")
+
+    main([str(reports), "--now", "2023-08-01", "--json"])
+
+    out, err = capsys.readouterr()
+    verdicts = [json.loads(line) for line in out.splitlines()]
+    assert [(verdict["username"], verdict["action"]) for verdict in verdicts] == [
+        ("inactive", "exempt")
+    ]
+    assert "console-inactive 1, exempt 1" in err
+
+    main([str(reports), "--now", "2023-08-01", "--exempt-username-patterns", "x*"])
+
+    assert capsys.readouterr().out.endswith("\treported\n")
+
+
+def test_main_rejects_invalid_settings(reports):
+    with pytest.raises(SystemExit):
+        main([str(reports), "--rules", "dormant"])
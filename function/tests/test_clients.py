@@ -0,0 +1,76 @@
+import pytest
+
+from src.clients import (
+    client_config,
+    create_client,
+    get_client,
+    parse_s3_uri,
+    pool_size,
+)
+from src.config import Settings
+from src.organisation import SessionCache
+
+
+def test_client_config_from_settings(monkeypatch):
+    monkeypatch.setenv("remediation_max_workers", "16")
+    monkeypatch.setenv("client_read_timeout_seconds", "10")
+
+    config = client_config()
+
+    assert config.retries == {"mode": "adaptive", "total_max_attempts": 3}
+    assert config.max_pool_connections == 17
+    assert config.connect_timeout == 5.0
+    assert config.read_timeout == 10.0
+    assert client_config(max_pool_connections=4).max_pool_connections == 4
+
+
+def test_pool_has_a_connection_per_service_access_job(monkeypatch):
+    monkeypatch.setenv("service_access_enabled", "true")
+    monkeypatch.setenv("service_access_max_jobs", "32")
+
+    assert client_config().max_pool_connections == 33
+    assert pool_size(64) == 65
+
+
+def test_created_clients_use_the_config(aws_credentials):
+    client = create_client("iam", region_name="eu-west-2")
+
+    assert client.meta.config.retries["mode"] == "adaptive"
+    assert client.meta.config.max_pool_connections == 9
+
+
+def test_clients_are_reused(aws_credentials):
+    get_client.cache_clear()
+    try:
+        assert get_client("sts") is get_client("sts")
+    finally:
+        get_client.cache_clear()
+
+
+def test_session_cache_sizes_pools_for_the_account_workers(iam_client, monkeypatch):
+    monkeypatch.setenv("organisation_remediation_max_workers", "6")
+    session_cache = SessionCache(create_client("sts", region_name="eu-west-2"))
+
+    client = session_cache.client(
+        "arn:aws:iam::111111111111:role/inactive-account-monitor", "iam"
+    )
+
+    assert client.meta.config.max_pool_connections == 7
+
+
+def test_unknown_retry_modes_are_rejected():
+    with pytest.raises(ValueError, match="client_retry_mode must be one of"):
+        Settings(client_retry_mode="eager")
+
+
+@pytest.mark.parametrize(
+    "uri,expected",
+    [
+        ("s3://bucket", ("bucket", "")),
+        ("s3://bucket/", ("bucket", "")),
+        ("s3://bucket/results", ("bucket", "results/")),
+        ("s3://bucket/runs/results/", ("bucket", "runs/results/")),
+    ],
+)
+def test_s3_uris_are_parsed(uri, expected):
+    assert parse_s3_uri(uri) == expected
@@ -0,0 +1,75 @@
+import dataclasses
+
+import pytest
+
+from src.config import Settings, get_settings
+
+
+def test_defaults():
+    settings = Settings.from_environ({})
+
+    assert settings.report_only is True
+    assert settings.inactivity_threshold_days == 30
+    assert settings.organisation_role_arns == ()
+    assert settings.checkpoint_store_path is None
+
+
+def test_values_are_parsed_from_the_environment():
+    settings = Settings.from_environ(
+        {
+            "report_only": "false",
+            "inactivity_threshold_days": "45",
+            "remediation_backoff_base_seconds": "0.25",
+            "organisation_role_arns": "arn:aws:iam::111111111111:role/a, ,"
+            "arn:aws:iam::222222222222:role/b",
+            "checkpoint_store_path": "",
+        }
+    )
+
+    assert settings.report_only is False
+    assert settings.inactivity_threshold_days == 45
+    assert settings.remediation_backoff_base_seconds == 0.25
+    assert settings.organisation_role_arns == (
+        "arn:aws:iam::111111111111:role/a",
+        "arn:aws:iam::222222222222:role/b",
+    )
+    assert settings.checkpoint_store_path is None
+
+
+@pytest.mark.parametrize(
+    "environ,message",
+    [
+        ({"inactivity_threshold_days": "thirty"}, "inactivity_threshold_days"),
+        ({"inactivity_threshold_days": "0"}, "must be at least 1"),
+        ({"remediation_max_workers": "1000"}, "must be at most 64"),
+        (
+            {
+                "organisation_role_arns": "arn:aws:iam::111111111111:role/a",
+                "activity_index_table": "activity",
+            },
+            "can't be used with organisation_role_arns",
+        ),
+    ],
+)
+def test_invalid_values_are_rejected(environ, message):
+    with pytest.raises(ValueError, match=message):
+        Settings.from_environ(environ)
+
+
+@pytest.mark.parametrize("value", ["true", "False", "FALSE", "0", "no", "", "maybe"])
+def test_only_the_exact_false_disables_users(value):
+    assert Settings.from_environ({"report_only": value}).report_only is True
+
+
+def test_settings_are_frozen():
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        Settings().report_only = False  # type: ignore[misc]
+
+
+def test_settings_are_memoized(monkeypatch):
+    monkeypatch.setenv("inactivity_threshold_days", "45")
+    settings = get_settings()
+    monkeypatch.setenv("inactivity_threshold_days", "60")
+
+    assert get_settings() is settings
+    assert get_settings().inactivity_threshold_days == 45
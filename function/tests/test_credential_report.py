@@ -1,15 +1,21 @@
+import pytest
+from pydantic import ValidationError
+
 from src.credential_report import get_credential_report
+from src.models import User
+from src.report import CredentialReport
+from src.retry import backoff_delay
 
 MOCK_PASSWORD = "test_password"
 
 
-def test_get_credential_report_no_users(iam_client):
+def test_get_credential_report_no_users(iam_client, no_sleep):
     report = get_credential_report(iam_client)
 
     assert len(report.users) == 0
 
 
-def test_get_credential_report_users(iam_client):
+def test_get_credential_report_users(iam_client, no_sleep):
     iam_client.create_user(UserName="test_1")
     iam_client.create_user(UserName="test_2")
     iam_client.create_login_profile(UserName="test_2", Password=MOCK_PASSWORD)
@@ -26,3 +32,127 @@ def test_get_credential_report_users(iam_client):
     assert report.users[2].username == "test_3"
     assert report.users[2].password_enabled == False
     assert report.users[2].access_key_1_active == True
+
+
+def test_get_credential_report_polls_until_complete(iam_client, no_sleep, monkeypatch):
+    states = iter(["STARTED", "INPROGRESS", "COMPLETE"])
+    monkeypatch.setattr(
+        iam_client, "generate_credential_report", lambda: {"State": next(states)}
+    )
+    monkeypatch.setattr(
+        iam_client,
+        "get_credential_report",
+        lambda: {"Content": b"user,arn\n", "GeneratedTime": None},
+    )
+
+    report = get_credential_report(iam_client)
+
+    assert report.users == []
+    assert len(no_sleep) == 2
+
+
+def test_get_credential_report_gives_up(iam_client, no_sleep, monkeypatch):
+    monkeypatch.setenv("get_credential_report_retry_limit", "3")
+    monkeypatch.setattr(
+        iam_client, "generate_credential_report", lambda: {"State": "INPROGRESS"}
+    )
+
+    with pytest.raises(Exception, match="after 3 attempts"):
+        get_credential_report(iam_client)
+
+    assert len(no_sleep) == 2
+
+
+def test_get_credential_report_reuses_recent_report(iam_client, no_sleep, monkeypatch):
+    iam_client.create_user(UserName="test_1")
+    iam_client.generate_credential_report()
+
+    # moto reports a fixed generation time in the past
+    monkeypatch.setenv("credential_report_max_age_seconds", str(100 * 365 * 86400))
+    monkeypatch.setattr(iam_client, "generate_credential_report", None)
+
+    report = get_credential_report(iam_client)
+
+    assert report.generated_time is not None
+    assert [user.username for user in report] == ["test_1"]
+
+
+def test_get_credential_report_regenerates_stale_report(iam_client, no_sleep):
+    iam_client.generate_credential_report()
+    iam_client.create_user(UserName="test_1")
+
+    report = get_credential_report(iam_client)
+
+    assert [user.username for user in report] == ["test_1"]
+
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, 1, 16) <= min(16, 2**attempt)
+
+
+def test_credential_report_maps_columns_from_header():
+    content = (
+        b"arn,user,user_creation_time,password_enabled,password_last_used,"
+        b"password_last_changed,password_next_rotation,mfa_active,"
+        b"access_key_1_active,access_key_1_last_rotated,access_key_1_last_used_date,"
+        b"access_key_1_last_used_region,access_key_1_last_used_service,"
+        b"access_key_2_active,access_key_2_last_rotated,access_key_2_last_used_date,"
+        b"access_key_2_last_used_region,access_key_2_last_used_service,"
+        b"cert_1_active,cert_1_last_rotated,cert_2_active,cert_2_last_rotated,"
+        b"new_column\n"
+        b"arn:aws:iam::123456789012:user/test,test,2023-08-04T00:00:00+00:00,true,"
+        b"no_information,2023-08-04T00:00:00+00:00,N/A,false,false,N/A,N/A,N/A,N/A,"
+        b"false,N/A,N/A,N/A,N/A,false,N/A,false,N/A,ignored\n"
+    )
+
+    users = list(CredentialReport(content))
+
+    assert len(users) == 1
+    assert users[0].username == "test"
+    assert users[0].arn == "arn:aws:iam::123456789012:user/test"
+    assert users[0].password_last_used == "no_information"
+
+
+def test_credential_report_is_lazy():
+    report = CredentialReport(b"user,arn\ntest,arn:aws:iam::123456789012:user/test\n")
+    iterator = iter(report)
+
+    # Nothing is parsed until the first user is requested
+    with pytest.raises(ValidationError):
+        next(iterator)
+
+
+def test_empty_credential_report_has_no_users():
+    assert CredentialReport(b"").users == []
+
+
+def test_credential_report_records_match_users(iam_client, no_sleep):
+    iam_client.create_user(UserName="test_1")
+    iam_client.create_login_profile(UserName="test_1", Password=MOCK_PASSWORD)
+    iam_client.create_user(UserName="test_2")
+    iam_client.create_access_key(UserName="test_2")
+
+    report = get_credential_report(iam_client)
+
+    for user, record in zip(report.users, report.records(), strict=True):
+        assert record.to_user() == user
+        for field in User.model_fields:
+            assert getattr(record, field) == getattr(user, field)
+
+
+def test_user_record_decodes_lazily():
+    report = CredentialReport(
+        b"user,arn,password_enabled,password_last_used,password_last_changed,"
+        b"mfa_active\n"
+        b"test,arn:aws:iam::123456789012:user/test,true,no_information,N/A,nope\n"
+    )
+    record = next(report.records())
+
+    assert record.password_enabled is True
+    assert record.password_last_used == "no_information"
+    # Invalid values are only detected once the field is read
+    with pytest.raises(ValidationError):
+        record.mfa_active
+    with pytest.raises(AttributeError):
+        record.not_a_field
@@ -0,0 +1,115 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.account import monitor_account
+from src.async_pipeline import monitor_account_async
+from src.config import Settings
+from src.exemptions import Exemptions, TagCache, compile_patterns
+
+
+@pytest.fixture(autouse=True)
+def tag_cache(monkeypatch):
+    """Start every test with no cached tags."""
+    cache = TagCache()
+    monkeypatch.setattr("src.exemptions._tag_cache", cache)
+    return cache
+
+
+def test_patterns_are_compiled_into_one_matcher():
+    matches = compile_patterns(("breakglass-*", "svc-?"))
+
+    assert matches is not None
+    assert matches("breakglass-admin")
+    assert matches("svc-1")
+    assert not matches("svc-12")
+    assert not matches("alice")
+    assert compile_patterns(()) is None
+
+
+def test_users_are_exempt_by_pattern_or_tag(iam_client, create_user, monkeypatch):
+    monkeypatch.setenv("exempt_username_patterns", "breakglass-*")
+    monkeypatch.setenv("exempt_tags", "service,owner=platform")
+    create_user("breakglass-admin")
+    create_user("service", service="ci")
+    create_user("owned", owner="platform")
+    create_user("other-owner", owner="someone")
+    create_user("alice")
+
+    exempt = Exemptions(iam_client).exempt(
+        ["breakglass-admin", "service", "owned", "other-owner", "alice"]
+    )
+
+    assert exempt == {"breakglass-admin", "service", "owned"}
+
+
+def test_tags_are_cached_between_runs(iam_client, create_user, monkeypatch):
+    monkeypatch.setenv("exempt_tags", "breakglass")
+    create_user("test", breakglass="true")
+    assert Exemptions(iam_client).exempt(["test"]) == {"test"}
+
+    iam_client.untag_user(UserName="test", TagKeys=["breakglass"])
+
+    assert Exemptions(iam_client).exempt(["test"]) == {"test"}
+    assert Exemptions(iam_client, account="other").exempt(["test"]) == set()
+
+
+def test_expired_tags_are_listed_again(iam_client, create_user, monkeypatch):
+    monkeypatch.setenv("exempt_tags", "breakglass")
+    monkeypatch.setenv("exempt_tags_cache_seconds", "0")
+    create_user("test", breakglass="true")
+    assert Exemptions(iam_client).exempt(["test"]) == {"test"}
+
+    iam_client.untag_user(UserName="test", TagKeys=["breakglass"])
+
+    assert Exemptions(iam_client).exempt(["test"]) == set()
+
+
+def test_users_whose_tags_cant_be_listed_are_exempt(monkeypatch):
+    monkeypatch.setenv("exempt_tags", "breakglass")
+    iam_client = MagicMock()
+    iam_client.get_paginator.side_effect = Exception("Throttling")
+
+    assert Exemptions(iam_client).exempt(["test"]) == {"test"}
+
+
+def test_exempt_tags_need_a_key():
+    with pytest.raises(ValueError, match="exempt_tags: missing key"):
+        Settings(exempt_tags=("=true",))
+
+
+def test_monitor_account_leaves_exempt_users_alone(
+    iam_client, create_user, no_sleep, sixty_days_later, monkeypatch
+):
+    monkeypatch.setenv("exempt_tags", "breakglass")
+    create_user("breakglass", breakglass="true")
+    create_user("test")
+
+    summary = monitor_account(iam_client, report_only=False)
+
+    assert summary.inactive == 1
+    assert summary.exempt == 1
+    assert summary.disabled == 1
+    iam_client.get_login_profile(UserName="breakglass")
+    with pytest.raises(iam_client.exceptions.NoSuchEntityException):
+        iam_client.get_login_profile(UserName="test")
+
+
+def test_monitor_account_async_leaves_exempt_users_alone(
+    iam_client, create_user, no_sleep, monkeypatch
+):
+    monkeypatch.setenv("exempt_username_patterns", "breakglass-*")
+    monkeypatch.setenv("exempt_tags", "service")
+    monkeypatch.setattr("src.rules.is_inactive", lambda *args, **kwargs: True)
+    create_user("breakglass-admin")
+    create_user("ci", service="true")
+    create_user("test")
+
+    summary = asyncio.run(monitor_account_async(iam_client, report_only=False))
+
+    assert summary.inactive == 1
+    assert summary.exempt == 2
+    assert summary.disabled == 1
+    iam_client.get_login_profile(UserName="breakglass-admin")
+    iam_client.get_login_profile(UserName="ci")
@@ -0,0 +1,89 @@
+import pytest
+from faults import FaultInjector, Latency, OperationFaults
+
+from src.clients import create_client
+from src.credential_report import get_credential_report
+from src.remediation import Outcome, RemediationPlan, Remediator
+
+CONSOLE = RemediationPlan(delete_login_profile=True, deactivate_access_keys=False)
+
+
+def test_credential_report_is_polled_while_in_progress(
+    iam_client, inject_faults, no_sleep
+):
+    iam_client.create_user(UserName="test")
+    injector = inject_faults(report_in_progress=3)
+
+    report = get_credential_report(iam_client)
+
+    assert [user.username for user in report.records()] == ["test"]
+    assert injector.stats.report_in_progress == 3
+    # moto itself answers STARTED once
+    assert len(no_sleep) == 3 + 1
+
+
+def test_credential_report_polling_gives_up(
+    iam_client, inject_faults, no_sleep, monkeypatch
+):
+    monkeypatch.setenv("get_credential_report_retry_limit", "3")
+    inject_faults(report_in_progress=10)
+
+    with pytest.raises(Exception, match="after 3 attempts"):
+        get_credential_report(iam_client)
+
+
+def test_server_errors_are_retried_by_botocore(
+    iam_client, create_console_users, monkeypatch
+):
+    monkeypatch.setenv("client_max_attempts", "10")
+    usernames = create_console_users(50)
+    retrying_client = create_client("iam", region_name="eu-west-2")
+    faults = OperationFaults(server_error_rate=0.3)
+
+    with FaultInjector(retrying_client, {"DeleteLoginProfile": faults}) as injector:
+        result = Remediator(retrying_client).remediate_all(
+            usernames, [CONSOLE] * len(usernames)
+        )
+
+    assert result.count(Outcome.SUCCESS) == 50
+    assert injector.stats.server_errors["DeleteLoginProfile"] > 0
+
+
+def test_persistent_throttling_fails_users_without_raising(
+    iam_client, create_console_users, monkeypatch
+):
+    monkeypatch.setenv("client_retry_mode", "standard")
+    monkeypatch.setenv("client_max_attempts", "2")
+    monkeypatch.setenv("remediation_retry_limit", "2")
+    monkeypatch.setenv("remediation_backoff_base_seconds", "0")
+    usernames = create_console_users(4)
+    throttled_client = create_client("iam", region_name="eu-west-2")
+    faults = OperationFaults(throttle_rate=1.0)
+
+    with FaultInjector(throttled_client, {"DeleteLoginProfile": faults}) as injector:
+        result = Remediator(throttled_client).remediate_all(usernames, [CONSOLE] * 4)
+
+    assert result.count(Outcome.FAILED) == 4
+    # Both remediation attempts are retried once by botocore
+    assert injector.stats.throttled["DeleteLoginProfile"] == 4 * 2 * 2
+    for username in usernames:
+        iam_client.get_login_profile(UserName=username)
+
+
+def test_call_timings_include_latency(iam_client, inject_faults):
+    iam_client.create_user(UserName="test")
+    iam_client.create_access_key(UserName="test")
+    inject_faults(faults={"ListAccessKeys": OperationFaults(Latency(0.05))})
+
+    remediation = Remediator(iam_client).remediate(
+        "test", RemediationPlan(delete_login_profile=True, deactivate_access_keys=True)
+    )
+
+    assert remediation.outcome == Outcome.SUCCESS
+    assert [call.operation for call in remediation.calls] == [
+        "delete_login_profile",
+        "list_access_keys",
+        "update_access_key",
+    ]
+    assert remediation.calls[1].seconds >= 0.05
+    assert remediation.calls[2].seconds < 0.05
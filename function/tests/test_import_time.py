@@ -0,0 +1,48 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# Most invocations are cold starts, so keep importing the handler cheap. The
+# budget is deliberately generous so it only catches real regressions, e.g. a
+# client or pydantic model being created at import time again.
+IMPORT_TIME_BUDGET_MS = 250
+
+LAZY_MODULES = ["boto3", "pydantic", "src.models"]
+
+
+def import_handler(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=Path(__file__).parents[1],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def cumulative_import_time_ms(importtime_output: str, module: str) -> float:
+    # Lines look like "import time: self [us] | cumulative | imported package"
+    for line in importtime_output.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000
+
+    raise AssertionError(f"{module} not found in -X importtime output")
+
+
+def test_handler_import_time_is_within_budget():
+    result = import_handler("-X", "importtime", "-c", "import src.lambda_handler")
+
+    elapsed = cumulative_import_time_ms(result.stderr, "src.lambda_handler")
+
+    assert elapsed < IMPORT_TIME_BUDGET_MS
+
+
+def test_handler_import_defers_heavy_modules():
+    result = import_handler(
+        "-c",
+        "import sys, src.lambda_handler; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))",
+    )
+
+    assert result.stdout.strip() == ""
@@ -0,0 +1,96 @@
+import json
+
+from src.account import monitor_account
+from src.instrumentation import Instrumentation, emit_metrics, wall_clock_seconds
+
+
+def test_phase_records_duration(instrumentation):
+    with instrumentation.phase("classify"):
+        pass
+    with instrumentation.phase("classify"):
+        pass
+
+    assert len(instrumentation.collector.phases["classify"]) == 2
+
+
+def test_concurrent_phases_are_not_summed(instrumentation):
+    # Three accounts remediating at once, and one afterwards
+    for start, end in ((0.0, 2.0), (0.5, 1.5), (1.0, 3.0), (4.0, 5.0)):
+        instrumentation.collector.record_phase("remediate", start, end)
+
+    assert instrumentation.collector.summary()["phases"] == {"remediate": 4.0}
+    assert wall_clock_seconds([]) == 0
+
+
+def test_instrumented_client_counts_calls(iam_client, instrumentation):
+    instrumentation.instrument_client(iam_client)
+
+    iam_client.list_users()
+    iam_client.list_users()
+    iam_client.create_user(UserName="test")
+
+    assert instrumentation.collector.calls == {"ListUsers": 2, "CreateUser": 1}
+
+
+def test_instrumented_client_counts_throttles(iam_client, instrumentation):
+    operation = iam_client.meta.service_model.operation_model("ListUsers")
+
+    for error_code in ("Throttling", "NoSuchEntity"):
+        instrumentation._needs_retry(
+            response=(None, {"Error": {"Code": error_code}}), operation=operation
+        )
+    # Attempts that failed without a response aren't throttles
+    instrumentation._needs_retry(response=None, operation=operation)
+
+    assert instrumentation.collector.throttles == {"ListUsers": 1}
+
+
+def test_monitor_account_records_phases(iam_client, instrumentation, no_sleep):
+    instrumentation.instrument_client(iam_client)
+    iam_client.create_user(UserName="test")
+
+    monitor_account(iam_client, report_only=False)
+
+    assert set(instrumentation.collector.phases) == {
+        "generate",
+        "poll",
+        "download",
+        "parse",
+        "classify",
+        "remediate",
+    }
+    # One to check for a recent report, one to download the new report
+    assert instrumentation.collector.calls["GetCredentialReport"] == 2
+
+
+def test_flush_resets_the_collector(instrumentation):
+    instrumentation.collector.record_call("ListUsers")
+
+    instrumentation.flush()
+
+    assert instrumentation.collector.summary() == {
+        "phases": {},
+        "calls": {},
+        "throttles": {},
+    }
+
+
+def test_emit_metrics(capsys):
+    emit_metrics(
+        {
+            "phases": {"classify": 0.5},
+            "calls": {"ListAccessKeys": 3},
+            "throttles": {},
+        }
+    )
+
+    metrics = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    assert metrics[0]["PhaseDuration"] == [500]
+    assert metrics[0]["Phase"] == "classify"
+    assert metrics[1]["IamCalls"] == [3]
+    assert metrics[1]["Operation"] == "ListAccessKeys"
+
+
+def test_tracer_is_optional():
+    assert Instrumentation(tracer=None).tracer is None
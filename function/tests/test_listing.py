@@ -0,0 +1,158 @@
+import csv
+import datetime
+import io
+import threading
+
+import pytest
+
+from src.classifier import ReportColumns, classify
+from src.listing import format_time, get_first_report, list_credential_report
+from src.report import CREDENTIAL_REPORT, LISTED_USERS, CredentialReport
+
+MOCK_PASSWORD = "test_password"
+
+
+def columns(report: CredentialReport) -> dict:
+    return {
+        record.username: (
+            record.password_enabled,
+            record.access_key_1_active,
+            record.access_key_2_active,
+        )
+        for record in report.records()
+        if record.username != "<root_account>"
+    }
+
+
+@pytest.fixture
+def users(iam_client):
+    iam_client.create_user(UserName="console")
+    iam_client.create_login_profile(UserName="console", Password=MOCK_PASSWORD)
+    iam_client.create_user(UserName="programmatic")
+    iam_client.create_access_key(UserName="programmatic")
+    key = iam_client.create_access_key(UserName="programmatic")["AccessKey"]
+    iam_client.update_access_key(
+        UserName="programmatic", AccessKeyId=key["AccessKeyId"], Status="Inactive"
+    )
+    iam_client.create_user(UserName="mfa")
+    device = iam_client.create_virtual_mfa_device(VirtualMFADeviceName="mfa")
+    iam_client.enable_mfa_device(
+        UserName="mfa",
+        SerialNumber=device["VirtualMFADevice"]["SerialNumber"],
+        AuthenticationCode1="123456",
+        AuthenticationCode2="123456",
+    )
+    return iam_client
+
+
+def test_listed_users_match_the_credential_report(users, no_sleep, monkeypatch):
+    monkeypatch.setenv("enabled_rules", "console-inactive,mfa-missing")
+    listed = list_credential_report(users)
+
+    users.generate_credential_report()
+    report = CredentialReport(users.get_credential_report()["Content"])
+
+    assert columns(listed) == columns(report)
+    assert {record.username: record.mfa_active for record in listed.records()} == {
+        "console": False,
+        "programmatic": False,
+        "mfa": True,
+    }
+
+
+def test_listed_and_reported_reset_users_agree(
+    iam_client, create_user, no_sleep, sixty_days_later
+):
+    create_user("reset")
+    iam_client.update_login_profile(UserName="reset", Password="new_password")
+    reset = format_time(sixty_days_later - datetime.timedelta(days=1))
+    # moto reports when the user was created, AWS when the password was reset
+    iam_client.generate_credential_report()
+    rows = list(
+        csv.reader(io.StringIO(iam_client.get_credential_report()["Content"].decode()))
+    )
+    header, rows = rows[0], [row for row in rows[1:] if row[0] == "reset"]
+    rows[0][header.index("password_last_changed")] = reset
+    output = io.StringIO()
+    csv.writer(output, lineterminator="\n").writerows([header, *rows])
+
+    listed = ReportColumns.from_report(list_credential_report(iam_client).content)
+    reported = ReportColumns.from_report(output.getvalue().encode("utf8"))
+
+    assert listed.usernames == reported.usernames == ["reset"]
+    assert classify(listed, 30, 7).reasons == classify(reported, 30, 7).reasons
+
+
+def test_the_credential_report_is_used_when_ready(users, no_sleep, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("The users should not be listed")
+
+    monkeypatch.setattr("src.listing.list_credential_report", fail)
+
+    report = get_first_report(users)
+
+    assert report.generated_time is not None
+    assert report.source == CREDENTIAL_REPORT
+    assert {record.username for record in report.records()} >= {"console", "mfa"}
+
+
+def test_users_are_listed_when_the_report_fails(users, monkeypatch):
+    monkeypatch.setenv("enabled_rules", "key-unused,mfa-missing")
+
+    def fail(*args, **kwargs):
+        raise Exception("Unable to get credential report after 5 attempts")
+
+    monkeypatch.setattr("src.listing.get_credential_report", fail)
+
+    report = get_first_report(users)
+
+    assert set(columns(report)) == {"console", "programmatic", "mfa"}
+    assert report.source == LISTED_USERS
+
+
+def test_users_are_not_listed_for_console_inactive(users, monkeypatch):
+    def fail(*args, **kwargs):
+        raise Exception("Unable to get credential report after 5 attempts")
+
+    def listing(*args, **kwargs):
+        raise AssertionError("console-inactive can't be evaluated from the listing")
+
+    monkeypatch.setattr("src.listing.get_credential_report", fail)
+    monkeypatch.setattr("src.listing.list_credential_report", listing)
+
+    with pytest.raises(Exception, match="Unable to get credential report"):
+        get_first_report(users)
+
+
+def test_listed_users_win_over_a_slow_report(users, monkeypatch):
+    monkeypatch.setenv("enabled_rules", "key-unused,mfa-missing")
+    monkeypatch.setenv("listing_fallback_after_seconds", "0")
+    abandoned = threading.Event()
+
+    def slow_report(iam_client, stop):
+        stop.wait(5)
+        abandoned.set()
+        raise Exception("Abandoned waiting for the credential report")
+
+    monkeypatch.setattr("src.listing.get_credential_report", slow_report)
+
+    report = get_first_report(users)
+
+    assert set(columns(report)) == {"console", "programmatic", "mfa"}
+    assert abandoned.wait(1)
+
+
+def test_both_sources_failing_raises(users, monkeypatch):
+    monkeypatch.setenv("enabled_rules", "key-unused,mfa-missing")
+
+    def fail(*args, **kwargs):
+        raise Exception("Unable to get credential report after 5 attempts")
+
+    def fail_listing(*args, **kwargs):
+        raise Exception("Throttled")
+
+    monkeypatch.setattr("src.listing.get_credential_report", fail)
+    monkeypatch.setattr("src.listing.list_credential_report", fail_listing)
+
+    with pytest.raises(Exception, match="Throttled"):
+        get_first_report(users)
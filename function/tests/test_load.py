@@ -0,0 +1,122 @@
+"""Load scenarios against the fault injecting IAM stand-in.
+
+Each scenario disables thousands of inactive users under injected latency
+and errors, and records its throughput and run time as test properties
+(in the JUnit XML with --junitxml). The assertions bound the run time by
+a multiple of the ideal time for the injected latency and concurrency, so
+a regression serialising the remediation workers, or retrying much more
+than needed, fails them. Wall clock time on shared runners varies, so the
+scenarios are marked load and left out of the default run:
+
+    pytest -m load --junitxml=load-results.xml
+"""
+
+import datetime
+import time
+from typing import Tuple
+
+import pytest
+from faults import FaultInjector, Latency, OperationFaults
+
+from src.account import monitor_account
+from src.classifier import SECONDS_PER_DAY, ReportColumns, classify, reference_now
+from src.clients import create_client
+from src.remediation import Outcome, RemediationPlan, Remediator
+from src.state import SqliteStateStore, diff_states
+
+CONSOLE = RemediationPlan(delete_login_profile=True, deactivate_access_keys=False)
+# Allowance over the ideal run time, for moto, retries and scheduling
+SLACK = 4
+
+pytestmark = pytest.mark.load
+
+
+def to_iso(moment: int) -> str:
+    return datetime.datetime.fromtimestamp(moment, datetime.timezone.utc).isoformat()
+
+
+def test_remediation_throughput(
+    iam_client, create_console_users, inject_faults, record_property
+):
+    users, workers, latency = 2000, 16, 0.02
+    usernames = create_console_users(users)
+    inject_faults(
+        faults={"DeleteLoginProfile": OperationFaults(Latency(latency, sigma=0.3))}
+    )
+
+    start = time.perf_counter()
+    result = Remediator(iam_client, workers).remediate_all(usernames, [CONSOLE] * users)
+    elapsed = time.perf_counter() - start
+
+    record_property("users_per_second", users / elapsed)
+    record_property("seconds", elapsed)
+    assert result.count(Outcome.SUCCESS) == users
+    assert elapsed < SLACK * users * latency / workers
+
+
+def test_monitor_account_run_time(
+    iam_client,
+    create_console_users,
+    no_sleep,
+    sixty_days_later,
+    monkeypatch,
+    record_property,
+):
+    # Adaptive mode would rate limit the whole client after the first throttle
+    monkeypatch.setenv("client_retry_mode", "standard")
+    monkeypatch.setenv("remediation_backoff_base_seconds", "0.01")
+    users, workers, latency = 1000, 8, 0.005
+    create_console_users(users)
+    client = create_client("iam", region_name="eu-west-2")
+    faults = OperationFaults(
+        Latency(latency, sigma=0.5), throttle_rate=0.01, server_error_rate=0.01
+    )
+
+    with FaultInjector(client, default=faults, report_in_progress=2) as injector:
+        start = time.perf_counter()
+        summary = monitor_account(client, report_only=False, max_workers=workers)
+        elapsed = time.perf_counter() - start
+
+    retried = sum(injector.stats.throttled.values()) + sum(
+        injector.stats.server_errors.values()
+    )
+    record_property("users_per_second", users / elapsed)
+    record_property("seconds", elapsed)
+    record_property("requests", sum(injector.stats.requests.values()))
+    record_property("retried", retried)
+    assert summary.inactive == users
+    assert summary.disabled == users
+    # botocore waits up to a second before each retry, holding a worker
+    assert elapsed < SLACK * users * latency / workers + retried / workers + 2
+
+
+def test_state_store_overhead(tmp_path, record_property):
+    users = 100_000
+    now = reference_now()
+    header = "user,arn,password_enabled,password_last_used,password_last_changed\n"
+    rows = (
+        f"user{index},arn:aws:iam::123456789012:user/user{index},true,"
+        f"{to_iso(now - (index % 90) * SECONDS_PER_DAY)},"
+        f"{to_iso(now - (index % 90 + 1) * SECONDS_PER_DAY)}\n"
+        for index in range(users)
+    )
+    content = (header + "".join(rows)).encode("utf8")
+    store = SqliteStateStore(str(tmp_path / "state.db"))
+
+    def run() -> Tuple[float, float]:
+        start = time.perf_counter()
+        columns = ReportColumns.from_report(content)
+        classification = classify(columns, 30, 7, now)
+        classified = time.perf_counter()
+        store.apply(diff_states(columns, classification, store.load(), 30, 7))
+        return classified - start, time.perf_counter() - classified
+
+    classify_seconds, first_seconds = run()
+    _, unchanged_seconds = run()
+
+    record_property("parse_and_classify_seconds", classify_seconds)
+    record_property("first_run_state_seconds", first_seconds)
+    record_property("unchanged_run_state_seconds", unchanged_seconds)
+    # Writing every user once, after which only changed users are written
+    assert first_seconds < 2 * classify_seconds
+    assert unchanged_seconds < classify_seconds
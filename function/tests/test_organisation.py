@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+
+from src.clients import create_client
+from src.organisation import SessionCache, monitor_organisation
+
+ROLE_ARNS = [
+    "arn:aws:iam::111111111111:role/inactive-account-monitor",
+    "arn:aws:iam::222222222222:role/inactive-account-monitor",
+]
+
+
+@pytest.fixture
+def sts_client(iam_client):
+    return create_client("sts", region_name="eu-west-2")
+
+
+def test_session_cache_reuses_clients(sts_client):
+    session_cache = SessionCache(sts_client)
+
+    first = session_cache.client(ROLE_ARNS[0], "iam")
+
+    assert session_cache.client(ROLE_ARNS[0], "iam") is first
+    assert session_cache.client(ROLE_ARNS[1], "iam") is not first
+
+
+def test_session_cache_refreshes_expiring_sessions(sts_client, monkeypatch):
+    session_cache = SessionCache(sts_client)
+    first = session_cache.client(ROLE_ARNS[0], "iam")
+
+    monkeypatch.setattr(
+        session_cache,
+        "_is_expiring",
+        lambda expiration: True,
+    )
+
+    assert session_cache.client(ROLE_ARNS[0], "iam") is not first
+
+
+def test_session_cache_expiry_uses_refresh_margin(sts_client, monkeypatch):
+    monkeypatch.setenv("sts_session_refresh_margin_seconds", "300")
+    session_cache = SessionCache(sts_client)
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    assert session_cache._is_expiring(now + datetime.timedelta(seconds=299))
+    assert not session_cache._is_expiring(now + datetime.timedelta(seconds=600))
+
+
+def test_monitor_organisation(sts_client, no_sleep):
+    session_cache = SessionCache(sts_client)
+    for index, role_arn in enumerate(ROLE_ARNS):
+        iam_client = session_cache.client(role_arn, "iam")
+        for user in range(index + 1):
+            iam_client.create_user(UserName=f"test_{user}")
+
+    summary = monitor_organisation(session_cache, ROLE_ARNS, report_only=True)
+
+    assert [account["account"] for account in summary["accounts"]] == [
+        "111111111111",
+        "222222222222",
+    ]
+    assert [account["users"] for account in summary["accounts"]] == [1, 2]
+    assert summary["users"] == 3
+    assert summary["failed_accounts"] == []
+
+
+def test_monitor_organisation_reports_failed_accounts(sts_client, monkeypatch):
+    session_cache = SessionCache(sts_client)
+
+    def fail(*args, **kwargs):
+        raise Exception("Access denied")
+
+    monkeypatch.setattr("src.organisation.monitor_account", fail)
+
+    summary = monitor_organisation(session_cache, ROLE_ARNS[:1], report_only=True)
+
+    assert summary["failed_accounts"] == ["111111111111"]
+    assert summary["accounts"][0]["error"] == "Access denied"
@@ -0,0 +1,123 @@
+import dataclasses
+import json
+import os
+import pstats
+
+import boto3
+import pytest
+
+from src import lambda_handler
+from src.profiling import (
+    MEMORY_NAME,
+    PROFILE_NAME,
+    LocalDirectorySink,
+    open_artefact_sink,
+    profile,
+    profiled,
+)
+
+
+def allocate(count: int) -> list:
+    return [f"user{index}" for index in range(count)]
+
+
+def read_memory(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def test_profile_records_memory_by_phase(instrumentation, tmp_path):
+    sink = LocalDirectorySink(str(tmp_path))
+
+    with profile(sink, "run", instrumentation) as profiler:
+        with instrumentation.phase("parse"):
+            users = allocate(50_000)
+        with instrumentation.phase("classify"):
+            pass
+
+    assert instrumentation.profiler is None
+    assert profiler.locations == [
+        str(tmp_path / "run" / PROFILE_NAME),
+        str(tmp_path / "run" / MEMORY_NAME),
+    ]
+    stats = pstats.Stats(profiler.locations[0])
+    assert any(function[2] == "allocate" for function in stats.stats)  # type: ignore[attr-defined]
+
+    memory = read_memory(profiler.locations[1])
+    parse, classify = memory["phases"]
+    assert [parse["phase"], classify["phase"]] == ["parse", "classify"]
+    assert parse["allocated_bytes"] > 50_000 * 50
+    assert parse["peak_bytes"] >= parse["allocated_bytes"]
+    assert parse["top_allocations"][0]["location"].startswith(__file__)
+    assert memory["peak_bytes"] >= parse["peak_bytes"]
+    assert len(users) == 50_000
+
+
+class FailingSink:
+    def write(self, name: str, data: bytes) -> str:
+        raise OSError("No space left on device")
+
+
+def test_failing_to_write_artefacts_doesnt_fail_the_run(instrumentation):
+    with profile(FailingSink(), "run", instrumentation) as profiler:
+        pass
+
+    assert profiler.locations == []
+
+
+def test_failing_to_write_artefacts_doesnt_mask_the_runs_error(instrumentation):
+    with pytest.raises(RuntimeError, match="run failed"):
+        with profile(FailingSink(), "run", instrumentation):
+            raise RuntimeError("run failed")
+
+
+def test_handler_is_only_profiled_when_requested(monkeypatch, tmp_path):
+    monkeypatch.setenv("profiling_uri", str(tmp_path))
+    handler = profiled(lambda event, context: {"users": 1})
+
+    assert handler({}, None) == {"users": 1}
+    assert os.listdir(tmp_path) == []
+
+    response = handler({"profile": True}, None)
+
+    assert response["users"] == 1
+    assert [os.path.basename(location) for location in response["profile"]] == [
+        PROFILE_NAME,
+        MEMORY_NAME,
+    ]
+    assert all(os.path.exists(location) for location in response["profile"])
+
+
+def test_handle_event_profiles_the_run(
+    iam_client, lambda_context, no_sleep, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("profiling_uri", str(tmp_path))
+    monkeypatch.setattr(
+        lambda_handler,
+        "settings",
+        dataclasses.replace(lambda_handler.settings, report_only=True),
+    )
+    monkeypatch.setattr(lambda_handler, "get_client", lambda service: iam_client)
+    iam_client.create_user(UserName="test")
+
+    summary = lambda_handler.handle_event({"profile": True}, lambda_context)
+
+    assert summary["users"] == 1
+    phases = {phase["phase"] for phase in read_memory(summary["profile"][1])["phases"]}
+    assert {"download", "parse", "classify"} <= phases
+
+
+def test_artefacts_are_written_to_s3(iam_client):
+    s3_client = boto3.client("s3", region_name="eu-west-2")
+    s3_client.create_bucket(
+        Bucket="profiles",
+        CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+    )
+
+    sink = open_artefact_sink("s3://profiles/monitor")
+
+    assert (
+        sink.write("run/memory.json", b"{}") == "s3://profiles/monitor/run/memory.json"
+    )
+    body = s3_client.get_object(Bucket="profiles", Key="monitor/run/memory.json")
+    assert body["Body"].read() == b"{}"
@@ -0,0 +1,108 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from src.remediation import Outcome, RemediationPlan, Remediator, plan_remediation
+from src.retry import call_with_retry
+
+MOCK_PASSWORD = "test_password"
+
+
+def throttling_error(operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": "Throttling", "Message": ""}}, operation)
+
+
+def test_plan_remediation(inactive_user, disabled_user):
+    programmatic_user = disabled_user.model_copy(update={"access_key_2_active": True})
+
+    assert plan_remediation(inactive_user) == RemediationPlan(True, False)
+    assert plan_remediation(disabled_user).is_empty
+    assert plan_remediation(programmatic_user) == RemediationPlan(False, True)
+    assert plan_remediation(inactive_user, console=False).is_empty
+
+
+def test_disable_users(iam_client, inactive_user, disabled_user):
+    iam_client.create_user(UserName="test")
+    iam_client.create_login_profile(UserName="test", Password=MOCK_PASSWORD)
+    iam_client.create_access_key(UserName="test")
+    iam_client.create_access_key(UserName="test")
+    user_with_keys = inactive_user.model_copy(
+        update={"access_key_1_active": True, "access_key_2_active": True}
+    )
+    disabled_user = disabled_user.model_copy(update={"username": "disabled"})
+
+    result = Remediator(iam_client, max_workers=2).disable_users(
+        [user_with_keys, disabled_user]
+    )
+
+    assert [user.outcome for user in result.users] == [
+        Outcome.SUCCESS,
+        Outcome.ALREADY_DISABLED,
+    ]
+    response = iam_client.list_access_keys(UserName="test")
+    assert {key["Status"] for key in response["AccessKeyMetadata"]} == {"Inactive"}
+    assert result.latency_summary()["update_access_key"]["count"] == 2
+    assert result.latency_summary()["list_access_keys"]["count"] == 1
+    # Nothing to do for the disabled user, according to the report
+    assert result.users[1].calls == []
+
+
+def test_disable_users_skips_access_keys_without_active_keys(iam_client, inactive_user):
+    iam_client.create_user(UserName="test")
+    iam_client.create_login_profile(UserName="test", Password=MOCK_PASSWORD)
+
+    result = Remediator(iam_client).disable_users([inactive_user])
+
+    assert result.count(Outcome.SUCCESS) == 1
+    assert [call.operation for call in result.users[0].calls] == [
+        "delete_login_profile"
+    ]
+
+
+def test_disable_users_treats_missing_entities_as_done(iam_client, inactive_user):
+    # The user was deleted since the report was generated
+    user_with_keys = inactive_user.model_copy(update={"access_key_1_active": True})
+
+    result = Remediator(iam_client).disable_users([user_with_keys])
+
+    assert result.count(Outcome.ALREADY_DISABLED) == 1
+
+
+def test_disable_users_reports_failures(iam_client, inactive_user, monkeypatch):
+    def delete_login_profile(**kwargs):
+        raise ClientError(
+            {"Error": {"Code": "AccessDenied", "Message": ""}}, "DeleteLoginProfile"
+        )
+
+    monkeypatch.setattr(iam_client, "delete_login_profile", delete_login_profile)
+
+    result = Remediator(iam_client).disable_users([inactive_user])
+
+    assert result.count(Outcome.FAILED) == 1
+    assert result.users[0].error is not None
+
+
+def test_call_with_retry_retries_throttling(monkeypatch):
+    monkeypatch.setattr("src.retry.sleep", lambda seconds: None)
+    responses = [throttling_error("ListAccessKeys"), {"AccessKeyMetadata": []}]
+
+    def list_access_keys(**kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert call_with_retry(list_access_keys, 5, 0.1, 1) == {"AccessKeyMetadata": []}
+
+
+def test_call_with_retry_gives_up(monkeypatch):
+    monkeypatch.setattr("src.retry.sleep", lambda seconds: None)
+    calls = []
+
+    def list_access_keys(**kwargs):
+        calls.append(kwargs)
+        raise throttling_error("ListAccessKeys")
+
+    with pytest.raises(ClientError):
+        call_with_retry(list_access_keys, 3, 0.1, 1, UserName="test")
+
+    assert len(calls) == 3
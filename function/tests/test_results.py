@@ -0,0 +1,149 @@
+import dataclasses
+import json
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+
+from src import lambda_handler
+from src.account import monitor_account
+from src.clients import get_client
+from src.remediation import CallTiming, Outcome, UserRemediation
+from src.results import LocalFileSink, S3Sink, UserResult, close_sink, open_sink
+
+MOCK_PASSWORD = "test_password"
+
+
+def read_results(path) -> list:
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_user_result_from_remediation(
+    inactive_user, recently_created_user_with_no_logins
+):
+    remediation = UserRemediation(
+        "test",
+        Outcome.SUCCESS,
+        [
+            CallTiming("list_access_keys", 0.25),
+            CallTiming("update_access_key", 0.5),
+            CallTiming("update_access_key", 0.25),
+        ],
+    )
+
+    result = UserResult.from_user(
+        "self", inactive_user, ("console-inactive",), remediation
+    )
+    reported = UserResult.from_user(
+        "self", recently_created_user_with_no_logins, ("console-inactive",)
+    )
+
+    assert result.last_console_login == "2023-06-02T00:00:00+00:00"
+    assert result.action == "success"
+    assert result.call_seconds == {"list_access_keys": 0.25, "update_access_key": 0.75}
+    assert reported.last_console_login == "no_information"
+    assert reported.action == "reported"
+
+
+def test_local_file_sink_writes_json_lines(tmp_path, inactive_user):
+    sink = open_sink(str(tmp_path / "results"), "run.jsonl")
+    assert isinstance(sink, LocalFileSink)
+
+    sink.write(UserResult.from_user("self", inactive_user, ("console-inactive",)))
+    sink.write(UserResult.from_user("other", inactive_user, ("mfa-missing",)))
+    sink.close()
+
+    results = read_results(tmp_path / "results" / "run.jsonl")
+    assert [result["account"] for result in results] == ["self", "other"]
+    assert results[1]["rules"] == ["mfa-missing"]
+
+
+def test_s3_sink_uploads_on_close(iam_client, inactive_user):
+    s3_client = boto3.client("s3", region_name="eu-west-2")
+    s3_client.create_bucket(
+        Bucket="results",
+        CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+    )
+    sink = open_sink("s3://results/monitor", "run.jsonl")
+    assert isinstance(sink, S3Sink)
+    assert sink.location == "s3://results/monitor/run.jsonl"
+    # Created with the configured retries, timeouts and pool
+    assert sink.s3_client is get_client("s3")
+
+    sink.write(UserResult.from_user("self", inactive_user, ("console-inactive",)))
+    sink.close()
+
+    body = s3_client.get_object(Bucket="results", Key="monitor/run.jsonl")["Body"]
+    assert json.loads(body.read())["username"] == "test"
+
+
+def test_monitor_account_writes_a_result_per_remediated_user(
+    iam_client, no_sleep, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("enabled_rules", "console-inactive,mfa-missing")
+    monkeypatch.setattr("src.rules.is_inactive", lambda *args: True)
+    iam_client.create_user(UserName="test")
+    iam_client.create_login_profile(UserName="test", Password=MOCK_PASSWORD)
+    iam_client.create_user(UserName="programmatic")
+    sink = LocalFileSink(str(tmp_path / "run.jsonl"))
+
+    monitor_account(iam_client, report_only=False, sink=sink)
+    sink.close()
+
+    results = {
+        result["username"]: result for result in read_results(tmp_path / "run.jsonl")
+    }
+    assert results["test"]["rules"] == ["console-inactive", "mfa-missing"]
+    assert results["test"]["action"] == "success"
+    assert set(results["test"]["call_seconds"]) == {"delete_login_profile"}
+    assert results["programmatic"]["rules"] == ["console-inactive"]
+    assert results["programmatic"]["action"] == "already_disabled"
+
+
+def test_handler_returns_a_compact_summary(
+    iam_client, lambda_context, no_sleep, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(
+        lambda_handler,
+        "settings",
+        dataclasses.replace(
+            lambda_handler.settings, report_only=True, results_uri=str(tmp_path)
+        ),
+    )
+    monkeypatch.setattr(lambda_handler, "get_client", lambda service: iam_client)
+    iam_client.create_user(UserName="test")
+
+    summary = lambda_handler.handle_event({}, lambda_context)
+
+    assert summary["users"] == 1
+    assert summary["inactive"] == 0
+    assert summary["results"].startswith(str(tmp_path))
+    assert "classify" in summary["instrumentation"]["phases"]
+    assert read_results(summary["results"]) == []
+
+
+def test_s3_sink_closes_the_spool_when_the_upload_fails():
+    s3_client = MagicMock()
+    s3_client.upload_fileobj.side_effect = Exception("AccessDenied")
+    sink = S3Sink(s3_client, "results", "run.jsonl")
+
+    with pytest.raises(Exception, match="AccessDenied"):
+        sink.close()
+
+    assert sink.file.closed
+
+
+def test_close_sink_does_not_mask_the_runs_error():
+    sink = MagicMock()
+    sink.close.side_effect = Exception("AccessDenied")
+
+    with pytest.raises(ValueError, match="run failed"):
+        try:
+            raise ValueError("run failed")
+        finally:
+            close_sink(sink)
+
+    sink.close.assert_called_once()
+    with pytest.raises(Exception, match="AccessDenied"):
+        close_sink(sink)
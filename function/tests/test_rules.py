@@ -0,0 +1,109 @@
+import datetime
+
+import pytest
+
+from src.account import monitor_account
+from src.config import Settings
+from src.rules import (
+    CONSOLE_INACTIVE,
+    KEY_UNROTATED,
+    KEY_UNUSED,
+    MFA_MISSING,
+    compile_rules,
+    evaluate,
+)
+
+ALL_RULES = (CONSOLE_INACTIVE, KEY_UNUSED, KEY_UNROTATED, MFA_MISSING)
+
+
+def at(moment: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(f"{moment}T00:00:00+00:00")
+
+
+def with_key(user, last_rotated: str, last_used=None):
+    return user.model_copy(
+        update={
+            "access_key_1_active": True,
+            "access_key_1_last_rotated": at(last_rotated),
+            "access_key_1_last_used_date": at(last_used) if last_used else "N/A",
+        }
+    )
+
+
+def matched(user, *names: str):
+    rules = compile_rules(Settings(enabled_rules=names or ALL_RULES))
+    (verdict,) = evaluate([user], rules)
+    return verdict.matched
+
+
+def test_console_inactive(freeze_time, inactive_user, active_user):
+    assert matched(inactive_user, CONSOLE_INACTIVE) == (CONSOLE_INACTIVE,)
+    assert matched(active_user, CONSOLE_INACTIVE) == ()
+
+
+def test_key_unused(freeze_time, disabled_user):
+    assert matched(with_key(disabled_user, "2023-01-01", "2023-04-01"), KEY_UNUSED)
+    assert not matched(with_key(disabled_user, "2023-01-01", "2023-07-01"), KEY_UNUSED)
+
+
+def test_key_never_used_is_unused_after_the_threshold_from_rotation(
+    freeze_time, disabled_user
+):
+    assert matched(with_key(disabled_user, "2023-01-01"), KEY_UNUSED)
+    assert not matched(with_key(disabled_user, "2023-07-01"), KEY_UNUSED)
+
+
+def test_key_unused_needs_every_active_key_unused(freeze_time, disabled_user):
+    user = with_key(disabled_user, "2023-01-01", "2023-04-01").model_copy(
+        update={
+            "access_key_2_active": True,
+            "access_key_2_last_rotated": at("2023-01-01"),
+            "access_key_2_last_used_date": at("2023-07-30"),
+        }
+    )
+
+    assert not matched(user, KEY_UNUSED)
+
+
+def test_key_unrotated(freeze_time, disabled_user):
+    assert matched(with_key(disabled_user, "2023-01-01", "2023-07-30"), KEY_UNROTATED)
+    assert not matched(with_key(disabled_user, "2023-06-01"), KEY_UNROTATED)
+
+
+def test_mfa_missing(active_user, disabled_user, root_user):
+    assert matched(active_user.model_copy(update={"mfa_active": False}), MFA_MISSING)
+    assert not matched(active_user, MFA_MISSING)
+    assert not matched(disabled_user.model_copy(update={"mfa_active": False}))
+    assert not matched(root_user.model_copy(update={"mfa_active": False}), MFA_MISSING)
+
+
+def test_evaluate_yields_a_verdict_per_user(freeze_time, inactive_user, active_user):
+    user = with_key(inactive_user, "2023-01-01").model_copy(
+        update={"mfa_active": False}
+    )
+    rules = compile_rules(Settings(enabled_rules=ALL_RULES))
+
+    verdicts = list(evaluate([user, active_user], rules))
+
+    assert verdicts[0].matched == ALL_RULES
+    assert verdicts[0].console_inactive and verdicts[0].keys_unused
+    assert verdicts[1].matched == ()
+
+
+def test_unknown_rules_are_rejected():
+    with pytest.raises(ValueError, match="unknown rule"):
+        Settings.from_environ({"enabled_rules": "console-inactive,dormant"})
+
+
+def test_monitor_account_only_disables_unused_keys(iam_client, monkeypatch):
+    monkeypatch.setenv("enabled_rules", f"{KEY_UNUSED},{MFA_MISSING}")
+    iam_client.create_user(UserName="test")
+    iam_client.create_login_profile(UserName="test", Password="test_password")
+    iam_client.create_access_key(UserName="test")
+
+    summary = monitor_account(iam_client, report_only=False)
+
+    # A key created just now is not unused, the console user has no MFA
+    assert summary.rule_matches == {KEY_UNUSED: 0, MFA_MISSING: 1}
+    assert summary.inactive == 0
+    assert iam_client.get_login_profile(UserName="test")
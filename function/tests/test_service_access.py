@@ -0,0 +1,183 @@
+import asyncio
+import datetime
+import threading
+
+import pytest
+
+from src.account import monitor_account
+from src.async_pipeline import monitor_account_async
+from src.service_access import ServiceAccessJobs, latest_access
+
+UTC = datetime.timezone.utc
+
+
+class ServiceAccessStub:
+    """moto has no service last accessed jobs, so they are answered here.
+
+    Each job is in progress for the first polls, then returns the time set
+    for the user in accessed, two services per page.
+    """
+
+    def __init__(self, iam_client, accessed=None, polls_in_progress=2):
+        self.iam_client = iam_client
+        self.accessed = accessed or {}
+        self.polls_in_progress = polls_in_progress
+        self.jobs = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.iam_client, name)
+
+    def generate_service_last_accessed_details(self, Arn, Granularity):
+        username = Arn.rsplit("/", 1)[-1]
+        with self._lock:
+            job_id = f"job-{len(self.jobs)}"
+            self.jobs[job_id] = [username, self.polls_in_progress]
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        return {"JobId": job_id}
+
+    def get_service_last_accessed_details(self, JobId, Marker="0"):
+        username, polls = self.jobs[JobId]
+        if polls:
+            self.jobs[JobId][1] -= 1
+            return {"JobStatus": "IN_PROGRESS"}
+
+        accessed = self.accessed.get(username)
+        services = [
+            {"ServiceNamespace": "ec2"},
+            {"ServiceNamespace": "iam", "LastAuthenticated": accessed},
+            {"ServiceNamespace": "s3"},
+        ]
+        if accessed is None:
+            services = services[:1]
+        start = int(Marker)
+        page = services[start : start + 2]
+        if start + 2 < len(services):
+            return {
+                "JobStatus": "COMPLETED",
+                "ServicesLastAccessed": page,
+                "IsTruncated": True,
+                "Marker": str(start + 2),
+            }
+
+        with self._lock:
+            self.in_flight -= 1
+        return {"JobStatus": "COMPLETED", "ServicesLastAccessed": page}
+
+
+@pytest.fixture(autouse=True)
+def no_poll_sleep(monkeypatch):
+    monkeypatch.setattr("src.service_access.sleep", lambda seconds: None)
+
+
+def key_status(iam_client, username: str) -> str:
+    keys = iam_client.list_access_keys(UserName=username)["AccessKeyMetadata"]
+    return keys[0]["Status"]
+
+
+def test_latest_access():
+    earlier = datetime.datetime(2024, 1, 1, tzinfo=UTC)
+    later = datetime.datetime(2024, 2, 1, tzinfo=UTC)
+
+    access = latest_access(
+        "test",
+        [
+            {"ServiceNamespace": "ec2", "LastAuthenticated": earlier},
+            {"ServiceNamespace": "s3", "LastAuthenticated": later},
+            {"ServiceNamespace": "iam"},
+        ],
+    )
+
+    assert access.last_authenticated == later
+    assert access.service == "s3"
+    assert latest_access("test", [{"ServiceNamespace": "iam"}]).service is None
+
+
+def test_jobs_are_polled_and_paginated(iam_client, create_user, monkeypatch):
+    monkeypatch.setenv("service_access_enabled", "true")
+    accessed = datetime.datetime(2024, 1, 1, tzinfo=UTC)
+    create_user("test", access_key=True)
+    stub = ServiceAccessStub(iam_client, {"test": accessed})
+
+    access = ServiceAccessJobs(stub).last_accessed("test")
+
+    assert access is not None
+    assert access.last_authenticated == accessed
+    assert access.service == "iam"
+
+
+def test_unknown_access_leaves_the_verdict_alone(iam_client, create_user, monkeypatch):
+    monkeypatch.setenv("service_access_poll_limit", "3")
+    create_user("test", access_key=True)
+    stub = ServiceAccessStub(iam_client, polls_in_progress=5)
+
+    assert ServiceAccessJobs(stub).last_accessed("test") is None
+    assert ServiceAccessJobs(stub).last_accessed("deleted") is None
+
+
+def test_jobs_in_flight_are_bounded(iam_client, create_user, monkeypatch):
+    monkeypatch.setenv("service_access_max_jobs", "3")
+    usernames = [f"user{index}" for index in range(12)]
+    for username in usernames:
+        create_user(username, console=False, access_key=True)
+    stub = ServiceAccessStub(iam_client, polls_in_progress=3)
+
+    accesses = ServiceAccessJobs(stub).last_accessed_all(
+        (username, None) for username in usernames
+    )
+
+    assert set(accesses) == set(usernames)
+    assert len(stub.jobs) == 12
+    assert stub.max_in_flight <= 3
+
+
+def test_monitor_account_keeps_keys_in_use(
+    iam_client, create_user, no_sleep, sixty_days_later, monkeypatch
+):
+    monkeypatch.setenv("service_access_enabled", "true")
+    create_user("dormant", access_key=True)
+    create_user("key-in-use", access_key=True)
+    stub = ServiceAccessStub(
+        iam_client,
+        {
+            "dormant": sixty_days_later - datetime.timedelta(days=45),
+            "key-in-use": sixty_days_later - datetime.timedelta(days=1),
+        },
+    )
+
+    summary = monitor_account(stub, report_only=False)
+
+    assert summary.inactive == 2
+    assert summary.service_active == 1
+    assert summary.disabled == 2
+    assert key_status(iam_client, "dormant") == "Inactive"
+    assert key_status(iam_client, "key-in-use") == "Active"
+    with pytest.raises(iam_client.exceptions.NoSuchEntityException):
+        iam_client.get_login_profile(UserName="key-in-use")
+
+
+def test_monitor_account_async_leaves_users_with_keys_in_use(
+    iam_client, create_user, no_sleep, sixty_days_later, monkeypatch
+):
+    monkeypatch.setenv("service_access_enabled", "true")
+    monkeypatch.setenv("enabled_rules", "console-inactive,key-unused")
+    monkeypatch.setattr("src.rules.is_inactive", lambda *args, **kwargs: False)
+    # Every key is unused
+    monkeypatch.setattr("src.rules.days_since", lambda now, value: 100)
+    create_user("dormant", console=False, access_key=True)
+    create_user("key-in-use", console=False, access_key=True)
+    stub = ServiceAccessStub(
+        iam_client, {"key-in-use": sixty_days_later - datetime.timedelta(days=1)}
+    )
+
+    summary = asyncio.run(monitor_account_async(stub, report_only=False))
+
+    assert summary.inactive == 1
+    assert summary.service_active == 1
+    assert summary.disabled == 1
+    assert key_status(iam_client, "dormant") == "Inactive"
+    assert key_status(iam_client, "key-in-use") == "Active"
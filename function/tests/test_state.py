@@ -0,0 +1,144 @@
+import calendar
+import datetime
+
+import pytest
+
+from src.account import monitor_account
+from src.classifier import NEVER, Reason, ReportColumns, classify
+from src.state import SqliteStateStore, diff_states
+
+MOCK_INACTIVITY_THRESHOLD = 30
+MOCK_GRACE_PERIOD = 7
+LAST_CHANGED = "2023-01-01T00:00:00+00:00"
+
+
+def at(moment: str) -> int:
+    return calendar.timegm(datetime.datetime.fromisoformat(moment).timetuple())
+
+
+def columns(**last_used: str) -> ReportColumns:
+    report = ReportColumns()
+    for username, moment in last_used.items():
+        report.append(username, "true", moment, LAST_CHANGED)
+
+    return report
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteStateStore(str(tmp_path / "state.db"))
+
+
+def run(store, report, now="2023-08-01T00:00:00"):
+    classification = classify(
+        report, MOCK_INACTIVITY_THRESHOLD, MOCK_GRACE_PERIOD, at(now)
+    )
+    diff = diff_states(
+        report,
+        classification,
+        store.load(),
+        MOCK_INACTIVITY_THRESHOLD,
+        MOCK_GRACE_PERIOD,
+    )
+    store.apply(diff)
+
+    return diff
+
+
+def test_first_run_stores_every_user(store):
+    diff = run(
+        store,
+        columns(
+            active="2023-07-30T00:00:00+00:00", inactive="2023-06-01T00:00:00+00:00"
+        ),
+    )
+
+    assert diff.newly_inactive == ["inactive"]
+    assert store.load() == {
+        "active": (Reason.ACTIVE, at("2023-08-30T00:00:00")),
+        "inactive": (Reason.INACTIVE, at("2023-07-02T00:00:00")),
+    }
+
+
+def test_unchanged_users_arent_written(store):
+    report = columns(
+        active="2023-07-30T00:00:00+00:00", inactive="2023-06-01T00:00:00+00:00"
+    )
+    run(store, report)
+
+    diff = run(store, report, now="2023-08-02T00:00:00")
+
+    assert diff.changed == []
+    assert diff.newly_inactive == []
+
+
+def test_users_crossing_the_threshold_are_newly_inactive(store):
+    report = columns(test="2023-07-02T00:00:00+00:00")
+    assert run(store, report).newly_inactive == []
+
+    diff = run(store, report, now="2023-08-02T00:00:00")
+
+    assert diff.newly_inactive == ["test"]
+    assert store.load() == {"test": (Reason.INACTIVE, at("2023-08-02T00:00:00"))}
+
+
+def test_users_logging_in_again_are_updated(store):
+    run(store, columns(test="2023-06-01T00:00:00+00:00"))
+
+    diff = run(store, columns(test="2023-07-31T00:00:00+00:00"))
+
+    assert diff.changed == [("test", Reason.ACTIVE, at("2023-08-31T00:00:00"))]
+    assert diff.newly_inactive == []
+
+
+def test_removed_users_are_dropped(store):
+    run(
+        store,
+        columns(kept="2023-07-30T00:00:00+00:00", gone="2023-07-30T00:00:00+00:00"),
+    )
+
+    diff = run(store, columns(kept="2023-07-30T00:00:00+00:00"))
+
+    assert diff.removed == ["gone"]
+    assert list(store.load()) == ["kept"]
+
+
+def test_users_who_cant_become_inactive_are_stored_as_never(store):
+    report = ReportColumns()
+    report.append("test", "false", "no_information", LAST_CHANGED)
+
+    run(store, report)
+
+    assert store.load() == {"test": (Reason.NO_PASSWORD, NEVER)}
+
+
+def test_state_is_kept_per_account(tmp_path):
+    path = str(tmp_path / "state.db")
+    report = columns(test="2023-06-01T00:00:00+00:00")
+    run(SqliteStateStore(path, "111111111111"), report)
+
+    diff = run(SqliteStateStore(path, "222222222222"), report)
+
+    assert diff.newly_inactive == ["test"]
+
+
+def test_summary_reports_newly_inactive_users(
+    iam_client, create_console_users, sixty_days_later, monkeypatch, tmp_path
+):
+    monkeypatch.setenv("state_store_path", str(tmp_path / "state.db"))
+    usernames = create_console_users(2)
+
+    first = monitor_account(iam_client, report_only=True)
+    second = monitor_account(iam_client, report_only=True)
+
+    assert sorted(first.newly_inactive or []) == sorted(usernames)
+    assert second.newly_inactive == []
+    assert second.inactive == 2
+
+
+def test_newly_inactive_is_unknown_without_a_state_store(
+    iam_client, create_console_users, sixty_days_later
+):
+    create_console_users(1)
+
+    assert monitor_account(iam_client, report_only=True).newly_inactive is None
@@ -0,0 +1,49 @@
+import calendar
+import datetime
+import random
+
+import pytest
+
+from src.models import field_adapter
+from src.timestamps import decode_timestamp, epoch_seconds
+
+
+def timegm(value: str) -> int:
+    moment = datetime.datetime.fromisoformat(value)
+    return calendar.timegm(moment.replace(tzinfo=None).timetuple())
+
+
+@pytest.mark.parametrize("sentinel", ["N/A", "no_information", "not_supported"])
+def test_sentinels_are_interned(sentinel):
+    # A new string, as the csv module returns for every cell
+    value = "".join(list(sentinel))
+
+    assert decode_timestamp(value) == sentinel
+    assert decode_timestamp(value) is decode_timestamp(sentinel)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_decoders_agree_with_pydantic_and_timegm(seed):
+    rng = random.Random(seed)
+    start = datetime.datetime(2015, 1, 1, tzinfo=datetime.timezone.utc)
+    for _ in range(200):
+        moment = start + datetime.timedelta(seconds=rng.randint(0, 10 * 365 * 86400))
+        value = moment.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+        assert decode_timestamp(value) == field_adapter(
+            "password_last_used"
+        ).validate_python(value)
+        assert epoch_seconds(value) == timegm(value)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2023-06-02T13:45:12.250+00:00",
+        "2023-06-02T13:45:12Z",
+        "2023-06-02T13:45:12+01:00",
+        "2023-06-02 13:45:12+00:00",
+    ],
+)
+def test_epoch_seconds_falls_back_for_other_formats(value):
+    assert epoch_seconds(value) == timegm(value)
@@ -8,7 +8,7 @@ module "function" {
 
   function_name = "${var.name_prefix}-inactive-account-monitor"
   description   = "Disable users that haven't logged in within the maximum allowed time limit"
-  handler       = "src/lambda_handler.handle_event"
+  handler       = var.async_handler ? "src/lambda_handler.handle_event_async" : "src/lambda_handler.handle_event"
   runtime       = "python3.11"
   timeout       = 30
 
@@ -18,13 +18,23 @@ module "function" {
   source_path = [
     {
       path           = "${path.module}/function"
-      patterns       = ["!tests/.*"]
+      patterns       = ["!tests/.*", "!benchmarks/.*"]
       poetry_install = true
     }
   ]
 
   environment_variables = {
-    report_only = var.report_only
+    report_only              = var.report_only
+    organisation_role_arns   = join(",", var.organisation_role_arns)
+    enabled_rules            = join(",", var.enabled_rules)
+    exempt_username_patterns = join(",", var.exempt_username_patterns)
+    exempt_tags              = join(",", var.exempt_tags)
+    results_uri              = var.results_bucket != "" ? "s3://${var.results_bucket}/inactive-account-monitor/" : ""
+    checkpoint_store_uri     = var.results_bucket != "" ? "s3://${var.results_bucket}/inactive-account-monitor-checkpoints/" : ""
+    activity_index_table     = local.activity ? aws_dynamodb_table.activity[0].name : ""
+    service_access_enabled   = var.service_access_enabled
+    profiling_enabled        = var.profiling_enabled
+    profiling_uri            = var.results_bucket != "" ? "s3://${var.results_bucket}/inactive-account-monitor-profiles/" : ""
   }
 
   tags = merge(
@@ -104,11 +114,16 @@ data "aws_iam_policy_document" "lambda" {
     actions = [
       "iam:DeleteLoginProfile",
       "iam:GenerateCredentialReport",
+      "iam:GenerateServiceLastAccessedDetails",
+      "iam:GetAccessKeyLastUsed",
       "iam:GetCredentialReport",
       "iam:GetLoginProfile",
+      "iam:GetServiceLastAccessedDetails",
       "iam:GetUser",
       "iam:ListUsers",
       "iam:ListAccessKeys",
+      "iam:ListMFADevices",
+      "iam:ListUserTags",
       "iam:UpdateAccessKey"
     ]
 
@@ -116,6 +131,93 @@ data "aws_iam_policy_document" "lambda" {
       "*"
     ]
   }
+
+  dynamic "statement" {
+    for_each = length(var.organisation_role_arns) > 0 ? [1] : []
+
+    content {
+      effect = "Allow"
+
+      actions = [
+        "sts:AssumeRole"
+      ]
+
+      resources = var.organisation_role_arns
+    }
+  }
+
+  dynamic "statement" {
+    for_each = local.activity ? [1] : []
+
+    content {
+      effect = "Allow"
+
+      actions = [
+        "dynamodb:BatchWriteItem",
+        "dynamodb:GetItem",
+        "dynamodb:PutItem",
+        "dynamodb:Query",
+        "dynamodb:UpdateItem"
+      ]
+
+      resources = [
+        aws_dynamodb_table.activity[0].arn,
+        "${aws_dynamodb_table.activity[0].arn}/index/*"
+      ]
+    }
+  }
+
+  dynamic "statement" {
+    for_each = var.results_bucket != "" ? [1] : []
+
+    content {
+      effect = "Allow"
+
+      actions = [
+        "s3:PutObject"
+      ]
+
+      resources = [
+        "arn:aws:s3:::${var.results_bucket}/inactive-account-monitor/*",
+        "arn:aws:s3:::${var.results_bucket}/inactive-account-monitor-profiles/*"
+      ]
+    }
+  }
+
+  dynamic "statement" {
+    for_each = var.results_bucket != "" ? [1] : []
+
+    content {
+      effect = "Allow"
+
+      actions = [
+        "s3:DeleteObject",
+        "s3:GetObject",
+        "s3:PutObject"
+      ]
+
+      resources = [
+        "arn:aws:s3:::${var.results_bucket}/inactive-account-monitor-checkpoints/*"
+      ]
+    }
+  }
+
+  # Without it, loading a missing checkpoint is denied rather than not found
+  dynamic "statement" {
+    for_each = var.results_bucket != "" ? [1] : []
+
+    content {
+      effect = "Allow"
+
+      actions = [
+        "s3:ListBucket"
+      ]
+
+      resources = [
+        "arn:aws:s3:::${var.results_bucket}"
+      ]
+    }
+  }
 }
 
 resource "aws_iam_policy" "this" {
@@ -135,3 +237,222 @@ resource "aws_iam_role_policy_attachment" "this" {
   role       = aws_iam_role.this[0].name
   policy_arn = aws_iam_policy.this[0].arn
 }
+
+locals {
+  activity = var.create && var.activity_events
+}
+
+data "aws_region" "current" {}
+
+# Console logins and password changes, recorded in the activity index that
+# the scheduled run reads the users due to be disabled from
+resource "aws_dynamodb_table" "activity" {
+  count = local.activity ? 1 : 0
+
+  name         = "${var.name_prefix}-inactive-account-monitor-activity"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "account"
+  range_key    = "username"
+
+  attribute {
+    name = "account"
+    type = "S"
+  }
+
+  attribute {
+    name = "username"
+    type = "S"
+  }
+
+  attribute {
+    name = "inactive_at"
+    type = "N"
+  }
+
+  global_secondary_index {
+    name            = "inactive_at"
+    hash_key        = "account"
+    range_key       = "inactive_at"
+    projection_type = "ALL"
+  }
+
+  tags = var.tags
+
+  lifecycle {
+    precondition {
+      condition     = !var.async_handler
+      error_message = "The activity index is only read by the threaded handler, set async_handler to false."
+    }
+    precondition {
+      condition     = length(var.organisation_role_arns) == 0
+      error_message = "The activity index only records events in this account, and can't be used with organisation_role_arns."
+    }
+    precondition {
+      condition     = data.aws_region.current.name == "us-east-1"
+      error_message = "IAM and sign-in events are only delivered to EventBridge in us-east-1."
+    }
+  }
+}
+
+resource "aws_sqs_queue" "activity_dead_letter" {
+  count = local.activity ? 1 : 0
+
+  name                      = "${var.name_prefix}-inactive-account-monitor-activity-dead-letter"
+  message_retention_seconds = 1209600
+  sqs_managed_sse_enabled   = true
+
+  tags = var.tags
+}
+
+resource "aws_sqs_queue" "activity" {
+  count = local.activity ? 1 : 0
+
+  name                       = "${var.name_prefix}-inactive-account-monitor-activity"
+  visibility_timeout_seconds = 180
+  sqs_managed_sse_enabled    = true
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.activity_dead_letter[0].arn
+    maxReceiveCount     = 5
+  })
+
+  tags = var.tags
+}
+
+resource "aws_sqs_queue_policy" "activity" {
+  count = local.activity ? 1 : 0
+
+  queue_url = aws_sqs_queue.activity[0].id
+  policy    = data.aws_iam_policy_document.activity_queue[0].json
+}
+
+data "aws_iam_policy_document" "activity_queue" {
+  count = local.activity ? 1 : 0
+
+  statement {
+    effect = "Allow"
+
+    actions = [
+      "sqs:SendMessage"
+    ]
+
+    resources = [
+      aws_sqs_queue.activity[0].arn
+    ]
+
+    principals {
+      type        = "Service"
+      identifiers = ["events.amazonaws.com"]
+    }
+
+    condition {
+      test     = "ArnEquals"
+      variable = "aws:SourceArn"
+      values   = [aws_cloudwatch_event_rule.activity[0].arn]
+    }
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "activity" {
+  count = local.activity ? 1 : 0
+
+  name        = "${var.name_prefix}-inactive-account-monitor-activity"
+  description = "Console logins and password changes of IAM users"
+
+  event_pattern = jsonencode({
+    source      = ["aws.signin", "aws.iam"]
+    detail-type = ["AWS Console Sign In via CloudTrail", "AWS API Call via CloudTrail"]
+    detail = {
+      eventName = ["ConsoleLogin", "CreateLoginProfile", "UpdateLoginProfile", "ChangePassword"]
+    }
+  })
+
+  tags = var.tags
+}
+
+resource "aws_cloudwatch_event_target" "activity" {
+  count = local.activity ? 1 : 0
+
+  rule = aws_cloudwatch_event_rule.activity[0].name
+  arn  = aws_sqs_queue.activity[0].arn
+}
+
+module "activity" {
+  source  = "terraform-aws-modules/lambda/aws"
+  version = "8.1.0"
+
+  create_function = local.activity
+  create_package  = var.create_package && var.activity_events
+  create_role     = local.activity
+
+  function_name = "${var.name_prefix}-inactive-account-monitor-activity"
+  description   = "Record the console logins and password changes of users"
+  handler       = "src/lambda_handler.handle_activity_event"
+  runtime       = "python3.11"
+  timeout       = 30
+
+  attach_policy_json = local.activity
+  policy_json        = local.activity ? data.aws_iam_policy_document.activity[0].json : null
+
+  source_path = [
+    {
+      path           = "${path.module}/function"
+      patterns       = ["!tests/.*", "!benchmarks/.*"]
+      poetry_install = true
+    }
+  ]
+
+  environment_variables = {
+    organisation_role_arns = join(",", var.organisation_role_arns)
+    activity_index_table   = local.activity ? aws_dynamodb_table.activity[0].name : ""
+  }
+
+  tags = merge(
+    var.tags,
+    {
+      Name = "${var.name_prefix}-inactive-account-monitor-activity"
+    }
+  )
+}
+
+resource "aws_lambda_event_source_mapping" "activity" {
+  count = local.activity ? 1 : 0
+
+  event_source_arn                   = aws_sqs_queue.activity[0].arn
+  function_name                      = module.activity.lambda_function_arn
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 60
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
+data "aws_iam_policy_document" "activity" {
+  count = local.activity ? 1 : 0
+
+  statement {
+    effect = "Allow"
+
+    actions = [
+      "dynamodb:GetItem",
+      "dynamodb:PutItem"
+    ]
+
+    resources = [
+      aws_dynamodb_table.activity[0].arn
+    ]
+  }
+
+  statement {
+    effect = "Allow"
+
+    actions = [
+      "sqs:ChangeMessageVisibility",
+      "sqs:DeleteMessage",
+      "sqs:GetQueueAttributes",
+      "sqs:ReceiveMessage"
+    ]
+
+    resources = [
+      aws_sqs_queue.activity[0].arn
+    ]
+  }
+}
@@ -1,3 +1,15 @@
+variable "activity_events" {
+  default     = false
+  description = "Record console logins and password changes from CloudTrail in an activity index, through EventBridge and SQS, so the scheduled run reads the users due to be disabled from the index and only generates a credential report weekly to reconcile it. Requires a CloudTrail trail and deploying to us-east-1, the only region IAM and sign-in events are delivered to EventBridge in, and can't be used with organisation_role_arns."
+  type        = bool
+}
+
+variable "async_handler" {
+  default     = false
+  description = "Use the asyncio entry point, which starts remediating users while the credential report is still being classified. Checkpoints and the activity index aren't supported with it."
+  type        = bool
+}
+
 variable "create" {
   default     = true
   description = "Controls whether resources should be created."
@@ -10,24 +22,66 @@ variable "create_package" {
   default     = true
 }
 
+variable "enabled_rules" {
+  default     = ["console-inactive"]
+  description = "Rules to evaluate against every user: console-inactive, key-unused, key-unrotated and mfa-missing. Users matching console-inactive or key-unused are disabled, the other rules are only reported."
+  type        = list(string)
+}
+
+variable "exempt_tags" {
+  default     = []
+  description = "IAM user tags, as key or key=value, exempting users from being disabled, e.g. break-glass users."
+  type        = list(string)
+}
+
+variable "exempt_username_patterns" {
+  default     = []
+  description = "Username glob patterns, e.g. breakglass-*, exempting users from being disabled."
+  type        = list(string)
+}
+
 variable "name_prefix" {
   default     = ""
   description = "Prefix to apply to all resource names."
   type        = string
 }
 
+variable "organisation_role_arns" {
+  default     = []
+  description = "Roles to assume in other accounts so that their users are monitored from this function. When empty only this account is monitored."
+  type        = list(string)
+}
+
+variable "profiling_enabled" {
+  default     = false
+  description = "Profile every run with cProfile and tracemalloc, writing the artefacts under inactive-account-monitor-profiles/ in the results bucket, or /tmp/profiles. Single invocations can be profiled with \"profile\": true in their event."
+  type        = bool
+}
+
 variable "report_only" {
   default     = "false"
   description = "Run the lambda without taking any actions, i.e. only report what would happen"
   type        = string
 }
 
+variable "results_bucket" {
+  default     = ""
+  description = "S3 bucket to write each run's per-user results to, as JSON Lines under inactive-account-monitor/, and to checkpoint remediation progress to under inactive-account-monitor-checkpoints/, so a run stopped before the timeout is resumed. When empty neither is written."
+  type        = string
+}
+
 variable "schedule" {
   default     = "rate(24 hours)"
   description = "Defines how frequently the users are checked."
   type        = string
 }
 
+variable "service_access_enabled" {
+  default     = false
+  description = "Before deactivating a user's access keys, check when they last accessed any service with IAM service last accessed jobs, and keep the keys of users who did within the inactivity threshold."
+  type        = bool
+}
+
 variable "tags" {
   description = "A map of tags to assign to resources."
   type        = map(string)